@@ -0,0 +1,51 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+from cvisiontool.core.batch import BatchRunner, load_action_chain
+
+
+def create_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='cvisiontool batch',
+        description='Replay a saved action chain over every image of a directory tree')
+    parser.add_argument('chain', help='JSON file with an array of actions')
+    parser.add_argument('input_dir', help='directory with source images')
+    parser.add_argument('output_dir', help='directory for results and manifest.jsonl')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--ext', default=None,
+                        help='extension of output files, e.g. ".png" (default: keep source)')
+    parser.add_argument('--no-optimize', action='store_true',
+                        help='run actions exactly as recorded, without fusing steps')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = create_arg_parser().parse_args(argv)
+    actions = load_action_chain(args.chain)
+    runner = BatchRunner(actions, workers=args.workers, optimize=not args.no_optimize,
+                         output_ext=args.ext)
+    report = runner.run(args.input_dir, args.output_dir)
+    print(f'processed: {report.processed}, skipped: {report.skipped}, failed: {report.failed}')
+    return 0 if report.failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import sys
+from typing import List, Optional
+
+from cvisiontool.core.benchmark import BenchmarkRunner, BenchmarkResult, create_cases, \
+    save_results, load_results, compare_results, measure_headless_startup, DEFAULT_MEGAPIXELS, \
+    DEFAULT_ANCHORS, HEADLESS_STARTUP_BUDGET_SEC, STARTUP_CASE_NAME
+
+
+def create_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='cvisiontool benchmark',
+        description='Measure every action strategy on synthetic images and compare the '
+                    'results with a baseline')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='JSON file for results (default: benchmark.json)')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='JSON file with results of a previous run to compare with')
+    parser.add_argument('--megapixels', type=float, nargs='+', default=list(DEFAULT_MEGAPIXELS),
+                        help='sizes of synthetic images')
+    parser.add_argument('--anchors', type=int, nargs='+', default=list(DEFAULT_ANCHORS),
+                        help='anchors of morphological kernels (kernel size = 2*anchor+1)')
+    parser.add_argument('-k', '--filter', default=None,
+                        help='run only cases whose name contains this substring')
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='measured runs per case, the median is compared (default: 3)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown as a fraction of the baseline (default: 0.2)')
+    parser.add_argument('--min-delta', type=float, default=0.002,
+                        help='slowdowns below this number of seconds are ignored '
+                             '(default: 0.002)')
+    parser.add_argument('--startup-budget', type=float, default=HEADLESS_STARTUP_BUDGET_SEC,
+                        help='allowed cold start of a headless worker in seconds '
+                             f'(default: {HEADLESS_STARTUP_BUDGET_SEC})')
+    return parser
+
+
+def print_result(result: BenchmarkResult):
+    print(f'{result.name:<50} median {result.median_sec * 1000:10.2f} ms, '
+          f'min {result.min_sec * 1000:10.2f} ms', flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = create_arg_parser().parse_args(argv)
+    cases = create_cases(args.megapixels, args.anchors)
+    if args.filter is not None:
+        cases = [case for case in cases if args.filter in case.name]
+    results = BenchmarkRunner(repeats=args.repeats, progress=print_result).run(cases)
+    is_startup_ok = True
+    if args.filter is None or args.filter in STARTUP_CASE_NAME:
+        startup = measure_headless_startup(max(args.repeats, 3))
+        results.append(startup.to_result(max(args.repeats, 3)))
+        print_result(results[-1])
+        if len(startup.gui_modules) > 0:
+            print(f'headless modules import Qt: {", ".join(startup.gui_modules)}')
+            is_startup_ok = False
+        if startup.median_sec > args.startup_budget:
+            print(f'headless startup is over the budget of {args.startup_budget} s')
+            is_startup_ok = False
+    save_results(args.output, results)
+    if args.baseline is None:
+        return 0 if is_startup_ok else 1
+
+    comparison = compare_results(results, load_results(args.baseline), args.threshold,
+                                 args.min_delta)
+    for change in comparison.improvements:
+        print(f'improved:  {change.name}: {change.baseline_sec * 1000:.2f} ms -> '
+              f'{change.current_sec * 1000:.2f} ms ({change.get_ratio():.2f}x)')
+    for change in comparison.regressions:
+        print(f'REGRESSED: {change.name}: {change.baseline_sec * 1000:.2f} ms -> '
+              f'{change.current_sec * 1000:.2f} ms ({change.get_ratio():.2f}x)')
+    if len(comparison.added) > 0:
+        print(f'not in baseline: {len(comparison.added)} case(s)')
+    print(f'regressions: {len(comparison.regressions)}, '
+          f'improvements: {len(comparison.improvements)}')
+    return 1 if comparison.has_regressions() or not is_startup_ok else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
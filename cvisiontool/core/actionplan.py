@@ -0,0 +1,157 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import Action, ActionType, ActionFactory
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    action: Action
+    origin: Tuple[Action, ...]
+    rule: Optional[str] = None
+
+    def is_fused(self) -> bool:
+        return self.rule is not None
+
+
+@dataclass(frozen=True)
+class DroppedAction:
+    action: Action
+    rule: str
+
+
+@dataclass(frozen=True)
+class ActionPlan:
+    steps: Tuple[PlanStep, ...]
+    dropped: Tuple[DroppedAction, ...]
+
+    def get_actions(self) -> List[Action]:
+        return [step.action for step in self.steps]
+
+    def explain(self) -> str:
+        source_count = sum(len(step.origin) for step in self.steps) + len(self.dropped)
+        lines = [f'Plan: {source_count} action(s) -> {len(self.steps)} step(s)']
+        for i, step in enumerate(self.steps):
+            lines.append(f'{i + 1}. {step.action.to_string()}')
+            if step.is_fused():
+                lines.append(f'   fused by "{step.rule}" from:')
+                for action in step.origin:
+                    lines.append(f'     - {action.to_string()}')
+        for dropped in self.dropped:
+            lines.append(f'dropped by "{dropped.rule}": {dropped.action.to_string()}')
+        return '\n'.join(lines)
+
+
+class ActionChainOptimizer:
+    """
+        The optimizer rewrites a chain of actions into an equivalent plan with fewer steps.
+        Every rule produces exactly the same result as the original chain under OpenCV's
+        default border handling:
+            - noop: erosion, dilation, opening and closing with anchor = 0 are dropped
+            - merge_rect_erosions / merge_rect_dilations: consecutive rect erosions
+              (dilations) are merged into one with anchor = sum of anchors
+            - erode_dilate_to_opening / dilate_erode_to_closing: erosion followed by
+              dilation (and vice versa) with the same kernel becomes opening (closing)
+            - idempotent_opening / idempotent_closing: repeated opening (closing) with
+              the same kernel is applied once
+        Rules are applied until no rule matches.
+    """
+
+    __NOOP_TYPES = (ActionType.EROSION, ActionType.DILATION,
+                    ActionType.MORPH_OPENING, ActionType.MORPH_CLOSING)
+    __MORPH_TYPES = __NOOP_TYPES + (ActionType.MORPH_GRADIENT,)
+
+    def __init__(self, action_processor: Optional[ActionProcessor] = None):
+        self.__action_processor = action_processor if action_processor is not None \
+            else ActionProcessor()
+
+    def optimize(self, actions: List[Action]) -> ActionPlan:
+        steps = [PlanStep(action, (action,)) for action in actions]
+        dropped: List[DroppedAction] = []
+        is_changed = True
+        while is_changed:
+            is_changed = False
+            rewritten: List[PlanStep] = []
+            for step in steps:
+                if self.__is_noop(step.action):
+                    dropped.extend(DroppedAction(a, 'noop') for a in step.origin)
+                    is_changed = True
+                    continue
+                if len(rewritten) > 0:
+                    fused = self.__fuse(rewritten[-1], step)
+                    if fused is not None:
+                        rewritten[-1] = fused
+                        is_changed = True
+                        continue
+                rewritten.append(step)
+            steps = rewritten
+        return ActionPlan(tuple(steps), tuple(dropped))
+
+    def process(self, actions: List[Action], mat_bgr: np.ndarray) -> np.ndarray:
+        return self.execute(self.optimize(actions), mat_bgr)
+
+    def execute(self, plan: ActionPlan, mat_bgr: np.ndarray) -> np.ndarray:
+        result = mat_bgr
+        for step in plan.steps:
+            result = self.__action_processor.process(step.action, result)
+        return result
+
+    def __is_noop(self, action: Action) -> bool:
+        return action.action_type in self.__NOOP_TYPES and action.params.get('anchor') == 0
+
+    def __fuse(self, prev: PlanStep, current: PlanStep) -> Optional[PlanStep]:
+        prev_action, action = prev.action, current.action
+        if prev_action.action_type not in self.__MORPH_TYPES \
+                or action.action_type not in self.__MORPH_TYPES:
+            return None
+        shape, anchor = prev_action.params.get('shape'), prev_action.params.get('anchor')
+        next_shape, next_anchor = action.params.get('shape'), action.params.get('anchor')
+        if None in (shape, anchor, next_shape, next_anchor):
+            return None
+        origin = prev.origin + current.origin
+        types = (prev_action.action_type, action.action_type)
+        if shape == cv.MORPH_RECT and next_shape == cv.MORPH_RECT:
+            merged_anchor = anchor + next_anchor
+            if types == (ActionType.EROSION, ActionType.EROSION):
+                return PlanStep(ActionFactory.create_erosion_action(shape, merged_anchor),
+                                origin, self.__join_rules(prev, 'merge_rect_erosions'))
+            if types == (ActionType.DILATION, ActionType.DILATION):
+                return PlanStep(ActionFactory.create_dilation_action(shape, merged_anchor),
+                                origin, self.__join_rules(prev, 'merge_rect_dilations'))
+
+        if next_shape != shape or next_anchor != anchor:
+            return None
+        if types == (ActionType.EROSION, ActionType.DILATION):
+            return PlanStep(ActionFactory.create_morph_opening_action(shape, anchor),
+                            origin, self.__join_rules(prev, 'erode_dilate_to_opening'))
+        if types == (ActionType.DILATION, ActionType.EROSION):
+            return PlanStep(ActionFactory.create_morph_closing_action(shape, anchor),
+                            origin, self.__join_rules(prev, 'dilate_erode_to_closing'))
+        if types == (ActionType.MORPH_OPENING, ActionType.MORPH_OPENING):
+            return PlanStep(prev_action, origin, self.__join_rules(prev, 'idempotent_opening'))
+        if types == (ActionType.MORPH_CLOSING, ActionType.MORPH_CLOSING):
+            return PlanStep(prev_action, origin, self.__join_rules(prev, 'idempotent_closing'))
+        return None
+
+    @staticmethod
+    def __join_rules(prev: PlanStep, rule: str) -> str:
+        return f'{prev.rule} + {rule}' if prev.is_fused() else rule
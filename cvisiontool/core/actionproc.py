@@ -15,36 +15,196 @@
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import json
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Callable, NamedTuple, Tuple, List
 
 import numpy as np
 import cv2.cv2 as cv
 
 from cvisiontool.core.actions import ActionType, Action
+from cvisiontool.core.bufferpool import BufferPool
+from cvisiontool.core.components import ConnectedComponents, label_components
+from cvisiontool.core.contours import find_contours, compute_contour_features
+from cvisiontool.core.morphology import MorphologyEngine
+from cvisiontool.core.planes import DerivedPlaneCache
+from cvisiontool.core.resultcache import ActionResultCache
+from cvisiontool.core.tracing import get_tracer
 
 
 class ActionProcessor:
-    def __init__(self):
+    def __init__(self, cache: Optional[ActionResultCache] = None,
+                 planes: Optional[DerivedPlaneCache] = None):
+        self.__cache = cache
+        self.__planes = planes if planes is not None else DerivedPlaneCache()
+        morphological_strategy = MorphologicalExActionStrategy()
         self.__processors: Dict[ActionType, AbstractActionStrategy] = {
-            ActionType.EROSION: MorphologicalExActionStrategy(),
-            ActionType.DILATION: MorphologicalExActionStrategy(),
-            ActionType.MORPH_GRADIENT: MorphologicalExActionStrategy(),
-            ActionType.MORPH_OPENING: MorphologicalExActionStrategy(),
-            ActionType.MORPH_CLOSING: MorphologicalExActionStrategy(),
-            ActionType.IN_RANGE: InRangeActionStrategy(),
-            ActionType.HOUGH_CIRCLE: HoughCircleStrategy()
+            ActionType.EROSION: morphological_strategy,
+            ActionType.DILATION: morphological_strategy,
+            ActionType.MORPH_GRADIENT: morphological_strategy,
+            ActionType.MORPH_OPENING: morphological_strategy,
+            ActionType.MORPH_CLOSING: morphological_strategy,
+            ActionType.IN_RANGE: InRangeActionStrategy(self.__planes),
+            ActionType.HOUGH_CIRCLE: HoughCircleStrategy(self.__planes),
+            ActionType.FIND_CONTOURS: FindContoursStrategy(self.__planes),
+            ActionType.CONNECTED_COMPONENTS: ConnectedComponentsStrategy(self.__planes)
         }
 
     def process(self, action: Action, mat_bgr: np.ndarray) -> np.ndarray:
         if action.action_type in self.__processors.keys():
-            return self.__processors[action.action_type].process(action, mat_bgr)
+            if self.__cache is None:
+                with get_tracer().span('process', 'action', action=action, mat=mat_bgr):
+                    return self.__processors[action.action_type].process(action, mat_bgr)
+            result = self.__cache.get(action, mat_bgr)
+            if result is None:
+                with get_tracer().span('process', 'action', action=action, mat=mat_bgr):
+                    result = self.__processors[action.action_type].process(action, mat_bgr)
+                result = self.__cache.put(action, mat_bgr, result)
+            return result
         else:
             raise ValueError(f'Unknown action: {action.to_string()}')
 
+    def compile(self, action: Action) -> 'CompiledAction':
+        """
+            Validates the action and prepares everything that does not depend on a mat.
+            Compiled actions bypass the result cache and tracing, they are meant for running
+            the same action over a stream of mats, e.g. video frames or tiles.
+        """
+        if action.action_type in self.__processors.keys():
+            return self.__processors[action.action_type].compile(action)
+        raise ValueError(f'Unknown action: {action.to_string()}')
+
+    def get_cache(self) -> Optional[ActionResultCache]:
+        return self.__cache
+
+    def get_planes(self) -> DerivedPlaneCache:
+        return self.__planes
+
+
+OutputSpec = Tuple[Tuple[int, ...], np.dtype]
+
+
+def _same_as_source(mat: np.ndarray) -> OutputSpec:
+    return mat.shape, mat.dtype
+
+
+def _mask_of_source(mat: np.ndarray) -> OutputSpec:
+    return mat.shape[:2], np.dtype(np.uint8)
+
+
+def _bgr_of_source(mat: np.ndarray) -> OutputSpec:
+    return mat.shape[:2] + (3,), mat.dtype
+
+
+def _colors_of_source(mat: np.ndarray) -> OutputSpec:
+    return mat.shape[:2] + (3,), np.dtype(np.uint8)
+
+
+def _copy_as_bgr(mat: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    if mat.ndim == 2:
+        return cv.cvtColor(mat, cv.COLOR_GRAY2BGR, dst=dst)
+    if dst is None:
+        return np.copy(mat)
+    np.copyto(dst, mat)
+    return dst
+
+
+class CompiledAction:
+    """
+        The action prepared by a strategy: validated params and a function of a mat, which
+        has OpenCV constants, boundaries and structuring elements bound to it already.
+        The result is written into 'dst' when it is provided, its shape and dtype must be
+        the ones returned by 'get_output_spec' for the source mat.
+    """
+    __slots__ = ('__action', '__params', '__function', '__output_spec')
+
+    def __init__(self, action: Action, params: NamedTuple,
+                 function: Callable[..., np.ndarray],
+                 output_spec: Callable[[np.ndarray], OutputSpec]):
+        self.__action = action
+        self.__params = params
+        self.__function = function
+        self.__output_spec = output_spec
+
+    def __call__(self, mat_bgr: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.__function(mat_bgr, dst=dst)
+
+    def get_output_spec(self, mat_bgr: np.ndarray) -> OutputSpec:
+        return self.__output_spec(mat_bgr)
+
+    @property
+    def action(self) -> Action:
+        return self.__action
+
+    @property
+    def params(self) -> NamedTuple:
+        return self.__params
+
+
+class MorphologyParams(NamedTuple):
+    morph_type: int
+    shape: int
+    anchor: int
+
+
+class InRangeParams(NamedTuple):
+    plane: str
+    lower_boundary: np.ndarray
+    upper_boundary: np.ndarray
+
+
+class HoughCircleParams(NamedTuple):
+    method: int
+    dp: float
+    min_dist: float
+    param1: float
+    param2: float
+    min_radius: int
+    max_radius: int
+
+
+class FindContoursParams(NamedTuple):
+    mode: int
+    method: int
+
+
+class ConnectedComponentsParams(NamedTuple):
+    connectivity: int
+    min_area: int
+    max_area: Optional[int]
+    min_aspect_ratio: Optional[float]
+    max_aspect_ratio: Optional[float]
+    bbox: Optional[Tuple[int, int, int, int]]
+
+
+def run_compiled_chain(compiled_actions: List[CompiledAction], mat_bgr: np.ndarray,
+                       pool: BufferPool, pooled_result: bool = True) -> np.ndarray:
+    """
+        Runs compiled actions one after another writing outputs into buffers of the pool.
+        Every input, 'mat_bgr' included, is released to the pool once the next output is
+        ready, so outputs of a chain over same-sized mats are not allocated after the first
+        run. Morphology then runs without allocations at all, other strategies still
+        allocate their working data per mat (derived color planes, contours, label images).
+        The result is leased from the pool unless 'pooled_result' is False, then the last
+        action allocates it.
+    """
+    for index, compiled_action in enumerate(compiled_actions):
+        is_last = index == len(compiled_actions) - 1
+        dst = None if is_last and not pooled_result \
+            else pool.acquire(*compiled_action.get_output_spec(mat_bgr))
+        result = compiled_action(mat_bgr, dst)
+        if dst is not None and result is not dst:
+            pool.release(dst)
+        pool.release(mat_bgr)
+        mat_bgr = result
+    return mat_bgr
+
 
 class AbstractActionStrategy(ABC):
+    def process(self, action: Action, mat_bgr: np.ndarray,
+                dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.compile(action)(mat_bgr, dst)
+
     @abstractmethod
-    def process(self, action: Action, mat_bgr: np.ndarray) -> np.ndarray:
+    def compile(self, action: Action) -> CompiledAction:
         pass
 
     def _extract_param(self, action: Action, name: str) -> Any:
@@ -62,39 +222,34 @@ class MorphologicalExActionStrategy(AbstractActionStrategy):
             - anchor: int
             - shape: int
                 * see supported values in 'self.__supported_shapes'
+        Structuring elements are cached by the morphology engine.
     """
 
-    def __init__(self):
+    def __init__(self, engine: Optional[MorphologyEngine] = None):
+        self.__engine = engine if engine is not None else MorphologyEngine()
         self.__supported_shapes = {
             cv.MORPH_RECT: 'Rect',
             cv.MORPH_CROSS: 'Cross',
             cv.MORPH_ELLIPSE: 'Ellipse'
         }
+        self.__morph_types = {
+            ActionType.EROSION: cv.MORPH_ERODE,
+            ActionType.DILATION: cv.MORPH_DILATE,
+            ActionType.MORPH_GRADIENT: cv.MORPH_GRADIENT,
+            ActionType.MORPH_OPENING: cv.MORPH_OPEN,
+            ActionType.MORPH_CLOSING: cv.MORPH_CLOSE
+        }
 
-    def process(self, action: Action, mat_bgr: np.ndarray) -> np.ndarray:
+    def compile(self, action: Action) -> CompiledAction:
         anchor = self._extract_param(action, 'anchor')
         shape = self._extract_param(action, 'shape')
-        if action.action_type == ActionType.EROSION:
-            morph_type = cv.MORPH_ERODE
-        elif action.action_type == ActionType.DILATION:
-            morph_type = cv.MORPH_DILATE
-        elif action.action_type == ActionType.MORPH_GRADIENT:
-            morph_type = cv.MORPH_GRADIENT
-        elif action.action_type == ActionType.MORPH_OPENING:
-            morph_type = cv.MORPH_OPEN
-        elif action.action_type == ActionType.MORPH_CLOSING:
-            morph_type = cv.MORPH_CLOSE
-        else:
+        if action.action_type not in self.__morph_types.keys():
             raise ValueError(f'Current strategy does not support action: {action.to_string()}')
-
         if shape not in self.__supported_shapes.keys():
             raise ValueError(
                 f'"shape" param must have one value of: {json.dumps(self.__supported_shapes)}')
-        ksize = 2 * anchor + 1
-        element = cv.getStructuringElement(shape,
-                                           (ksize, ksize),
-                                           (anchor, anchor))
-        return cv.morphologyEx(mat_bgr, morph_type, element)
+        params = MorphologyParams(self.__morph_types[action.action_type], shape, anchor)
+        return CompiledAction(action, params, self.__engine.prepare(*params), _same_as_source)
 
 
 class InRangeActionStrategy(AbstractActionStrategy):
@@ -107,14 +262,17 @@ class InRangeActionStrategy(AbstractActionStrategy):
             * list must contain exactly 3 elements
         - upper_boundary: List[int]
             * list must contain exactly 3 elements
+        Converted mats are taken from the derived plane cache.
     """
 
-    def __init__(self):
+    def __init__(self, planes: Optional[DerivedPlaneCache] = None):
+        self.__planes = planes if planes is not None else DerivedPlaneCache()
         self.__supported_color_spaces = {
-            'hsv': cv.COLOR_BGR2HSV
+            'hsv': DerivedPlaneCache.HSV,
+            'lab': DerivedPlaneCache.LAB
         }
 
-    def process(self, action: Action, mat_bgr: np.ndarray) -> np.ndarray:
+    def compile(self, action: Action) -> CompiledAction:
         color_space = self._extract_param(action, 'color_space')
         if color_space not in self.__supported_color_spaces.keys():
             raise ValueError(f'Provided color space = {color_space} is not supported')
@@ -127,26 +285,174 @@ class InRangeActionStrategy(AbstractActionStrategy):
             raise ValueError(
                 f'"upper_boundary" must be array with 3 int values. Provided value: {upper_boundary}')
 
-        mat = cv.cvtColor(mat_bgr, self.__supported_color_spaces[color_space])
-        return cv.inRange(mat, np.array(lower_boundary), np.array(upper_boundary))
+        params = InRangeParams(self.__supported_color_spaces[color_space],
+                               np.array(lower_boundary), np.array(upper_boundary))
+        params.lower_boundary.setflags(write=False)
+        params.upper_boundary.setflags(write=False)
+        get_plane = self.__planes.get
+        plane, lower, upper = params
+
+        def in_range(mat_bgr: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+            return cv.inRange(get_plane(mat_bgr, plane), lower, upper, dst=dst)
+
+        return CompiledAction(action, params, in_range, _mask_of_source)
 
 
 class HoughCircleStrategy(AbstractActionStrategy):
-    def process(self, action: Action, mat_bgr: np.ndarray) -> np.ndarray:
-        detected_circles: np.ndarray = cv.HoughCircles(mat_bgr,
-                                                       method=action.params['method'],
-                                                       dp=action.params['dp'],
-                                                       minDist=action.params['min_dist'],
-                                                       param1=action.params['param1'],
-                                                       param2=action.params['param2'],
-                                                       minRadius=action.params['min_radius'],
-                                                       maxRadius=action.params['max_radius'])
-        res_img = np.copy(mat_bgr)
-        if detected_circles is not None:
-            circles = np.round(detected_circles[0, :]).astype("int")
-            if len(circles) > 0:
-                res_img = cv.cvtColor(res_img, cv.COLOR_GRAY2BGR)
-            for (x, y, r) in circles:
-                cv.circle(res_img, (x, y), r, (0, 255, 255), 2)  # yellow in BGR
+    """
+        The strategy detects circles on grayscale plane of provided mat and draws them.
+        The result is always BGR, so its shape doesn't depend on whether circles were found.
+    """
+
+    def __init__(self, planes: Optional[DerivedPlaneCache] = None):
+        self.__planes = planes if planes is not None else DerivedPlaneCache()
+
+    def compile(self, action: Action) -> CompiledAction:
+        params = HoughCircleParams(*(self._extract_param(action, name)
+                                     for name in HoughCircleParams._fields))
+        get_gray = self.__planes.get_gray
+        method, dp, min_dist, param1, param2, min_radius, max_radius = params
+
+        def detect_and_draw(mat_bgr: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+            detected_circles = cv.HoughCircles(get_gray(mat_bgr), method=method, dp=dp,
+                                               minDist=min_dist, param1=param1, param2=param2,
+                                               minRadius=min_radius, maxRadius=max_radius)
+            return HoughCircleStrategy.__draw(mat_bgr, detected_circles, dst)
+
+        return CompiledAction(action, params, detect_and_draw, _bgr_of_source)
+
+    @staticmethod
+    def __draw(mat_bgr: np.ndarray, detected_circles: Optional[np.ndarray],
+               dst: Optional[np.ndarray]) -> np.ndarray:
+        circles = np.round(detected_circles[0, :]).astype("int") \
+            if detected_circles is not None else []
+        res_img = _copy_as_bgr(mat_bgr, dst)
+        for (x, y, r) in circles:
+            cv.circle(res_img, (x, y), r, (0, 255, 255), 2)  # yellow in BGR
 
         return res_img
+
+    @staticmethod
+    def detect_circles(mat_gray: np.ndarray, params: Dict[str, Any]) -> Optional[np.ndarray]:
+        return cv.HoughCircles(mat_gray,
+                               method=params['method'],
+                               dp=params['dp'],
+                               minDist=params['min_dist'],
+                               param1=params['param1'],
+                               param2=params['param2'],
+                               minRadius=params['min_radius'],
+                               maxRadius=params['max_radius'])
+
+
+class FindContoursStrategy(AbstractActionStrategy):
+    """
+        The strategy finds contours of non-zero pixels and draws them.
+        Action must contain following params:
+            - mode: int
+                * contour retrieval mode, see 'self.__supported_modes'
+            - method: int
+                * contour approximation method, see 'self.__supported_methods'
+        BGR mats are converted to grayscale first. Features of contours are returned by
+        'analyze' as a record array, see 'compute_contour_features'.
+    """
+
+    def __init__(self, planes: Optional[DerivedPlaneCache] = None):
+        self.__planes = planes if planes is not None else DerivedPlaneCache()
+        self.__supported_modes = {
+            cv.RETR_EXTERNAL: 'RETR_EXTERNAL',
+            cv.RETR_LIST: 'RETR_LIST',
+            cv.RETR_CCOMP: 'RETR_CCOMP',
+            cv.RETR_TREE: 'RETR_TREE',
+            cv.RETR_FLOODFILL: 'RETR_FLOODFILL'
+        }
+        self.__supported_methods = {
+            cv.CHAIN_APPROX_NONE: 'CHAIN_APPROX_NONE',
+            cv.CHAIN_APPROX_SIMPLE: 'CHAIN_APPROX_SIMPLE',
+            cv.CHAIN_APPROX_TC89_L1: 'CHAIN_APPROX_TC89_L1',
+            cv.CHAIN_APPROX_TC89_KCOS: 'CHAIN_APPROX_TC89_KCOS'
+        }
+
+    def compile(self, action: Action) -> CompiledAction:
+        params = self.__validate(action)
+        get_gray = self.__planes.get_gray
+        mode, method = params
+
+        def find_and_draw(mat_bgr: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+            contours, _ = find_contours(get_gray(mat_bgr), mode, method)
+            res_img = _copy_as_bgr(mat_bgr, dst)
+            cv.drawContours(res_img, contours, -1, (0, 255, 0), 1)
+            return res_img
+
+        return CompiledAction(action, params, find_and_draw, _bgr_of_source)
+
+    def analyze(self, action: Action, mat_bgr: np.ndarray) -> np.recarray:
+        mode, method = self.__validate(action)
+        return compute_contour_features(
+            *find_contours(self.__planes.get_gray(mat_bgr), mode, method))
+
+    def __validate(self, action: Action) -> FindContoursParams:
+        mode = self._extract_param(action, 'mode')
+        if mode not in self.__supported_modes.keys():
+            raise ValueError(
+                f'"mode" param must have one value of: {json.dumps(self.__supported_modes)}')
+        method = self._extract_param(action, 'method')
+        if method not in self.__supported_methods.keys():
+            raise ValueError(
+                f'"method" param must have one value of: {json.dumps(self.__supported_methods)}')
+        return FindContoursParams(mode, method)
+
+
+class ConnectedComponentsStrategy(AbstractActionStrategy):
+    """
+        The strategy labels connected components of non-zero pixels, filters them and
+        draws kept components with distinct colors.
+        Action must contain following params:
+            - connectivity: int
+                * 4 or 8
+        Optional params, None means no limit:
+            - min_area: int
+            - max_area: int
+            - min_aspect_ratio: float
+            - max_aspect_ratio: float
+            - bbox: List[int]
+                * [x, y, width, height], only components inside it are kept
+        BGR mats are converted to grayscale first. Label image and stats table of kept
+        components are returned by 'analyze'.
+    """
+
+    def __init__(self, planes: Optional[DerivedPlaneCache] = None):
+        self.__planes = planes if planes is not None else DerivedPlaneCache()
+
+    def compile(self, action: Action) -> CompiledAction:
+        params = self.__validate(action)
+        return CompiledAction(action, params,
+                              lambda mat_bgr, dst=None:
+                              self.__analyze(params, mat_bgr).colorize(dst),
+                              _colors_of_source)
+
+    def analyze(self, action: Action, mat_bgr: np.ndarray) -> ConnectedComponents:
+        return self.__analyze(self.__validate(action), mat_bgr)
+
+    def __analyze(self, params: ConnectedComponentsParams,
+                  mat_bgr: np.ndarray) -> ConnectedComponents:
+        components = label_components(self.__planes.get_gray(mat_bgr), params.connectivity)
+        return components.filter(min_area=params.min_area,
+                                 max_area=params.max_area,
+                                 min_aspect_ratio=params.min_aspect_ratio,
+                                 max_aspect_ratio=params.max_aspect_ratio,
+                                 bbox=params.bbox)
+
+    def __validate(self, action: Action) -> ConnectedComponentsParams:
+        connectivity = self._extract_param(action, 'connectivity')
+        if connectivity not in (4, 8):
+            raise ValueError(f'"connectivity" must be 4 or 8. Provided value: {connectivity}')
+        bbox = action.params.get('bbox')
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError(
+                f'"bbox" must be array with 4 int values. Provided value: {bbox}')
+        return ConnectedComponentsParams(connectivity=connectivity,
+                                         min_area=action.params.get('min_area') or 0,
+                                         max_area=action.params.get('max_area'),
+                                         min_aspect_ratio=action.params.get('min_aspect_ratio'),
+                                         max_aspect_ratio=action.params.get('max_aspect_ratio'),
+                                         bbox=tuple(bbox) if bbox is not None else None)
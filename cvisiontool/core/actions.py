@@ -17,7 +17,7 @@ import json
 from abc import ABC
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 
 class ActionType(Enum):
@@ -29,6 +29,8 @@ class ActionType(Enum):
     MORPH_CLOSING = 'morphological_closing'
     IN_RANGE = 'in_range'
     HOUGH_CIRCLE = 'hough_circle'
+    FIND_CONTOURS = 'find_contours'
+    CONNECTED_COMPONENTS = 'connected_components'
 
 
 @dataclass(frozen=True)
@@ -45,6 +47,12 @@ class Action:
             'params': self.params
         }
 
+    @staticmethod
+    def from_json(value: Dict[str, Any]) -> 'Action':
+        if 'action_type' not in value.keys():
+            raise ValueError(f'Action JSON does not contain "action_type": {json.dumps(value)}')
+        return Action(ActionType(value['action_type']), dict(value.get('params', {})))
+
 
 class ActionFactory(ABC):
     @staticmethod
@@ -109,3 +117,25 @@ class ActionFactory(ABC):
             'min_radius': min_radius,
             'max_radius': max_radius
         })
+
+    @staticmethod
+    def create_find_contours_action(mode: int, method: int) -> Action:
+        return Action(ActionType.FIND_CONTOURS, {
+            'mode': mode,
+            'method': method
+        })
+
+    @staticmethod
+    def create_connected_components_action(connectivity: int = 8, min_area: int = 0,
+                                           max_area: Optional[int] = None,
+                                           min_aspect_ratio: Optional[float] = None,
+                                           max_aspect_ratio: Optional[float] = None,
+                                           bbox: Optional[List[int]] = None) -> Action:
+        return Action(ActionType.CONNECTED_COMPONENTS, {
+            'connectivity': connectivity,
+            'min_area': min_area,
+            'max_area': max_area,
+            'min_aspect_ratio': min_aspect_ratio,
+            'max_aspect_ratio': max_aspect_ratio,
+            'bbox': bbox
+        })
@@ -0,0 +1,247 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Set
+
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionplan import ActionChainOptimizer
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import Action, ActionType
+
+IMAGE_EXTENSIONS = {'.bmp', '.dib', '.jpeg', '.jpg', '.jpe', '.jp2', '.png', '.webp', '.pbm',
+                    '.pgm', '.ppm', '.pxm', '.pnm', '.sr', '.ras', '.tiff', '.tif', '.exr',
+                    '.hdr', '.pic'}
+
+
+def load_action_chain(path: str) -> List[Action]:
+    """
+        Loads a chain saved as JSON array of 'Action.to_json' values.
+        IMAGE_LOADED actions are skipped, they only describe where the source came from.
+    """
+    with open(path, 'r', encoding='utf-8') as chain_file:
+        values = json.load(chain_file)
+    if not isinstance(values, list):
+        raise ValueError(f'Action chain must be a JSON array. Provided file: {path}')
+    actions = [Action.from_json(value) for value in values]
+    return [action for action in actions if action.action_type != ActionType.IMAGE_LOADED]
+
+
+def get_chain_digest(actions: List[Action]) -> str:
+    serialized = json.dumps([action.to_json() for action in actions], sort_keys=True)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def iter_images(input_dir: str) -> Iterator[str]:
+    """
+        Yields paths of images relative to 'input_dir' in a stable order.
+    """
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in IMAGE_EXTENSIONS:
+                yield os.path.relpath(os.path.join(root, name), input_dir)
+
+
+class BatchManifest:
+    """
+        Append-only JSON lines log of processed images. The first record stores the digest
+        of the action chain, every next record stores the result for one input:
+            {"input": "a/b.png", "status": "done"}
+            {"input": "a/c.png", "status": "failed", "error": "..."}
+        A torn last line (e.g. after a crash) is ignored on load.
+    """
+
+    def __init__(self, path: str, chain_digest: str):
+        self.__path = path
+        self.__done: Set[str] = set()
+        self.__failed: Dict[str, str] = {}
+        is_new = not os.path.exists(path)
+        if not is_new:
+            self.__load(chain_digest)
+        self.__file = open(path, 'a', encoding='utf-8')
+        if is_new:
+            self.__append({'chain': chain_digest})
+        elif not self.__ends_with_newline():
+            # Terminate the torn line, otherwise the next record is glued to it
+            self.__file.write('\n')
+
+    def __load(self, chain_digest: str):
+        with open(self.__path, 'r', encoding='utf-8') as manifest_file:
+            for line in manifest_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'chain' in record.keys():
+                    if record['chain'] != chain_digest:
+                        raise ValueError(
+                            f'Manifest {self.__path} was created for another action chain')
+                elif record.get('status') == 'done':
+                    self.__done.add(record['input'])
+                    self.__failed.pop(record['input'], None)
+                else:
+                    self.__failed[record['input']] = record.get('error', '')
+
+    def __ends_with_newline(self) -> bool:
+        with open(self.__path, 'rb') as manifest_file:
+            manifest_file.seek(0, os.SEEK_END)
+            if manifest_file.tell() == 0:
+                return True
+            manifest_file.seek(-1, os.SEEK_END)
+            return manifest_file.read(1) == b'\n'
+
+    def is_done(self, input_path: str) -> bool:
+        return input_path in self.__done
+
+    def get_failed(self) -> Dict[str, str]:
+        return dict(self.__failed)
+
+    def mark_done(self, input_path: str):
+        self.__done.add(input_path)
+        self.__failed.pop(input_path, None)
+        self.__append({'input': input_path, 'status': 'done'})
+
+    def mark_failed(self, input_path: str, error: str):
+        self.__failed[input_path] = error
+        self.__append({'input': input_path, 'status': 'failed', 'error': error})
+
+    def __append(self, record: Dict[str, Any]):
+        self.__file.write(json.dumps(record) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+@dataclass(frozen=True)
+class BatchReport:
+    processed: int
+    skipped: int
+    failed: int
+
+
+class BatchRunner:
+    """
+        Replays an action chain over every image of a directory tree and writes results
+        with the same relative paths into the output directory. Progress is kept in
+        'manifest.jsonl' of the output directory, so a repeated run skips images which
+        were already processed.
+    """
+
+    MANIFEST_NAME = 'manifest.jsonl'
+
+    def __init__(self, actions: List[Action], workers: int = 1, optimize: bool = True,
+                 output_ext: Optional[str] = None):
+        if workers < 1:
+            raise ValueError(f'"workers" must be positive. Provided value: {workers}')
+        self.__actions = actions
+        self.__workers = workers
+        self.__optimize = optimize
+        self.__output_ext = output_ext
+        self.__skipped = 0
+
+    def run(self, input_dir: str, output_dir: str) -> BatchReport:
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = BatchManifest(os.path.join(output_dir, self.MANIFEST_NAME),
+                                 get_chain_digest(self.__actions))
+        self.__skipped = 0
+        try:
+            tasks = self.__iter_tasks(input_dir, output_dir, manifest)
+            if self.__workers == 1:
+                _init_worker(self.__actions, self.__optimize)
+                results = (_process_file(*task) for task in tasks)
+                return self.__collect(results, manifest)
+            with ProcessPoolExecutor(max_workers=self.__workers, initializer=_init_worker,
+                                     initargs=(self.__actions, self.__optimize)) as executor:
+                return self.__collect(self.__submit_bounded(executor, tasks), manifest)
+        finally:
+            manifest.close()
+
+    def __iter_tasks(self, input_dir: str, output_dir: str,
+                     manifest: BatchManifest) -> Iterator[Tuple[str, str, str]]:
+        for relative_path in iter_images(input_dir):
+            if manifest.is_done(relative_path):
+                self.__skipped += 1
+                continue
+            output_path = os.path.join(output_dir, relative_path)
+            if self.__output_ext is not None:
+                output_path = str(Path(output_path).with_suffix(self.__output_ext))
+            yield relative_path, os.path.join(input_dir, relative_path), output_path
+
+    def __submit_bounded(self, executor: ProcessPoolExecutor,
+                         tasks: Iterator[Tuple[str, str, str]]) -> Iterator[Tuple[str, str]]:
+        # The directory is streamed, so only a few tasks per worker are queued at once
+        max_in_flight = 2 * self.__workers
+        in_flight: Set[Future] = set()
+        for task in tasks:
+            in_flight.add(executor.submit(_process_file, *task))
+            if len(in_flight) >= max_in_flight:
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    yield future.result()
+        for future in wait(in_flight).done:
+            yield future.result()
+
+    def __collect(self, results: Iterator[Tuple[str, str]], manifest: BatchManifest) -> BatchReport:
+        processed = 0
+        failed = 0
+        for relative_path, error in results:
+            if error is None:
+                processed += 1
+                manifest.mark_done(relative_path)
+            else:
+                failed += 1
+                manifest.mark_failed(relative_path, error)
+        return BatchReport(processed=processed, skipped=self.__skipped, failed=failed)
+
+
+_worker_chain: Optional[Tuple[ActionProcessor, List[Action]]] = None
+
+
+def _init_worker(actions: List[Action], optimize: bool):
+    global _worker_chain
+    processor = ActionProcessor()
+    if optimize:
+        actions = ActionChainOptimizer(processor).optimize(actions).get_actions()
+    _worker_chain = (processor, actions)
+
+
+def _process_file(relative_path: str, input_path: str,
+                  output_path: str) -> Tuple[str, Optional[str]]:
+    processor, actions = _worker_chain
+    try:
+        mat_bgr = cv.imread(input_path)
+        if mat_bgr is None:
+            raise ValueError(f'Unable to read image: {input_path}')
+        result = mat_bgr
+        for action in actions:
+            result = processor.process(action, result)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        # Write into a temporary file first, so a crash never leaves a truncated output
+        output = Path(output_path)
+        partial_path = str(output.with_name(f'{output.stem}.partial{output.suffix}'))
+        if not cv.imwrite(partial_path, result):
+            raise ValueError(f'Unable to write image: {output_path}')
+        os.replace(partial_path, output_path)
+        return relative_path, None
+    except Exception as e:  # pylint: disable=broad-except
+        return relative_path, f'{type(e).__name__}: {e}'
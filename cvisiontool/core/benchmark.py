@@ -0,0 +1,300 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Sequence, Callable
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import Action, ActionFactory
+
+FORMAT_VERSION = 1
+
+DEFAULT_MEGAPIXELS = (0.3, 2.0, 12.0, 50.0)
+DEFAULT_ANCHORS = (1, 5, 15)
+
+# Modules which headless workers import, they must not pull Qt in
+HEADLESS_MODULES = ('cvisiontool.core.actionproc', 'cvisiontool.core.historymanager',
+                    'cvisiontool.core.session', 'cvisiontool.batch')
+HEADLESS_STARTUP_BUDGET_SEC = 0.5
+STARTUP_CASE_NAME = 'startup/headless'
+_GUI_MODULE_PREFIXES = ('PySide2', 'shiboken2')
+
+_MORPH_FACTORIES: Dict[str, Callable[[int, int], Action]] = {
+    'erosion': ActionFactory.create_erosion_action,
+    'dilation': ActionFactory.create_dilation_action,
+    'morphological_gradient': ActionFactory.create_morph_gradient_action,
+    'morphological_opening': ActionFactory.create_morph_opening_action,
+    'morphological_closing': ActionFactory.create_morph_closing_action
+}
+_MORPH_SHAPES = {
+    cv.MORPH_RECT: 'rect',
+    cv.MORPH_CROSS: 'cross',
+    cv.MORPH_ELLIPSE: 'ellipse'
+}
+
+
+def create_synthetic_image(megapixels: float, seed: int = 0) -> np.ndarray:
+    """
+        Creates a reproducible 4:3 BGR image: smooth colored blobs with noise and
+        a few filled circles, so thresholding and circle detection have work to do.
+    """
+    width = max(4, int(round(math.sqrt(megapixels * 1_000_000 * 4 / 3))))
+    height = max(3, int(round(width * 3 / 4)))
+    rng = np.random.default_rng(seed)
+    # Upscaling a small random image is much cheaper than generating noise per pixel
+    mat = cv.resize(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8), (width, height),
+                    interpolation=cv.INTER_CUBIC)
+    noise = cv.resize(rng.integers(0, 32, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8),
+                      (width, height), interpolation=cv.INTER_NEAREST)
+    cv.add(mat, noise, dst=mat)
+    radius = max(2, min(width, height) // 20)
+    for _ in range(8):
+        center = (int(rng.integers(radius, max(radius + 1, width - radius))),
+                  int(rng.integers(radius, max(radius + 1, height - radius))))
+        cv.circle(mat, center, radius, (255, 255, 255), -1)
+    return mat
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    name: str
+    action: Action
+    megapixels: float
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    action: Dict[str, Any]
+    megapixels: float
+    shape: List[int]
+    repeats: int
+    min_sec: float
+    median_sec: float
+    mean_sec: float
+
+    @staticmethod
+    def from_json(value: Dict[str, Any]) -> 'BenchmarkResult':
+        return BenchmarkResult(**value)
+
+
+@dataclass(frozen=True)
+class BenchmarkChange:
+    name: str
+    baseline_sec: float
+    current_sec: float
+
+    def get_ratio(self) -> float:
+        return self.current_sec / self.baseline_sec if self.baseline_sec > 0 else math.inf
+
+
+@dataclass
+class BenchmarkComparison:
+    regressions: List[BenchmarkChange] = field(default_factory=list)
+    improvements: List[BenchmarkChange] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    added: List[str] = field(default_factory=list)
+
+    def has_regressions(self) -> bool:
+        return len(self.regressions) > 0
+
+
+def create_cases(megapixels: Sequence[float] = DEFAULT_MEGAPIXELS,
+                 anchors: Sequence[int] = DEFAULT_ANCHORS) -> List[BenchmarkCase]:
+    """
+        Creates cases for every strategy of ActionProcessor: all morphological operations
+        with every shape and anchor, inRange in every supported color space, both
+        HoughCircles methods, findContours and connected components. Case names are stable,
+        they are keys of the baseline.
+    """
+    cases = []
+    for mp in megapixels:
+        size = f'{mp:g}mp'
+        for op_name, factory in _MORPH_FACTORIES.items():
+            for shape, shape_name in _MORPH_SHAPES.items():
+                for anchor in anchors:
+                    cases.append(BenchmarkCase(f'{op_name}/{shape_name}/anchor={anchor}/{size}',
+                                               factory(shape, anchor), mp))
+        for color_space, lower, upper in [('hsv', [0, 50, 50], [90, 255, 255]),
+                                          ('lab', [50, 100, 100], [200, 160, 160])]:
+            cases.append(BenchmarkCase(f'in_range/{color_space}/{size}',
+                                       ActionFactory.create_in_range_action(color_space, lower,
+                                                                            upper), mp))
+        for method, method_name, param2 in [(cv.HOUGH_GRADIENT, 'gradient', 100),
+                                            (cv.HOUGH_GRADIENT_ALT, 'gradient_alt', 0.9)]:
+            cases.append(BenchmarkCase(
+                f'hough_circle/{method_name}/{size}',
+                ActionFactory.create_hough_circle_action(method=method, dp=1.5, min_dist=20,
+                                                         param1=100, param2=param2,
+                                                         min_radius=0, max_radius=0), mp))
+        cases.append(BenchmarkCase(f'find_contours/tree/{size}',
+                                   ActionFactory.create_find_contours_action(
+                                       cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE), mp))
+        cases.append(BenchmarkCase(f'connected_components/min_area/{size}',
+                                   ActionFactory.create_connected_components_action(
+                                       8, min_area=10), mp))
+    return cases
+
+
+class BenchmarkRunner:
+    """
+        Runs benchmark cases through ActionProcessor. Every repeat misses the derived plane
+        cache, so color conversions are measured as a part of the strategy; morphology
+        kernels stay cached, as they do in the application. The result cache is not used.
+        Images are generated once per size and reused by all cases of that size.
+    """
+
+    def __init__(self, repeats: int = 3, warmup: int = 1, seed: int = 0,
+                 progress: Optional[Callable[[BenchmarkResult], None]] = None):
+        if repeats < 1:
+            raise ValueError(f'"repeats" must be positive. Provided value: {repeats}')
+        self.__repeats = repeats
+        self.__warmup = warmup
+        self.__seed = seed
+        self.__progress = progress
+
+    def run(self, cases: Sequence[BenchmarkCase]) -> List[BenchmarkResult]:
+        results = []
+        images: Dict[float, np.ndarray] = {}
+        for case in cases:
+            if case.megapixels not in images:
+                # Only images of one size are kept alive at a time
+                images = {case.megapixels: create_synthetic_image(case.megapixels, self.__seed)}
+            result = self.__run_case(case, images[case.megapixels])
+            results.append(result)
+            if self.__progress is not None:
+                self.__progress(result)
+        return results
+
+    def __run_case(self, case: BenchmarkCase, mat_bgr: np.ndarray) -> BenchmarkResult:
+        processor = ActionProcessor()
+        timings = []
+        for i in range(self.__warmup + self.__repeats):
+            # Planes are cached per mat object, a new view makes every repeat convert again
+            source = mat_bgr.view()
+            started_at = time.perf_counter()
+            processor.process(case.action, source)
+            if i >= self.__warmup:
+                timings.append(time.perf_counter() - started_at)
+        return BenchmarkResult(name=case.name, action=case.action.to_json(),
+                               megapixels=case.megapixels, shape=list(mat_bgr.shape),
+                               repeats=self.__repeats, min_sec=min(timings),
+                               median_sec=statistics.median(timings),
+                               mean_sec=statistics.mean(timings))
+
+
+def get_environment() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'opencv': cv.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv.getNumThreads()
+    }
+
+
+def save_results(path: str, results: Sequence[BenchmarkResult]):
+    with open(path, 'w') as file:
+        json.dump({
+            'version': FORMAT_VERSION,
+            'environment': get_environment(),
+            'results': [asdict(result) for result in results]
+        }, file, indent=2)
+
+
+def load_results(path: str) -> List[BenchmarkResult]:
+    with open(path, 'r') as file:
+        value = json.load(file)
+    if not isinstance(value, dict) or value.get('version') != FORMAT_VERSION:
+        raise ValueError(f'File {path} is not a benchmark result of version {FORMAT_VERSION}')
+    return [BenchmarkResult.from_json(result) for result in value['results']]
+
+
+def compare_results(current: Sequence[BenchmarkResult], baseline: Sequence[BenchmarkResult],
+                    threshold: float = 0.2, min_delta_sec: float = 0.002,
+                    thresholds: Optional[Dict[str, float]] = None) -> BenchmarkComparison:
+    """
+        Compares median times by case name. A case regresses when it is slower than the
+        baseline by more than 'threshold' (a fraction, 0.2 = 20%) and by more than
+        'min_delta_sec', which keeps timer noise of very fast cases out of the report.
+        'thresholds' overrides the threshold for cases whose name starts with a key.
+    """
+    thresholds = thresholds if thresholds is not None else {}
+    baseline_by_name = {result.name: result for result in baseline}
+    current_names = set()
+    comparison = BenchmarkComparison()
+    for result in current:
+        current_names.add(result.name)
+        expected = baseline_by_name.get(result.name)
+        if expected is None:
+            comparison.added.append(result.name)
+            continue
+        case_threshold = threshold
+        for prefix, value in thresholds.items():
+            if result.name.startswith(prefix):
+                case_threshold = value
+        change = BenchmarkChange(result.name, expected.median_sec, result.median_sec)
+        delta = result.median_sec - expected.median_sec
+        if abs(delta) <= min_delta_sec:
+            continue
+        if delta > expected.median_sec * case_threshold:
+            comparison.regressions.append(change)
+        elif -delta > expected.median_sec * case_threshold:
+            comparison.improvements.append(change)
+    comparison.missing = [name for name in baseline_by_name.keys() if name not in current_names]
+    return comparison
+
+
+@dataclass(frozen=True)
+class StartupMeasurement:
+    """
+        Wall time of starting a new interpreter which imports headless modules,
+        'gui_modules' are Qt modules which were imported by them.
+    """
+    min_sec: float
+    median_sec: float
+    gui_modules: List[str]
+
+    def to_result(self, repeats: int) -> BenchmarkResult:
+        return BenchmarkResult(name=STARTUP_CASE_NAME, action={}, megapixels=0, shape=[],
+                               repeats=repeats, min_sec=self.min_sec,
+                               median_sec=self.median_sec, mean_sec=self.median_sec)
+
+
+def measure_headless_startup(repeats: int = 5,
+                             modules: Sequence[str] = HEADLESS_MODULES) -> StartupMeasurement:
+    code = f'import sys\nimport {", ".join(modules)}\n' \
+           f'print("\\n".join(m for m in sys.modules if m.startswith({_GUI_MODULE_PREFIXES})))'
+    timings = []
+    output = ''
+    for _ in range(repeats):
+        started_at = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                                text=True).stdout
+        timings.append(time.perf_counter() - started_at)
+    return StartupMeasurement(min_sec=min(timings), median_sec=statistics.median(timings),
+                              gui_modules=sorted(output.split()))
@@ -0,0 +1,86 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+import weakref
+from typing import Dict, List, Tuple, Any
+
+import numpy as np
+
+
+class BufferPool:
+    """
+        The pool recycles arrays keyed by shape and dtype, so loops producing mats of
+        the same size (video frames, tiles) stop allocating outputs once it is warmed up.
+
+        'acquire' returns a new view of a free buffer, not the buffer itself: caches keyed by
+        mat identity (see DerivedPlaneCache) drop entries of a released view once it is
+        collected, so a recycled buffer never shows up as the old mat. A view must not be
+        used after it was passed to 'release'. Arrays which were not acquired from the pool
+        are ignored by 'release', so results of any action can be released unconditionally.
+    """
+
+    def __init__(self, max_free_buffers_per_key: int = 4):
+        if max_free_buffers_per_key < 0:
+            raise ValueError(f'"max_free_buffers_per_key" must be non-negative. '
+                             f'Provided value: {max_free_buffers_per_key}')
+        self.__max_free_buffers_per_key = max_free_buffers_per_key
+        self.__free: Dict[Tuple[Tuple[int, ...], str], List[np.ndarray]] = {}
+        # Buffers which were acquired and never released are simply garbage collected
+        self.__leased: 'weakref.WeakValueDictionary[int, np.ndarray]' = \
+            weakref.WeakValueDictionary()
+        self.__allocations = 0
+        self.__lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...], dtype: Any = np.uint8) -> np.ndarray:
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self.__lock:
+            free = self.__free.get(key)
+            buffer = free.pop() if free else None
+            if buffer is None:
+                buffer = np.empty(key[0], dtype=key[1])
+                self.__allocations += 1
+            self.__leased[id(buffer)] = buffer
+        return buffer.view()
+
+    def acquire_like(self, mat: np.ndarray) -> np.ndarray:
+        return self.acquire(mat.shape, mat.dtype)
+
+    def release(self, mat: np.ndarray):
+        buffer = mat.base
+        if buffer is None or mat.shape != buffer.shape or mat.dtype != buffer.dtype:
+            return
+        with self.__lock:
+            if self.__leased.get(id(buffer)) is not buffer:
+                return
+            del self.__leased[id(buffer)]
+            free = self.__free.setdefault((buffer.shape, buffer.dtype.str), [])
+            if len(free) < self.__max_free_buffers_per_key:
+                free.append(buffer)
+
+    def get_allocation_count(self) -> int:
+        return self.__allocations
+
+    def get_leased_count(self) -> int:
+        with self.__lock:
+            return len(self.__leased)
+
+    def get_free_count(self) -> int:
+        with self.__lock:
+            return sum(len(free) for free in self.__free.values())
+
+    def clear(self):
+        with self.__lock:
+            self.__free.clear()
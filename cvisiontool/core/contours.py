@@ -0,0 +1,98 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from typing import Sequence, Optional, Tuple
+
+import numpy as np
+import cv2.cv2 as cv
+
+CONTOUR_DTYPE = np.dtype([
+    ('area', np.float64),
+    ('perimeter', np.float64),
+    ('x', np.int32),
+    ('y', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('centroid_x', np.float64),
+    ('centroid_y', np.float64),
+    ('parent', np.int32)
+])
+
+
+def find_contours(mask: np.ndarray, mode: int,
+                  method: int) -> Tuple[Sequence[np.ndarray], Optional[np.ndarray]]:
+    """
+        Runs cv.findContours for a single-channel mask, non-zero pixels are foreground.
+        Returns contours and hierarchy with shape (N, 4) or None if nothing was found.
+    """
+    if mask.ndim != 2:
+        raise ValueError(f'Contours can be found only on a single-channel mask. '
+                         f'Provided shape: {mask.shape}')
+    if mode == cv.RETR_FLOODFILL:
+        mask = mask.astype(np.int32)
+    elif mask.dtype != np.uint8:
+        mask = (mask != 0).astype(np.uint8)
+    contours, hierarchy = cv.findContours(mask, mode, method)
+    return contours, None if hierarchy is None else hierarchy[0]
+
+
+def compute_contour_features(contours: Sequence[np.ndarray],
+                             hierarchy: Optional[np.ndarray]) -> np.recarray:
+    """
+        Computes features of all contours in one vectorized pass over concatenated points:
+        per-contour sums, minimums and maximums are taken with 'reduceat' by contour
+        offsets, so there is no Python loop over contours.
+
+        'area' and 'perimeter' match cv.contourArea and cv.arcLength of a closed contour,
+        bbox fields match cv.boundingRect. The centroid is the centroid of the polygon;
+        for degenerate (zero area) contours it is the mean of their points. 'parent' is
+        the index of the parent contour or -1.
+    """
+    count = len(contours)
+    features = np.zeros(count, dtype=CONTOUR_DTYPE).view(np.recarray)
+    if count == 0:
+        return features
+    lengths = np.fromiter((len(contour) for contour in contours), dtype=np.int64, count=count)
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    starts = np.zeros(count, dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+
+    # Index of the next point of the closed contour, the last point is followed by the first
+    next_indexes = np.arange(1, len(points) + 1)
+    next_indexes[starts + lengths - 1] = starts
+    x, y = points[:, 0], points[:, 1]
+    next_x, next_y = x[next_indexes], y[next_indexes]
+
+    cross = x * next_y - next_x * y
+    signed_area = np.add.reduceat(cross, starts) / 2
+    features.area = np.abs(signed_area)
+    features.perimeter = np.add.reduceat(np.hypot(next_x - x, next_y - y), starts)
+
+    min_x, min_y = np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts)
+    features.x, features.y = min_x, min_y
+    features.width = np.maximum.reduceat(x, starts) - min_x + 1
+    features.height = np.maximum.reduceat(y, starts) - min_y + 1
+
+    mean_x = np.add.reduceat(x, starts) / lengths
+    mean_y = np.add.reduceat(y, starts) / lengths
+    moment_x = np.add.reduceat((x + next_x) * cross, starts)
+    moment_y = np.add.reduceat((y + next_y) * cross, starts)
+    is_degenerate = signed_area == 0
+    safe_area = np.where(is_degenerate, 1.0, signed_area)
+    features.centroid_x = np.where(is_degenerate, mean_x, moment_x / (6 * safe_area))
+    features.centroid_y = np.where(is_degenerate, mean_y, moment_y / (6 * safe_area))
+
+    features.parent = -1 if hierarchy is None else hierarchy[:, 3]
+    return features
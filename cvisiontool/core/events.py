@@ -0,0 +1,45 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+from typing import Callable, List
+
+
+class Event:
+    """
+        Qt-free replacement of a signal for core classes. Callbacks are called
+        synchronously on the emitting thread in the order of connection; GUI code should
+        listen through an adapter which forwards events to Qt signals.
+    """
+
+    def __init__(self):
+        self.__callbacks: List[Callable[..., None]] = []
+        self.__lock = threading.Lock()
+
+    def connect(self, callback: Callable[..., None]):
+        with self.__lock:
+            self.__callbacks.append(callback)
+
+    def disconnect(self, callback: Callable[..., None]):
+        with self.__lock:
+            if callback not in self.__callbacks:
+                raise ValueError(f'Callback is not connected: {callback}')
+            self.__callbacks.remove(callback)
+
+    def emit(self, *args):
+        with self.__lock:
+            callbacks = list(self.__callbacks)
+        for callback in callbacks:
+            callback(*args)
@@ -13,96 +13,368 @@
 #  #
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import zlib
 from dataclasses import dataclass
-from typing import Any, List, Optional
+from typing import Any, List, Optional, Dict
 
 import numpy as np
-from PySide2.QtCore import Signal, QObject
 
-from cvisiontool.core.actions import Action
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import Action, ActionType
+from cvisiontool.core.events import Event
+from cvisiontool.core.matstore import MatStore
+from cvisiontool.core.tracing import get_tracer
 
 
 @dataclass(frozen=True)
 class HistoryEntry:
+    """
+        'mat_bgr' is the result of the action passed to 'HistoryManager.add_entry'.
+        Entries returned by the manager don't pin mats, use 'HistoryManager.get_mat_bgr'.
+    """
     action: Action
-    mat_bgr: np.ndarray
+    mat_bgr: Optional[np.ndarray] = None
 
 
-class HistoryManager(QObject):
-    history_changed = Signal()
+class _StoredMat:
+    def __init__(self, mat: Optional[np.ndarray]):
+        self.mat: Optional[np.ndarray] = mat
+        self.compressed: Optional[bytes] = None
+        self.spill_path: Optional[str] = None
+        self.store: Optional[MatStore] = None
+        self.store_key: Optional[str] = None
+        self.shape = mat.shape if mat is not None else None
+        self.dtype = mat.dtype if mat is not None else None
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
+    @staticmethod
+    def from_store(store: MatStore, key: Optional[str]) -> '_StoredMat':
+        stored = _StoredMat(None)
+        if key is not None:
+            stored.store = store
+            stored.store_key = key
+        return stored
+
+    def get_memory_bytes(self) -> int:
+        if self.mat is not None:
+            return self.mat.nbytes
+        if self.compressed is not None:
+            return len(self.compressed)
+        return 0
+
+    def is_available(self) -> bool:
+        return self.mat is not None or self.compressed is not None \
+               or self.spill_path is not None or self.store_key is not None
+
+    def compress(self):
+        if self.mat is not None:
+            self.compressed = zlib.compress(np.ascontiguousarray(self.mat).data, 1)
+            self.mat = None
+
+    def spill(self, spill_dir: str, name: str):
+        if self.compressed is not None:
+            self.spill_path = os.path.join(spill_dir, name)
+            with open(self.spill_path, 'wb') as spill_file:
+                spill_file.write(self.compressed)
+        self.compressed = None
+        self.mat = None
+
+    def save_to(self, store: MatStore) -> Optional[str]:
+        if self.store_key is not None:
+            if not store.contains(self.store_key):
+                store.put_object(self.store_key, self.store.get_object(self.store_key))
+        elif self.is_available():
+            self.store_key = store.put(self.load())
+        else:
+            return None
+        # Next saves don't hash the mat again
+        self.store = store
+        return self.store_key
+
+    def load(self) -> np.ndarray:
+        if self.mat is not None:
+            return self.mat
+        if self.compressed is None and self.spill_path is None and self.store_key is not None:
+            return self.store.load(self.store_key)
+        data = self.compressed
+        if data is None:
+            with open(self.spill_path, 'rb') as spill_file:
+                data = spill_file.read()
+        return np.frombuffer(zlib.decompress(data), dtype=self.dtype).reshape(self.shape)
+
+    def discard(self):
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.mat = None
+        self.compressed = None
+        self.spill_path = None
+        # Store objects may be shared by sessions, they are never removed from here
+        self.store = None
+        self.store_key = None
+
+
+class HistoryManager:
+    """
+        Keeps applied actions and their results within 'memory_budget' bytes.
+        Every 'checkpoint_interval'-th entry (and the newest one) keeps its full mat, other
+        results are zlib-compressed. When the budget is exceeded, compressed results are
+        spilled to 'spill_dir' (or dropped if it's not set) and then older checkpoints are
+        dropped. Loaded images (IMAGE_LOADED entries, the first one included) can't be
+        replayed, so they are always kept in full. A result which is not stored anymore is
+        rebuilt by replaying actions from the nearest older stored result.
+
+        Entries are indexed from the oldest one (index 0). 'entries_inserted',
+        'entries_removed' and 'entries_changed' carry the first and the last index of
+        changed entries. Events are emitted on the thread which changed history.
+    """
+
+    def __init__(self, memory_budget: int = 1024 * 1024 * 1024, checkpoint_interval: int = 5,
+                 action_processor: Optional[ActionProcessor] = None,
+                 spill_dir: Optional[str] = None):
+        self.history_changed = Event()
+        self.entries_inserted = Event()
+        self.entries_removed = Event()
+        self.entries_changed = Event()
+        if checkpoint_interval < 1:
+            raise ValueError(
+                f'"checkpoint_interval" must be positive. Provided value: {checkpoint_interval}')
         self.__history = HistoryList()
+        self.__stored_mats: List[_StoredMat] = []
+        self.__memory_bytes = 0
+        self.__memory_budget = memory_budget
+        self.__checkpoint_interval = checkpoint_interval
+        self.__action_processor = action_processor if action_processor is not None \
+            else ActionProcessor()
+        self.__spill_dir = spill_dir
+        self.__spill_counter = 0
 
     def add_entry(self, entry: HistoryEntry):
-        self.__history.add(entry)
-        self.history_changed.emit()
+        with get_tracer().span('add_entry', 'history', action=entry.action, mat=entry.mat_bgr):
+            index = len(self.__history)
+            stored = _StoredMat(entry.mat_bgr)
+            self.__history.add(HistoryEntry(entry.action))
+            self.__stored_mats.append(stored)
+            self.__memory_bytes += stored.get_memory_bytes()
+            if index > 0 and not self.__is_checkpoint(index - 1):
+                previous = self.__stored_mats[index - 1]
+                self.__memory_bytes -= previous.get_memory_bytes()
+                previous.compress()
+                self.__memory_bytes += previous.get_memory_bytes()
+            self.__enforce_memory_budget()
+            self.entries_inserted.emit(index, index)
+            self.history_changed.emit()
+
+    def update_action_params(self, entry: HistoryEntry, params: Dict[str, Any]) -> int:
+        """
+            Replaces params of the entry action and recomputes results of the entry and of
+            newer entries. Older results are reused. Recomputation stops as soon as a result
+            is byte-identical to the stored one, since newer results can't change then, and
+            before the next IMAGE_LOADED entry, which starts from a loaded image.
+            History is changed only when every result was recomputed, an error leaves it
+            as it was. Returns the number of recomputed entries.
+        """
+        with get_tracer().span('update_action_params', 'history', action=entry.action):
+            index = self.get_index(entry)
+            if index == 0 or entry.action.action_type == ActionType.IMAGE_LOADED:
+                raise ValueError(f'Entry can not be edited: {entry.action.to_string()}')
+            edited_action = Action(entry.action.action_type, dict(params))
+            mat_bgr = self.get_mat_bgr(self.__history.get(index - 1))
+            # Results are prepared aside (compressed unless they're checkpoints) and moved
+            # into history after the whole replay succeeded
+            recomputed_mats: List[Optional[_StoredMat]] = []
+            for current in range(index, len(self.__history)):
+                action = edited_action if current == index else self.__history.get(current).action
+                if action.action_type == ActionType.IMAGE_LOADED:
+                    break
+                mat_bgr = self.__action_processor.process(action, mat_bgr)
+                previous = self.__stored_mats[current]
+                if previous.is_available() and _is_same_mat(previous.load(), mat_bgr):
+                    # The result is kept, but the entry is still counted as recomputed
+                    recomputed_mats.append(None)
+                    break
+                recomputed_mats.append(self.__create_stored_mat(current, mat_bgr))
+
+            self.__history.set(index, HistoryEntry(edited_action))
+            for current, stored in enumerate(recomputed_mats, index):
+                if stored is not None:
+                    self.__replace_stored_mat(current, stored)
+            self.__enforce_memory_budget()
+            self.entries_changed.emit(index, index + len(recomputed_mats) - 1)
+            self.history_changed.emit()
+            return len(recomputed_mats)
+
+    def get_entry_count(self) -> int:
+        return len(self.__history)
+
+    def get_entry(self, index: int) -> HistoryEntry:
+        return self.__history.get(index)
+
+    def get_index(self, entry: HistoryEntry) -> int:
+        index = self.__history.index_of(entry)
+        if index is None:
+            raise ValueError(f'Entry is not in history: {entry.action.to_string()}')
+        return index
 
     def get_entries(self) -> List[HistoryEntry]:
         return self.__history.get_all_newest_first()
 
+    def get_mat_bgr(self, entry: HistoryEntry) -> np.ndarray:
+        index = self.get_index(entry)
+        start = index
+        while start >= 0 and not self.__stored_mats[start].is_available() \
+                and not self.__is_loaded_image(start):
+            start -= 1
+        if start < 0 or not self.__stored_mats[start].is_available():
+            raise ValueError(f'Unable to rebuild result of: {entry.action.to_string()}')
+        mat_bgr = self.__stored_mats[start].load()
+        for replayed_index in range(start + 1, index + 1):
+            mat_bgr = self.__action_processor.process(self.__history.get(replayed_index).action,
+                                                      mat_bgr)
+        return mat_bgr
+
+    def get_memory_bytes(self) -> int:
+        return self.__memory_bytes
+
     def remove_newer_than(self, entry: HistoryEntry):
-        self.__history.remove_newer_than(entry)
-        self.history_changed.emit()
+        self.truncate(self.get_index(entry) + 1)
+
+    def truncate(self, length: int):
+        with get_tracer().span('truncate', 'history', length=length):
+            old_length = len(self.__history)
+            if length >= old_length:
+                return
+            for stored in self.__stored_mats[length:]:
+                self.__memory_bytes -= stored.get_memory_bytes()
+                stored.discard()
+            del self.__stored_mats[length:]
+            self.__history.truncate(length)
+            self.entries_removed.emit(length, old_length - 1)
+            self.history_changed.emit()
 
+    def export_entries(self, store: MatStore) -> List[Dict[str, Any]]:
+        """
+            Writes every stored result to the store and returns JSON records of entries,
+            'mat' of a record is the store key or None if the result must be replayed.
+        """
+        with get_tracer().span('export_entries', 'history', count=len(self.__history)):
+            return [{
+                'action': self.__history.get(index).action.to_json(),
+                'mat': self.__stored_mats[index].save_to(store)
+            } for index in range(len(self.__history))]
 
-class _ListNode:
-    def __init__(self, element, prev_node, next_node):
-        self.__element = element
-        self.__prev_node = prev_node
-        self.__next_node = next_node
+    def restore_entries(self, records: List[Dict[str, Any]], store: MatStore):
+        """
+            Replaces history with records produced by 'export_entries'. Results are not
+            read here, they are loaded from the store when they are requested.
+        """
+        if len(records) > 0 and records[0].get('mat') is None:
+            raise ValueError('The first entry of restored history must have a stored result')
+        entries = [HistoryEntry(Action.from_json(record['action'])) for record in records]
+        with get_tracer().span('restore_entries', 'history', count=len(records)):
+            self.truncate(0)
+            for entry, record in zip(entries, records):
+                self.__history.add(entry)
+                self.__stored_mats.append(_StoredMat.from_store(store, record.get('mat')))
+            if len(records) > 0:
+                self.entries_inserted.emit(0, len(records) - 1)
+                self.history_changed.emit()
 
-    def set_next_node(self, next_node):
-        self.__next_node = next_node
+    def __is_checkpoint(self, index: int) -> bool:
+        return index % self.__checkpoint_interval == 0 or index == len(self.__history) - 1 \
+               or self.__is_loaded_image(index)
 
-    def set_prev_node(self, prev_node):
-        self.__prev_node = prev_node
+    def __is_loaded_image(self, index: int) -> bool:
+        return self.__history.get(index).action.action_type == ActionType.IMAGE_LOADED
 
-    def get_next_node(self):
-        return self.__next_node
+    def __create_stored_mat(self, index: int, mat_bgr: np.ndarray) -> _StoredMat:
+        stored = _StoredMat(mat_bgr)
+        if not self.__is_checkpoint(index):
+            stored.compress()
+        return stored
+
+    def __replace_stored_mat(self, index: int, stored: _StoredMat):
+        previous = self.__stored_mats[index]
+        self.__memory_bytes -= previous.get_memory_bytes()
+        previous.discard()
+        self.__stored_mats[index] = stored
+        self.__memory_bytes += stored.get_memory_bytes()
+
+    def __enforce_memory_budget(self):
+        # Loaded images can't be replayed and the newest entry is the current mat
+        candidates = [stored for index, stored in enumerate(self.__stored_mats[:-1])
+                      if not self.__is_loaded_image(index)]
+        for stored in candidates:
+            if self.__memory_bytes <= self.__memory_budget:
+                return
+            if stored.compressed is not None:
+                self.__memory_bytes -= stored.get_memory_bytes()
+                if self.__spill_dir is not None:
+                    self.__spill_counter += 1
+                    name = f'history-{os.getpid()}-{self.__spill_counter}.bin'
+                    stored.spill(self.__spill_dir, name)
+                else:
+                    stored.discard()
+        for stored in candidates:
+            if self.__memory_bytes <= self.__memory_budget:
+                return
+            if stored.mat is not None:
+                self.__memory_bytes -= stored.get_memory_bytes()
+                stored.discard()
 
-    def get_prev_node(self):
-        return self.__prev_node
 
-    def get_element(self):
-        return self.__element
+def _is_same_mat(first: np.ndarray, second: np.ndarray) -> bool:
+    return first.shape == second.shape and first.dtype == second.dtype \
+           and np.array_equal(first, second)
 
 
 class HistoryList:
+    """
+        Array-backed history, elements are indexed from the oldest one.
+        Appending and truncating are O(1) amortized, lookup of an element index is O(1)
+        as long as the same object is not added several times.
+    """
 
     def __init__(self):
-        self.__head: Optional[_ListNode] = None
+        self.__elements: List[Any] = []
+        self.__indexes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.__elements)
 
     def add(self, element: Any):
-        if self.__head is None:
-            self.__head = _ListNode(element, None, None)
-        else:
-            new_head = _ListNode(element, prev_node=None, next_node=self.__head)
-            self.__head.set_prev_node(new_head)
-            self.__head = new_head
+        self.__indexes[id(element)] = len(self.__elements)
+        self.__elements.append(element)
+
+    def get(self, index: int) -> Any:
+        return self.__elements[index]
+
+    def set(self, index: int, element: Any):
+        previous = self.__elements[index]
+        if self.__indexes.get(id(previous)) == index:
+            del self.__indexes[id(previous)]
+        self.__indexes[id(element)] = index
+        self.__elements[index] = element
+
+    def index_of(self, element: Any) -> Optional[int]:
+        index = self.__indexes.get(id(element))
+        if index is not None and index < len(self.__elements) \
+                and self.__elements[index] is element:
+            return index
+        for index in range(len(self.__elements) - 1, -1, -1):
+            if self.__elements[index] is element:
+                return index
+        return None
 
     def get_all_newest_first(self) -> List[Any]:
-        if self.__head is None:
-            return []
-        else:
-            next_node: _ListNode = self.__head
-            result = [next_node.get_element()]
-            next_node = next_node.get_next_node()
-            while next_node is not None:
-                result.append(next_node.get_element())
-                next_node = next_node.get_next_node()
-            return result
+        return self.__elements[::-1]
+
+    def truncate(self, length: int):
+        for element in self.__elements[length:]:
+            if self.__indexes.get(id(element), -1) >= length:
+                del self.__indexes[id(element)]
+        del self.__elements[length:]
 
     def remove_newer_than(self, element: Any):
-        current: _ListNode = self.__head
-        while current is not None:
-            if current.get_element() is element:
-                prev: _ListNode = current.get_prev_node()
-                if prev is not None:
-                    prev.set_next_node(None)
-                current.set_prev_node(None)
-                self.__head = current
-                return
-            else:
-                current = current.get_next_node()
+        index = self.index_of(element)
+        if index is not None:
+            self.truncate(index + 1)
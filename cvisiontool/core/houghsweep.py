@@ -0,0 +1,127 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import HoughCircleStrategy
+from cvisiontool.core.actions import Action, ActionFactory
+
+
+@dataclass(frozen=True)
+class HoughSweepGrid:
+    """
+        Values of every HoughCircles param to try, all combinations are evaluated.
+    """
+    dp: Sequence[float] = (1.5,)
+    min_dist: Sequence[float] = (20.0,)
+    param1: Sequence[float] = (100.0,)
+    param2: Sequence[float] = (0.9,)
+    min_radius: Sequence[int] = (0,)
+    max_radius: Sequence[int] = (0,)
+    method: Sequence[int] = field(default_factory=lambda: (cv.HOUGH_GRADIENT_ALT,))
+
+    def get_param_sets(self) -> List[Dict[str, Any]]:
+        return [{
+            'method': method,
+            'dp': dp,
+            'min_dist': min_dist,
+            'param1': param1,
+            'param2': param2,
+            'min_radius': min_radius,
+            'max_radius': max_radius
+        } for method, dp, min_dist, param1, param2, min_radius, max_radius in itertools.product(
+            self.method, self.dp, self.min_dist, self.param1, self.param2, self.min_radius,
+            self.max_radius)]
+
+
+@dataclass(frozen=True)
+class HoughSweepResult:
+    params: Dict[str, Any]
+    circle_count: int
+    elapsed_sec: float
+
+    def to_action(self) -> Action:
+        return ActionFactory.create_hough_circle_action(**self.params)
+
+
+class HoughCircleSweep:
+    """
+        Evaluates a grid of HoughCircles params in parallel. cv.HoughCircles releases the GIL,
+        so runs are executed by a thread pool and share one grayscale (optionally median
+        blurred) copy of the input without copying it per run.
+
+        If 'target_count' is provided, results are ranked by distance of circle count to it,
+        otherwise by circle count descending; ties are ranked by time. With 'stop_on_target'
+        not started runs are cancelled once any run is within 'tolerance' of the target.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.__workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    def run(self, mat: np.ndarray, grid: HoughSweepGrid, target_count: Optional[int] = None,
+            tolerance: int = 0, stop_on_target: bool = False,
+            blur_ksize: int = 0) -> List[HoughSweepResult]:
+        mat_gray = self.prepare_input(mat, blur_ksize)
+        is_target_found = threading.Event()
+        results: List[HoughSweepResult] = []
+        with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+            futures = [executor.submit(self.__evaluate, mat_gray, params, is_target_found)
+                       for params in grid.get_param_sets()]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                if result is None:
+                    continue
+                results.append(result)
+                if stop_on_target and target_count is not None \
+                        and abs(result.circle_count - target_count) <= tolerance:
+                    is_target_found.set()
+                    for pending in futures:
+                        pending.cancel()
+
+        if target_count is not None:
+            results.sort(key=lambda r: (abs(r.circle_count - target_count), r.elapsed_sec))
+        else:
+            results.sort(key=lambda r: (-r.circle_count, r.elapsed_sec))
+        return results
+
+    @staticmethod
+    def prepare_input(mat: np.ndarray, blur_ksize: int = 0) -> np.ndarray:
+        mat_gray = cv.cvtColor(mat, cv.COLOR_BGR2GRAY) if mat.ndim == 3 else mat
+        if blur_ksize > 1:
+            mat_gray = cv.medianBlur(mat_gray, blur_ksize)
+        return mat_gray
+
+    @staticmethod
+    def __evaluate(mat_gray: np.ndarray, params: Dict[str, Any],
+                   is_target_found: threading.Event) -> Optional[HoughSweepResult]:
+        if is_target_found.is_set():
+            return None
+        started_at = time.perf_counter()
+        circles = HoughCircleStrategy.detect_circles(mat_gray, params)
+        elapsed = time.perf_counter() - started_at
+        return HoughSweepResult(params=params,
+                                circle_count=0 if circles is None else circles.shape[1],
+                                elapsed_sec=elapsed)
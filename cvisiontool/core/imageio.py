@@ -0,0 +1,60 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.tracing import get_tracer
+
+# Only JPEG decoders scale DCT blocks while decoding, other formats are decoded at full
+# resolution and then resized, so their reduced decode is not faster than the full one
+REDUCED_DECODE_EXTENSIONS = ('.jpg', '.jpeg', '.jpe')
+# Rough size of a JPEG pixel, used to estimate resolution without decoding
+_JPEG_BYTES_PER_PIXEL = 0.25
+
+_REDUCED_FLAGS = {
+    2: cv.IMREAD_REDUCED_COLOR_2,
+    4: cv.IMREAD_REDUCED_COLOR_4,
+    8: cv.IMREAD_REDUCED_COLOR_8
+}
+
+
+def choose_preview_reduction(path: str, max_pixels: int = 2_000_000) -> int:
+    """
+        Returns the reduction (2, 4 or 8) for a fast preview decode of the image or 1 when
+        a preview would not be faster than reading the full image.
+    """
+    if os.path.splitext(path)[1].lower() not in REDUCED_DECODE_EXTENSIONS:
+        return 1
+    estimated_pixels = os.path.getsize(path) / _JPEG_BYTES_PER_PIXEL
+    if estimated_pixels <= max_pixels:
+        return 1
+    for reduction in sorted(_REDUCED_FLAGS.keys()):
+        if estimated_pixels / (reduction * reduction) <= max_pixels:
+            return reduction
+    return max(_REDUCED_FLAGS.keys())
+
+
+def read_image(path: str, reduction: int = 1) -> np.ndarray:
+    if reduction != 1 and reduction not in _REDUCED_FLAGS.keys():
+        raise ValueError(f'Reduction must be one of 1, 2, 4, 8. Provided value: {reduction}')
+    flag = cv.IMREAD_COLOR if reduction == 1 else _REDUCED_FLAGS[reduction]
+    with get_tracer().span('load_image', 'io', path=path, reduction=reduction):
+        mat = cv.imread(path, flag)
+    if mat is None:
+        raise ValueError(f'Unable to read image: {path}')
+    return mat
@@ -0,0 +1,84 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import io
+import os
+import tempfile
+import zlib
+
+import numpy as np
+
+
+class MatStore:
+    """
+        Content-addressed on-disk store of mats. A mat is serialized in .npy format,
+        its key is SHA-256 of the serialized bytes and the object is kept zlib-compressed
+        in '<directory>/<key[:2]>/<key[2:]>'. Equal mats are stored once, also when they
+        come from different sessions which share the store directory.
+    """
+
+    def __init__(self, directory: str, compression_level: int = 1):
+        self.__directory = directory
+        self.__compression_level = compression_level
+
+    def get_directory(self) -> str:
+        return self.__directory
+
+    def put(self, mat: np.ndarray) -> str:
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, np.ascontiguousarray(mat), allow_pickle=False)
+        data = buffer.getbuffer()
+        key = hashlib.sha256(data).hexdigest()
+        path = self.__get_path(key)
+        if not os.path.exists(path):
+            self.__write(path, zlib.compress(data, self.__compression_level))
+        return key
+
+    def put_object(self, key: str, compressed: bytes):
+        path = self.__get_path(key)
+        if not os.path.exists(path):
+            self.__write(path, compressed)
+
+    def get_object(self, key: str) -> bytes:
+        with open(self.__get_path(key), 'rb') as file:
+            return file.read()
+
+    def load(self, key: str) -> np.ndarray:
+        data = zlib.decompress(self.get_object(key))
+        return np.lib.format.read_array(io.BytesIO(data), allow_pickle=False)
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self.__get_path(key))
+
+    def __get_path(self, key: str) -> str:
+        if len(key) < 3 or not all(c in '0123456789abcdef' for c in key):
+            raise ValueError(f'Wrong key of mat store: {key}')
+        return os.path.join(self.__directory, key[:2], key[2:])
+
+    @staticmethod
+    def __write(path: str, data: bytes):
+        # Objects are written to a temporary file and renamed, so a crash never leaves
+        # a truncated object under its key
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
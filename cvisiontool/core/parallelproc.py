@@ -0,0 +1,268 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import Action
+
+# Name of a shared memory block, shape and dtype of the mat at the start of the block
+_MatDescriptor = Tuple[str, Tuple[int, ...], str]
+
+
+class _SharedBlockPool:
+    """
+        Shared memory blocks owned by the parent process. Free blocks are reused by
+        best fit; a block is leased while a mat placed into it is alive.
+    """
+
+    def __init__(self, max_free_blocks: int):
+        self.__max_free_blocks = max_free_blocks
+        self.__free: List[SharedMemory] = []
+        self.__blocks: Dict[str, SharedMemory] = {}
+        self.__leases: Dict[int, Tuple[weakref.ref, SharedMemory]] = {}
+        self.__lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> SharedMemory:
+        with self.__lock:
+            candidates = [block for block in self.__free if block.size >= nbytes]
+            if len(candidates) > 0:
+                block = min(candidates, key=lambda b: b.size)
+                self.__free.remove(block)
+                return block
+        block = SharedMemory(create=True, size=max(nbytes, 1))
+        with self.__lock:
+            self.__blocks[block.name] = block
+        return block
+
+    def adopt(self, name: str) -> SharedMemory:
+        """
+            Takes ownership of a block which was created by a worker.
+        """
+        block = SharedMemory(name=name)
+        with self.__lock:
+            self.__blocks[block.name] = block
+        return block
+
+    def release(self, block: SharedMemory):
+        with self.__lock:
+            if block.name not in self.__blocks:
+                return
+            self.__free.append(block)
+            if len(self.__free) <= self.__max_free_blocks:
+                return
+            # Smaller blocks are dropped first, large ones are the expensive ones to create
+            self.__free.sort(key=lambda b: b.size)
+            evicted = self.__free.pop(0)
+            del self.__blocks[evicted.name]
+        self.__destroy(evicted)
+
+    def lease(self, block: SharedMemory, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        """
+            Returns a mat placed at the start of the block, the block returns to the pool
+            when the mat and all views of it are garbage collected.
+        """
+        mat = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        key = id(mat)
+        with self.__lock:
+            self.__leases[key] = (weakref.ref(mat), block)
+        weakref.finalize(mat, self.__end_lease, key, block)
+        return mat
+
+    def get_leased_block(self, mat: np.ndarray) -> Optional[SharedMemory]:
+        with self.__lock:
+            lease = self.__leases.get(id(mat))
+        if lease is None or lease[0]() is not mat:
+            return None
+        return lease[1]
+
+    def get_block_count(self) -> int:
+        with self.__lock:
+            return len(self.__blocks)
+
+    def close(self):
+        with self.__lock:
+            blocks = list(self.__blocks.values())
+            self.__blocks.clear()
+            self.__free.clear()
+        for block in blocks:
+            self.__destroy(block)
+
+    def __end_lease(self, key: int, block: SharedMemory):
+        with self.__lock:
+            lease = self.__leases.get(key)
+            if lease is not None and lease[1] is block:
+                del self.__leases[key]
+        self.release(block)
+
+    @staticmethod
+    def __destroy(block: SharedMemory):
+        block.unlink()
+        try:
+            block.close()
+        except BufferError:
+            # Mats returned to a caller still refer to the memory, it's freed with them
+            pass
+
+
+class ParallelActionProcessor:
+    """
+        Runs actions in a pool of worker processes. Mats are never pickled: inputs and
+        results are placed into shared memory blocks and workers receive only block names,
+        shapes and dtypes, so the cost of passing a task doesn't depend on the image size.
+
+        Results are returned as mats placed in shared memory. Their blocks go back to the
+        pool once the results are garbage collected and are reused by next calls. A result
+        passed as an input of a next call is not copied. Use 'create_mat' to produce
+        inputs directly in shared memory; other inputs are copied into a block once.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_free_blocks: int = 16):
+        self.__workers = workers if workers is not None else (os.cpu_count() or 1)
+        if self.__workers < 1:
+            raise ValueError(f'"workers" must be positive. Provided value: {self.__workers}')
+        self.__blocks = _SharedBlockPool(max_free_blocks)
+        self.__executor = ProcessPoolExecutor(max_workers=self.__workers,
+                                              initializer=_init_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def create_mat(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        block = self.__blocks.acquire(int(np.prod(shape)) * dtype.itemsize)
+        return self.__blocks.lease(block, tuple(shape), dtype)
+
+    def process(self, action: Action, mat_bgr: np.ndarray) -> np.ndarray:
+        return self.process_many([action], [mat_bgr])[0]
+
+    def process_many(self, actions: Sequence[Action],
+                     mats: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """
+            Processes 'mats[i]' with 'actions[i]' for every i in parallel and returns
+            results in the same order. The first failed action raises its error.
+        """
+        if len(actions) != len(mats):
+            raise ValueError(f'Number of actions ({len(actions)}) must be equal to '
+                             f'number of mats ({len(mats)})')
+        inputs = [self.__to_shared(mat) for mat in mats]
+        # Most actions keep the size of the mat or reduce it, bigger results are placed
+        # into blocks created by workers
+        outputs = [self.__blocks.acquire(mat.nbytes) for mat in mats]
+        futures: List[Future] = []
+        try:
+            for action, (mat, block), output in zip(actions, inputs, outputs):
+                futures.append(self.__executor.submit(_process_shared, action,
+                                                      (block.name, mat.shape, mat.dtype.str),
+                                                      output.name, output.size))
+            descriptors = [future.result() for future in futures]
+        except BaseException:
+            # Sibling tasks still write into their blocks, so no block is released
+            # until every task is done
+            wait(futures)
+            self.__release_outputs(outputs, futures)
+            raise
+        finally:
+            # Keep leased inputs alive until workers are done with them
+            del inputs
+
+        results = []
+        for output, (name, shape, dtype) in zip(outputs, descriptors):
+            if name != output.name:
+                self.__blocks.release(output)
+                output = self.__blocks.adopt(name)
+            results.append(self.__blocks.lease(output, shape, np.dtype(dtype)))
+        return results
+
+    def get_block_count(self) -> int:
+        return self.__blocks.get_block_count()
+
+    def __release_outputs(self, outputs: List[SharedMemory], futures: List[Future]):
+        for index, output in enumerate(outputs):
+            self.__blocks.release(output)
+            future = futures[index] if index < len(futures) else None
+            if future is None or future.cancelled() or future.exception() is not None:
+                continue
+            # Blocks created by workers for bigger results belong to the pool as well
+            name = future.result()[0]
+            if name != output.name:
+                self.__blocks.release(self.__blocks.adopt(name))
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
+        self.__blocks.close()
+
+    def __to_shared(self, mat: np.ndarray) -> Tuple[np.ndarray, SharedMemory]:
+        block = self.__blocks.get_leased_block(mat)
+        if block is not None and mat.flags.c_contiguous:
+            return mat, block
+        shared = self.create_mat(mat.shape, mat.dtype)
+        np.copyto(shared, mat)
+        return shared, self.__blocks.get_leased_block(shared)
+
+
+_worker_processor: Optional[ActionProcessor] = None
+# Blocks stay attached between tasks, attaching is a system call and a new mapping
+_worker_blocks: 'OrderedDict[str, SharedMemory]' = OrderedDict()
+_MAX_WORKER_BLOCKS = 32
+
+
+def _init_worker():
+    global _worker_processor
+    _worker_processor = ActionProcessor()
+
+
+def _attach(name: str) -> SharedMemory:
+    block = _worker_blocks.get(name)
+    if block is None:
+        block = SharedMemory(name=name)
+        _worker_blocks[name] = block
+        while len(_worker_blocks) > _MAX_WORKER_BLOCKS:
+            _, evicted = _worker_blocks.popitem(last=False)
+            evicted.close()
+    _worker_blocks.move_to_end(name)
+    return block
+
+
+def _process_shared(action: Action, source: _MatDescriptor, output_name: str,
+                    output_size: int) -> _MatDescriptor:
+    name, shape, dtype = source
+    mat = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attach(name).buf)
+    compiled_action = _worker_processor.compile(action)
+    result_shape, result_dtype = compiled_action.get_output_spec(mat)
+    result_nbytes = int(np.prod(result_shape)) * result_dtype.itemsize
+    if result_nbytes <= output_size:
+        output = _attach(output_name)
+    else:
+        # The parent adopts the block and unlinks it when the pool is closed
+        output = SharedMemory(create=True, size=result_nbytes)
+        _worker_blocks[output.name] = output
+    # The result is written straight into shared memory, without a copy
+    target = np.ndarray(result_shape, dtype=result_dtype, buffer=output.buf)
+    compiled_action(mat, target)
+    del mat, target
+    return output.name, tuple(result_shape), result_dtype.str
@@ -0,0 +1,78 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict
+
+import numpy as np
+import cv2.cv2 as cv
+
+
+class DerivedPlaneCache:
+    """
+        Cache of color conversions (HSV, grayscale, Lab, ...) of source mats.
+        Conversions are bound to the lifetime of the source mat object: they are dropped
+        once the source is garbage collected or when more than 'max_sources' sources
+        were used after it. Cached planes are read-only.
+    """
+
+    HSV = cv.COLOR_BGR2HSV
+    GRAY = cv.COLOR_BGR2GRAY
+    LAB = cv.COLOR_BGR2Lab
+
+    def __init__(self, max_sources: int = 2):
+        self.__max_sources = max_sources
+        self.__sources: 'OrderedDict[int, weakref.ref]' = OrderedDict()
+        self.__planes: Dict[int, Dict[int, np.ndarray]] = {}
+        self.__conversions = 0
+        self.__lock = threading.Lock()
+
+    def get(self, mat_bgr: np.ndarray, code: int) -> np.ndarray:
+        source_id = id(mat_bgr)
+        with self.__lock:
+            source_ref = self.__sources.get(source_id)
+            if source_ref is not None and source_ref() is mat_bgr:
+                self.__sources.move_to_end(source_id)
+                plane = self.__planes[source_id].get(code)
+                if plane is not None:
+                    return plane
+        # Conversion runs without the lock, a concurrent duplicate is cheaper than waiting
+        plane = cv.cvtColor(mat_bgr, code)
+        plane.setflags(write=False)
+        with self.__lock:
+            self.__conversions += 1
+            if source_id not in self.__sources:
+                self.__sources[source_id] = weakref.ref(
+                    mat_bgr, lambda _: self.__drop_source(source_id))
+                self.__planes[source_id] = {}
+                while len(self.__sources) > self.__max_sources:
+                    evicted_id, _ = self.__sources.popitem(last=False)
+                    self.__planes.pop(evicted_id, None)
+            self.__sources.move_to_end(source_id)
+            self.__planes[source_id][code] = plane
+        return plane
+
+    def get_gray(self, mat: np.ndarray) -> np.ndarray:
+        return mat if mat.ndim == 2 else self.get(mat, self.GRAY)
+
+    def get_conversion_count(self) -> int:
+        return self.__conversions
+
+    def __drop_source(self, source_id: int):
+        with self.__lock:
+            self.__sources.pop(source_id, None)
+            self.__planes.pop(source_id, None)
@@ -0,0 +1,108 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import math
+import threading
+import weakref
+from typing import List, Optional
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actions import Action, ActionType
+
+
+class MatPyramid:
+    """
+        Lazily built Gaussian pyramid (cv.pyrDown) of the current source mat.
+        Level 0 is the source itself, every next level is 2 times smaller in each dimension.
+        Levels are rebuilt only when a different source mat is passed. Only derived levels
+        are kept: the source is referenced weakly and its levels are dropped with it.
+    """
+
+    def __init__(self, max_level: int = 5):
+        self.__max_level = max_level
+        self.__source_ref: Optional[weakref.ref] = None
+        # Derived levels 1..n, level i is at index i - 1
+        self.__levels: List[np.ndarray] = []
+        self.__lock = threading.Lock()
+
+    def choose_level(self, mat: np.ndarray, max_pixels: int) -> int:
+        height, width = mat.shape[:2]
+        level = 0
+        while level < self.__max_level and height * width > max_pixels \
+                and min(height, width) > 1:
+            height, width = (height + 1) // 2, (width + 1) // 2
+            level += 1
+        return level
+
+    def get_level(self, mat: np.ndarray, level: int) -> np.ndarray:
+        level = min(level, self.__max_level)
+        if level == 0:
+            return mat
+        with self.__lock:
+            if self.__source_ref is None or self.__source_ref() is not mat:
+                self.__source_ref = weakref.ref(mat, self.__on_source_collected)
+                self.__levels = []
+            while len(self.__levels) < level:
+                self.__levels.append(cv.pyrDown(self.__levels[-1] if self.__levels else mat))
+            return self.__levels[level - 1]
+
+    def get_level_count(self) -> int:
+        return len(self.__levels)
+
+    def __on_source_collected(self, source_ref: weakref.ref):
+        # Called by the garbage collector, possibly while the lock is held by this thread
+        if self.__source_ref is source_ref:
+            self.__levels = []
+
+
+def scale_action(action: Action, level: int) -> Action:
+    """
+        Returns the action with spatial params (kernel anchor, Hough distances and radii,
+        component areas and bbox) scaled for the given pyramid level, so the result looks
+        like a downscaled result of the source action.
+        The HOUGH_GRADIENT accumulator threshold (param2) counts votes of edge points, which
+        shrink with the circle circumference, so it is scaled too. For HOUGH_GRADIENT_ALT
+        param2 is a circle perfectness in 0..1 and doesn't depend on the size.
+    """
+    if level == 0:
+        return action
+    factor = 2 ** level
+    params = dict(action.params)
+    if action.action_type in (ActionType.EROSION, ActionType.DILATION,
+                              ActionType.MORPH_GRADIENT, ActionType.MORPH_OPENING,
+                              ActionType.MORPH_CLOSING):
+        anchor = params['anchor']
+        params['anchor'] = max(1, int(round(anchor / factor))) if anchor > 0 else 0
+    elif action.action_type == ActionType.HOUGH_CIRCLE:
+        params['min_dist'] = max(1.0, params['min_dist'] / factor)
+        params['min_radius'] = int(round(params['min_radius'] / factor))
+        if params['method'] == cv.HOUGH_GRADIENT:
+            params['param2'] = max(1.0, params['param2'] / factor)
+        # Zero and negative max radius have special meaning for OpenCV
+        if params['max_radius'] > 0:
+            params['max_radius'] = max(1, int(round(params['max_radius'] / factor)))
+    elif action.action_type == ActionType.CONNECTED_COMPONENTS:
+        area_factor = factor * factor
+        if params.get('min_area'):
+            params['min_area'] = int(params['min_area'] // area_factor)
+        if params.get('max_area') is not None:
+            params['max_area'] = int(math.ceil(params['max_area'] / area_factor))
+        if params.get('bbox') is not None:
+            x, y, width, height = params['bbox']
+            params['bbox'] = [x // factor, y // factor, -(-(x + width) // factor) - x // factor,
+                              -(-(y + height) // factor) - y // factor]
+    return Action(action.action_type, params)
@@ -0,0 +1,283 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Sequence, Union
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.planes import DerivedPlaneCache
+
+
+@dataclass(frozen=True)
+class ChannelStats:
+    mean: float
+    stddev: float
+    min: float
+    max: float
+
+
+@dataclass(frozen=True)
+class RegionStats:
+    pixel_count: int
+    channels: Dict[str, ChannelStats]
+
+
+@dataclass(frozen=True)
+class RectSelection:
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class BrushSelection:
+    """
+        Selection painted by a round brush, stored as merged horizontal spans per row,
+        so statistics are queried per span and don't depend on the selected area.
+        The mask of selected pixels is updated as the brush moves, pixels which were not
+        selected before are also logged as spans in painting order (see 'get_added_spans'),
+        so min/max can be updated from new pixels only.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.__width = width
+        self.__height = height
+        self.__rows: Dict[int, List[Tuple[int, int]]] = {}
+        self.__mask: Optional[np.ndarray] = None
+        self.__added_spans: List[Tuple[int, int, int]] = []
+
+    def add_circle(self, center_x: int, center_y: int, radius: int):
+        for y in range(max(0, center_y - radius), min(self.__height, center_y + radius + 1)):
+            half_width = int(np.sqrt(radius * radius - (y - center_y) ** 2))
+            x0 = max(0, center_x - half_width)
+            x1 = min(self.__width, center_x + half_width + 1)
+            if x0 < x1:
+                self.__add_span(y, x0, x1)
+                self.__mark(y, x0, x1)
+
+    def __mark(self, y: int, x0: int, x1: int):
+        if self.__mask is None:
+            self.__mask = np.zeros((self.__height, self.__width), dtype=bool)
+        row = self.__mask[y, x0:x1]
+        unselected = np.flatnonzero(~row)
+        if len(unselected) == 0:
+            return
+        breaks = np.flatnonzero(np.diff(unselected) > 1)
+        starts = np.concatenate(([unselected[0]], unselected[breaks + 1])) + x0
+        ends = np.concatenate((unselected[breaks], [unselected[-1]])) + x0 + 1
+        self.__added_spans.extend((y, int(start), int(end)) for start, end in zip(starts, ends))
+        row[:] = True
+
+    def __add_span(self, y: int, x0: int, x1: int):
+        merged = []
+        for span_x0, span_x1 in self.__rows.get(y, []):
+            if span_x1 < x0 or span_x0 > x1:
+                merged.append((span_x0, span_x1))
+            else:
+                x0, x1 = min(x0, span_x0), max(x1, span_x1)
+        merged.append((x0, x1))
+        merged.sort()
+        self.__rows[y] = merged
+
+    def get_spans(self) -> np.ndarray:
+        """
+            Returns array of (y, x0, x1) rows, x1 is exclusive.
+        """
+        spans = [(y, x0, x1) for y, row in self.__rows.items() for x0, x1 in row]
+        return np.array(spans, dtype=np.int64).reshape(-1, 3)
+
+    def get_added_spans(self, start: int = 0) -> np.ndarray:
+        """
+            Returns (y, x0, x1) rows of pixels selected after the first 'start' added spans,
+            every pixel is added once.
+        """
+        return np.array(self.__added_spans[start:], dtype=np.int64).reshape(-1, 3)
+
+    def get_added_span_count(self) -> int:
+        return len(self.__added_spans)
+
+    def get_mask(self) -> np.ndarray:
+        mask = self.__mask if self.__mask is not None \
+            else np.zeros((self.__height, self.__width), dtype=bool)
+        view = mask.view()
+        view.setflags(write=False)
+        return view
+
+    def is_empty(self) -> bool:
+        return len(self.__rows) == 0
+
+
+class RegionStatistics:
+    """
+        Statistics of rectangle and brush regions of one mat.
+        Sums and squared sums come from integral images (cv.integral2) computed once per
+        color space, so mean and stddev of a rectangle cost O(1) and of a brush selection
+        O(number of spans) regardless of the region area. Min/max can't be derived from
+        integral images and are not constant time: for rectangles they come from per-block
+        min/max tables plus exact border strips, O(area / BLOCK_SIZE^2 + perimeter *
+        BLOCK_SIZE); for the brush selection queried last they are updated from pixels
+        painted since the previous query, O(new pixels), and a different selection is
+        reduced over all of its pixels once.
+
+        Integral images take 16 bytes per pixel and channel, HSV ones are computed only
+        when HSV statistics are requested.
+    """
+
+    BLOCK_SIZE = 32
+
+    def __init__(self, mat_bgr: np.ndarray, planes: Optional[DerivedPlaneCache] = None):
+        self.__mat_bgr = mat_bgr
+        self.__planes = planes if planes is not None else DerivedPlaneCache()
+        self.__integrals: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                          Sequence[str]]] = {}
+        self.__block_extremes: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # Running min/max of the last queried brush selection per mat: (spans done, min, max)
+        self.__brush_selection: Optional[BrushSelection] = None
+        self.__brush_extremes: Dict[int, Tuple[int, np.ndarray, np.ndarray]] = {}
+
+    def get_mat(self) -> np.ndarray:
+        return self.__mat_bgr
+
+    def selection(self, selection: Union[RectSelection, BrushSelection],
+                  include_hsv: bool = True) -> Optional[RegionStats]:
+        if isinstance(selection, RectSelection):
+            return self.rect(selection.x, selection.y, selection.width, selection.height,
+                             include_hsv)
+        return self.brush(selection, include_hsv)
+
+    def rect(self, x: int, y: int, width: int, height: int,
+             include_hsv: bool = True) -> Optional[RegionStats]:
+        mat_height, mat_width = self.__mat_bgr.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(mat_width, x + width), min(mat_height, y + height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return self.__collect(np.array([[y0, x0, x1]]), y1 - y0, include_hsv,
+                              lambda mat: self.__rect_extremes(mat, x0, y0, x1, y1))
+
+    def brush(self, selection: BrushSelection, include_hsv: bool = True) -> Optional[RegionStats]:
+        if selection.is_empty():
+            return None
+        if self.__brush_selection is not selection:
+            self.__brush_selection = selection
+            self.__brush_extremes.clear()
+        return self.__collect(selection.get_spans(), 1, include_hsv,
+                              lambda mat: self.__brush_extremes_of(selection, mat))
+
+    def __brush_extremes_of(self, selection: BrushSelection,
+                            mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        done, minimums, maximums = self.__brush_extremes.get(id(mat), (0, None, None))
+        for y, x0, x1 in selection.get_added_spans(done):
+            pixels = mat[y, x0:x1].reshape(-1, self.__depth(mat))
+            span_minimums, span_maximums = pixels.min(axis=0), pixels.max(axis=0)
+            minimums = span_minimums if minimums is None else np.minimum(minimums,
+                                                                         span_minimums)
+            maximums = span_maximums if maximums is None else np.maximum(maximums,
+                                                                         span_maximums)
+        self.__brush_extremes[id(mat)] = (selection.get_added_span_count(), minimums, maximums)
+        return minimums, maximums
+
+    def __collect(self, spans: np.ndarray, rows_per_span: int, include_hsv: bool,
+                  extremes) -> RegionStats:
+        channels: Dict[str, ChannelStats] = {}
+        count = int(((spans[:, 2] - spans[:, 1]) * rows_per_span).sum())
+        color_spaces = ['bgr', 'hsv'] if include_hsv and self.__is_bgr() else ['bgr']
+        for color_space in color_spaces:
+            mat, integral, sq_integral, names = self.__get_integral(color_space)
+            sums = self.__sum_spans(integral, spans, rows_per_span)
+            sq_sums = self.__sum_spans(sq_integral, spans, rows_per_span)
+            means = sums / count
+            stddevs = np.sqrt(np.maximum(sq_sums / count - means * means, 0))
+            minimums, maximums = extremes(mat)
+            for i, name in enumerate(names):
+                channels[name] = ChannelStats(float(means[i]), float(stddevs[i]),
+                                              float(minimums[i]), float(maximums[i]))
+        return RegionStats(pixel_count=count, channels=channels)
+
+    def __rect_extremes(self, mat: np.ndarray, x0: int, y0: int, x1: int,
+                        y1: int) -> Tuple[np.ndarray, np.ndarray]:
+        depth = self.__depth(mat)
+        block = self.BLOCK_SIZE
+        block_y0, block_x0 = -(-y0 // block), -(-x0 // block)
+        block_y1 = min(y1 // block, mat.shape[0] // block)
+        block_x1 = min(x1 // block, mat.shape[1] // block)
+        if block_y0 >= block_y1 or block_x0 >= block_x1:
+            pixels = mat[y0:y1, x0:x1].reshape(-1, depth)
+            return pixels.min(axis=0), pixels.max(axis=0)
+
+        block_minimums, block_maximums = self.__get_block_extremes(mat)
+
+        inner_y0, inner_y1 = block_y0 * block, block_y1 * block
+        inner_x0, inner_x1 = block_x0 * block, block_x1 * block
+        parts = [(block_minimums[block_y0:block_y1, block_x0:block_x1].reshape(-1, depth),
+                  block_maximums[block_y0:block_y1, block_x0:block_x1].reshape(-1, depth))]
+        # Strips around full blocks are reduced exactly
+        for strip in (mat[y0:inner_y0, x0:x1], mat[inner_y1:y1, x0:x1],
+                      mat[inner_y0:inner_y1, x0:inner_x0], mat[inner_y0:inner_y1, inner_x1:x1]):
+            if strip.size > 0:
+                pixels = strip.reshape(-1, depth)
+                parts.append((pixels, pixels))
+        minimums = np.min([part[0].min(axis=0) for part in parts], axis=0)
+        maximums = np.max([part[1].max(axis=0) for part in parts], axis=0)
+        return minimums, maximums
+
+    def __get_block_extremes(self, mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self.__block_extremes.get(id(mat))
+        if cached is None:
+            block = self.BLOCK_SIZE
+            rows, columns = mat.shape[0] // block, mat.shape[1] // block
+            # With anchor (0, 0) every pixel gets min/max of the block starting at it,
+            # OpenCV runs rect kernels separably, which is much faster than NumPy reductions
+            kernel = np.ones((block, block), dtype=np.uint8)
+            shape = (rows, columns, self.__depth(mat))
+            cached = (cv.erode(mat, kernel, anchor=(0, 0))[:rows * block:block,
+                                                           :columns * block:block].reshape(shape),
+                      cv.dilate(mat, kernel, anchor=(0, 0))[:rows * block:block,
+                                                            :columns * block:block].reshape(shape))
+            self.__block_extremes[id(mat)] = cached
+        return cached
+
+    @staticmethod
+    def __sum_spans(integral: np.ndarray, spans: np.ndarray, rows_per_span: int) -> np.ndarray:
+        y0, x0, x1 = spans[:, 0], spans[:, 1], spans[:, 2]
+        y1 = y0 + rows_per_span
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return sums.reshape(len(spans), -1).sum(axis=0)
+
+    def __get_integral(self, color_space: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                                        Sequence[str]]:
+        cached = self.__integrals.get(color_space)
+        if cached is None:
+            if color_space == 'hsv':
+                mat = self.__planes.get(self.__mat_bgr, DerivedPlaneCache.HSV)
+                names = ['h', 's', 'v']
+            elif self.__is_bgr():
+                mat, names = self.__mat_bgr, ['b', 'g', 'r']
+            else:
+                mat = self.__mat_bgr
+                names = ['gray'] if mat.ndim == 2 else [f'c{i}' for i in range(mat.shape[2])]
+            integral, sq_integral = cv.integral2(mat, sdepth=cv.CV_64F, sqdepth=cv.CV_64F)
+            cached = (mat, integral, sq_integral, names)
+            self.__integrals[color_space] = cached
+        return cached
+
+    def __is_bgr(self) -> bool:
+        return self.__mat_bgr.ndim == 3 and self.__mat_bgr.shape[2] == 3
+
+    @staticmethod
+    def __depth(mat: np.ndarray) -> int:
+        return 1 if mat.ndim == 2 else mat.shape[2]
@@ -0,0 +1,129 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Hashable
+
+import numpy as np
+
+from cvisiontool.core.actions import Action
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    total_bytes: int
+    max_bytes: int
+
+
+class ActionResultCache:
+    """
+        LRU cache of action results keyed by (input mat fingerprint, action type, params).
+        Entries are evicted when the total 'nbytes' of cached results exceeds 'max_bytes'.
+
+        Supported fingerprints:
+            - identity: the input mat object itself, entries are dropped once it is
+              garbage collected. It's cheap, but relies on mats not being changed in place.
+            - content: hash of the mat bytes, survives copies of the same data.
+        Cached results are read-only.
+    """
+
+    IDENTITY = 'identity'
+    CONTENT = 'content'
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, fingerprint: str = IDENTITY):
+        if fingerprint not in (self.IDENTITY, self.CONTENT):
+            raise ValueError(f'Unsupported fingerprint: {fingerprint}')
+        self.__max_bytes = max_bytes
+        self.__fingerprint = fingerprint
+        self.__entries: 'OrderedDict[Tuple[Hashable, str], np.ndarray]' = OrderedDict()
+        self.__source_refs: Dict[int, weakref.ref] = {}
+        self.__total_bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__lock = threading.RLock()
+
+    def get(self, action: Action, mat: np.ndarray) -> Optional[np.ndarray]:
+        key = self.__make_key(action, mat)
+        with self.__lock:
+            result = self.__entries.get(key)
+            if result is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return result
+
+    def put(self, action: Action, mat: np.ndarray, result: np.ndarray) -> np.ndarray:
+        if result.nbytes > self.__max_bytes:
+            return result
+        result.setflags(write=False)
+        key = self.__make_key(action, mat)
+        with self.__lock:
+            if self.__fingerprint == self.IDENTITY:
+                self.__track_source(mat)
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__total_bytes -= previous.nbytes
+            self.__entries[key] = result
+            self.__total_bytes += result.nbytes
+            while self.__total_bytes > self.__max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__total_bytes -= evicted.nbytes
+                self.__evictions += 1
+        return result
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__source_refs.clear()
+            self.__total_bytes = 0
+
+    def get_stats(self) -> CacheStats:
+        with self.__lock:
+            return CacheStats(hits=self.__hits, misses=self.__misses,
+                              evictions=self.__evictions, entries=len(self.__entries),
+                              total_bytes=self.__total_bytes, max_bytes=self.__max_bytes)
+
+    def __make_key(self, action: Action, mat: np.ndarray) -> Tuple[Hashable, str]:
+        params = json.dumps(action.params, sort_keys=True, default=str)
+        return self.__fingerprint_of(mat), f'{action.action_type.value}:{params}'
+
+    def __fingerprint_of(self, mat: np.ndarray) -> Hashable:
+        if self.__fingerprint == self.IDENTITY:
+            return id(mat)
+        digest = hashlib.blake2b(np.ascontiguousarray(mat).data, digest_size=16)
+        return mat.shape, mat.dtype.str, digest.hexdigest()
+
+    def __track_source(self, mat: np.ndarray):
+        source_id = id(mat)
+        if source_id not in self.__source_refs:
+            self.__source_refs[source_id] = weakref.ref(
+                mat, lambda _: self.__drop_source(source_id))
+
+    def __drop_source(self, source_id: int):
+        with self.__lock:
+            self.__source_refs.pop(source_id, None)
+            for key in [key for key in self.__entries.keys() if key[0] == source_id]:
+                self.__total_bytes -= self.__entries.pop(key).nbytes
@@ -0,0 +1,75 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import tempfile
+from typing import Optional
+
+from cvisiontool.core.historymanager import HistoryManager
+from cvisiontool.core.matstore import MatStore
+
+SESSION_FORMAT_VERSION = 1
+SESSION_EXTENSION = '.cvt'
+# Sessions of one directory share the store, so equal results are kept once
+DEFAULT_STORE_DIR_NAME = 'cvisiontool-store'
+
+
+def get_default_store(session_path: str) -> MatStore:
+    return MatStore(os.path.join(os.path.dirname(os.path.abspath(session_path)),
+                                 DEFAULT_STORE_DIR_NAME))
+
+
+def save_session(path: str, history_manager: HistoryManager, store: Optional[MatStore] = None):
+    """
+        Saves the action chain of history into a JSON session file and stored results
+        into the mat store. The store path is kept relative to the session file, so
+        a directory with sessions and their store can be moved as a whole.
+    """
+    store = store if store is not None else get_default_store(path)
+    session_dir = os.path.dirname(os.path.abspath(path))
+    session = {
+        'version': SESSION_FORMAT_VERSION,
+        'store': os.path.relpath(os.path.abspath(store.get_directory()), session_dir),
+        'entries': history_manager.export_entries(store)
+    }
+    descriptor, temp_path = tempfile.mkstemp(dir=session_dir, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(session, file, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_session(path: str, history_manager: HistoryManager) -> MatStore:
+    """
+        Replaces history with the saved one. Only the session file is read here,
+        results are loaded from the store when they are needed. History is kept as it was
+        if the session refers to results which are missing in the store.
+    """
+    with open(path, 'r') as file:
+        session = json.load(file)
+    if not isinstance(session, dict) or session.get('version') != SESSION_FORMAT_VERSION:
+        raise ValueError(f'File {path} is not a session of version {SESSION_FORMAT_VERSION}')
+    store = MatStore(os.path.join(os.path.dirname(os.path.abspath(path)), session['store']))
+    missing = [record['mat'] for record in session['entries']
+               if record.get('mat') is not None and not store.contains(record['mat'])]
+    if len(missing) > 0:
+        raise ValueError(f'Store {store.get_directory()} does not contain {len(missing)} '
+                         f'result(s) of session {path}, e.g. {missing[0]}')
+    history_manager.restore_entries(session['entries'], store)
+    return store
@@ -0,0 +1,108 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from typing import List, Optional, Tuple, Any
+
+import numpy as np
+
+from cvisiontool.core.actionproc import ActionProcessor, run_compiled_chain
+from cvisiontool.core.actions import Action, ActionType
+from cvisiontool.core.bufferpool import BufferPool
+
+
+def get_action_halo(action: Action) -> int:
+    """
+        Returns how many pixels around a tile must be read, so the action produces
+        exactly the same values inside the tile as it does for the whole image.
+    """
+    if action.action_type in (ActionType.EROSION, ActionType.DILATION,
+                              ActionType.MORPH_GRADIENT):
+        return action.params['anchor']
+    elif action.action_type in (ActionType.MORPH_OPENING, ActionType.MORPH_CLOSING):
+        return 2 * action.params['anchor']
+    elif action.action_type == ActionType.IN_RANGE:
+        return 0
+    raise ValueError(f'Action can not be executed by tiles: {action.to_string()}')
+
+
+def open_raw_image(path: str, shape: Tuple[int, ...], dtype: Any = np.uint8,
+                   offset: int = 0) -> np.memmap:
+    """
+        Maps a raw (headerless) row-major image file, e.g. a BGR dump of a scanner, without
+        reading it into memory.
+    """
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset)
+
+
+def open_npy_image(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode='r')
+
+
+class TiledActionExecutor:
+    """
+        The executor runs a chain of actions over an image tile by tile and writes the result
+        into a memory-mapped .npy file, so peak memory depends on the tile size only.
+
+        The source can be any object with 'shape', 'dtype' and 2D slicing, e.g. np.memmap
+        (see 'open_raw_image', 'open_npy_image'), h5py/zarr datasets. Every tile is read with
+        a halo equal to the sum of halos of all actions (see 'get_action_halo'), the whole
+        chain is applied to it and the halo is cropped, so results at tile borders are the
+        same as for the whole image. Tiles and outputs of actions are taken from a buffer
+        pool, so only border tiles of a different size allocate.
+    """
+
+    def __init__(self, action_processor: Optional[ActionProcessor] = None,
+                 tile_size: int = 1024, buffer_pool: Optional[BufferPool] = None):
+        if tile_size < 1:
+            raise ValueError(f'"tile_size" must be positive. Provided value: {tile_size}')
+        self.__action_processor = action_processor if action_processor is not None \
+            else ActionProcessor()
+        self.__tile_size = tile_size
+        self.__buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+
+    def get_halo(self, actions: List[Action]) -> int:
+        return sum(get_action_halo(action) for action in actions)
+
+    def process(self, actions: List[Action], source: Any, output_path: str) -> np.memmap:
+        height, width = source.shape[:2]
+        if height == 0 or width == 0:
+            raise ValueError(f'Source image is empty. Provided shape: {source.shape}')
+        halo = self.get_halo(actions)
+        compiled_actions = [self.__action_processor.compile(action) for action in actions]
+        output: Optional[np.memmap] = None
+        for y in range(0, height, self.__tile_size):
+            for x in range(0, width, self.__tile_size):
+                tile_height = min(self.__tile_size, height - y)
+                tile_width = min(self.__tile_size, width - x)
+                top, left = max(0, y - halo), max(0, x - halo)
+                bottom = min(height, y + tile_height + halo)
+                right = min(width, x + tile_width + halo)
+
+                tile = self.__buffer_pool.acquire((bottom - top, right - left) + source.shape[2:],
+                                                  source.dtype)
+                tile[...] = source[top:bottom, left:right]
+                processed = run_compiled_chain(compiled_actions, tile, self.__buffer_pool)
+                result = processed[y - top:y - top + tile_height,
+                                   x - left:x - left + tile_width]
+
+                if output is None:
+                    output = np.lib.format.open_memmap(output_path, mode='w+',
+                                                       dtype=result.dtype,
+                                                       shape=(height, width) + result.shape[2:])
+                output[y:y + tile_height, x:x + tile_width] = result
+                self.__buffer_pool.release(processed)
+            # Written pages are flushed by tile rows, so they can be dropped from RAM
+            output.flush()
+        return output
@@ -0,0 +1,257 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Callable
+
+import numpy as np
+
+from cvisiontool.core.actions import Action
+
+
+@dataclass(frozen=True)
+class Span:
+    """
+        'start_ns' is taken from time.perf_counter_ns, 'cpu_ns' is CPU time of the thread.
+    """
+    name: str
+    category: str
+    start_ns: int
+    wall_ns: int
+    cpu_ns: int
+    thread_id: int
+    args: Dict[str, Any]
+
+    def to_trace_event(self, pid: int) -> Dict[str, Any]:
+        args = dict(self.args)
+        args['cpu_ms'] = self.cpu_ns / 1_000_000
+        return {
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': self.start_ns / 1000,
+            'dur': self.wall_ns / 1000,
+            'pid': pid,
+            'tid': self.thread_id,
+            'args': args
+        }
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan:
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: Dict[str, Any]):
+        self.__tracer = tracer
+        self.__name = name
+        self.__category = category
+        self.__args = args
+        self.__start_ns = 0
+        self.__cpu_start_ns = 0
+
+    def __enter__(self):
+        self.__cpu_start_ns = time.thread_time_ns()
+        self.__start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_ns = time.perf_counter_ns() - self.__start_ns
+        cpu_ns = time.thread_time_ns() - self.__cpu_start_ns
+        if exc_type is not None:
+            self.__args['error'] = repr(exc_value)
+        self.__tracer.record(Span(self.__name, self.__category, self.__start_ns, wall_ns, cpu_ns,
+                                  threading.get_ident(), self.__args))
+        return False
+
+
+def describe_mat(mat: Optional[np.ndarray]) -> Dict[str, Any]:
+    if mat is None:
+        return {}
+    return {'shape': list(mat.shape), 'dtype': str(mat.dtype)}
+
+
+class Tracer:
+    """
+        Collects spans of expensive operations. While the tracer is disabled 'span' returns
+        a shared no-op context manager and doesn't look at its arguments, so mats and
+        actions are described only for recorded spans.
+
+        Spans are kept in a ring buffer of 'max_spans' and passed to listeners, listeners
+        are called on the thread which finished the span.
+    """
+
+    def __init__(self, enabled: bool = False, max_spans: int = 100_000):
+        self.__enabled = enabled
+        self.__spans: 'deque[Span]' = deque(maxlen=max_spans)
+        self.__listeners: List[Callable[[Span], None]] = []
+        self.__lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.__enabled
+
+    def set_enabled(self, enabled: bool):
+        self.__enabled = enabled
+
+    def add_listener(self, listener: Callable[[Span], None]):
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Span], None]):
+        with self.__lock:
+            self.__listeners.remove(listener)
+
+    def span(self, name: str, category: str, action: Optional[Action] = None,
+             mat: Optional[np.ndarray] = None, **args):
+        if not self.__enabled:
+            return _NULL_SPAN
+        if action is not None:
+            args['action_type'] = action.action_type.value
+            args['params'] = action.params
+        if mat is not None:
+            args.update(describe_mat(mat))
+        return _ActiveSpan(self, name, category, args)
+
+    def record(self, span: Span):
+        with self.__lock:
+            self.__spans.append(span)
+            listeners = list(self.__listeners)
+        for listener in listeners:
+            listener(span)
+
+    def get_spans(self) -> List[Span]:
+        with self.__lock:
+            return list(self.__spans)
+
+    def clear(self):
+        with self.__lock:
+            self.__spans.clear()
+
+    def export_chrome_trace(self, path: str):
+        """
+            Writes spans in Chrome trace-event format, the file can be opened in
+            chrome://tracing or https://ui.perfetto.dev
+        """
+        pid = os.getpid()
+        with open(path, 'w') as file:
+            json.dump({
+                'traceEvents': [span.to_trace_event(pid) for span in self.get_spans()],
+                'displayTimeUnit': 'ms'
+            }, file, default=str)
+
+
+class LatencyHistogram:
+    """
+        Tracer listener which keeps wall times of the last 'window' action spans per action
+        type, spans of other categories are ignored. Bucket bounds are in milliseconds,
+        the last bucket is unbounded.
+    """
+
+    CATEGORY = 'action'
+    BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, window: int = 256):
+        self.__window = window
+        self.__latencies: Dict[str, 'deque[float]'] = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, span: Span):
+        action_type = span.args.get('action_type')
+        if span.category != self.CATEGORY or action_type is None:
+            return
+        with self.__lock:
+            latencies = self.__latencies.get(action_type)
+            if latencies is None:
+                latencies = deque(maxlen=self.__window)
+                self.__latencies[action_type] = latencies
+            latencies.append(span.wall_ns / 1_000_000)
+
+    def get_action_types(self) -> List[str]:
+        with self.__lock:
+            return list(self.__latencies.keys())
+
+    def get_buckets(self, action_type: str) -> List[int]:
+        latencies = self.__get_latencies(action_type)
+        counts = np.bincount(np.searchsorted(self.BUCKET_BOUNDS_MS, latencies, side='left'),
+                             minlength=len(self.BUCKET_BOUNDS_MS) + 1)
+        return counts.tolist()
+
+    def get_summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for action_type in self.get_action_types():
+            latencies = self.__get_latencies(action_type)
+            if len(latencies) == 0:
+                continue
+            p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+            summary[action_type] = {
+                'count': len(latencies),
+                'p50_ms': float(p50),
+                'p90_ms': float(p90),
+                'p99_ms': float(p99),
+                'max_ms': float(np.max(latencies))
+            }
+        return summary
+
+    def __get_latencies(self, action_type: str) -> np.ndarray:
+        with self.__lock:
+            return np.array(self.__latencies.get(action_type, ()), dtype=np.float64)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def enable_tracing_from_environment(variable: str = 'CVISIONTOOL_TRACE') -> Optional[Tracer]:
+    """
+        If the environment variable is set, enables the global tracer and writes a Chrome
+        trace to the path from the variable on exit, latency summary per action type is
+        written next to it with '.latency.json' suffix.
+    """
+    path = os.environ.get(variable)
+    if not path:
+        return None
+    tracer = get_tracer()
+    histogram = LatencyHistogram()
+    tracer.add_listener(histogram)
+    tracer.set_enabled(True)
+
+    def export():
+        tracer.export_chrome_trace(path)
+        with open(path + '.latency.json', 'w') as file:
+            json.dump(histogram.get_summary(), file, indent=2)
+
+    atexit.register(export)
+    return tracer
@@ -0,0 +1,239 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Iterator, Any
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor, run_compiled_chain
+from cvisiontool.core.actions import Action
+from cvisiontool.core.bufferpool import BufferPool
+
+_END_OF_STREAM = object()
+
+
+@dataclass(frozen=True)
+class VideoPipelineStats:
+    frames_decoded: int
+    frames_processed: int
+    frames_encoded: int
+    elapsed_sec: float
+    fps: float
+    decode_queue_depth: int
+    encode_queue_depth: int
+    max_decode_queue_depth: int
+    max_encode_queue_depth: int
+
+
+class _Stage(threading.Thread):
+    def __init__(self, name: str, target, stop_event: threading.Event):
+        super().__init__(name=name, daemon=True)
+        self.__target = target
+        self.__stop_event = stop_event
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            self.__target()
+        except BaseException as e:  # pylint: disable=broad-except
+            self.error = e
+            self.__stop_event.set()
+
+
+class VideoPipeline:
+    """
+        The pipeline applies the same chain of actions to every frame of a video.
+        Decoding, processing and encoding run on separate threads connected by bounded
+        queues, so decoding of frame N+1 overlaps processing of frame N. OpenCV releases
+        the GIL in VideoCapture, VideoWriter and most of image processing functions.
+
+        Use 'stream' to consume processed frames as a generator, or 'process_video' to
+        encode them into a file. 'get_stats' can be called from any thread while the
+        pipeline runs.
+
+        Frames are decoded into and processed into buffers of the pool, which are recycled
+        once the next action or the encoder is done with them, so after the queues are
+        filled frames and action outputs are not allocated anymore. Only morphology chains
+        run without allocations at all, see 'run_compiled_chain'. Frames yielded by
+        'stream' are not pooled and stay valid.
+    """
+
+    def __init__(self, actions: List[Action], action_processor: Optional[ActionProcessor] = None,
+                 queue_size: int = 8, fourcc: str = 'mp4v',
+                 buffer_pool: Optional[BufferPool] = None):
+        if queue_size < 1:
+            raise ValueError(f'"queue_size" must be positive. Provided value: {queue_size}')
+        action_processor = action_processor if action_processor is not None \
+            else ActionProcessor()
+        # Actions are validated and prepared once, not for every frame
+        self.__compiled_actions = [action_processor.compile(action) for action in actions]
+        self.__queue_size = queue_size
+        # Every queued frame and every frame in flight holds a buffer
+        self.__buffer_pool = buffer_pool if buffer_pool is not None \
+            else BufferPool(max_free_buffers_per_key=2 * queue_size + 6)
+        self.__fourcc = fourcc
+        self.__reset()
+
+    def __reset(self):
+        self.__stop_event = threading.Event()
+        self.__decode_queue: queue.Queue = queue.Queue(maxsize=self.__queue_size)
+        self.__encode_queue: queue.Queue = queue.Queue(maxsize=self.__queue_size)
+        self.__frames_decoded = 0
+        self.__frames_processed = 0
+        self.__frames_encoded = 0
+        self.__max_decode_queue_depth = 0
+        self.__max_encode_queue_depth = 0
+        self.__started_at = time.perf_counter()
+
+    def get_stats(self) -> VideoPipelineStats:
+        elapsed = time.perf_counter() - self.__started_at
+        return VideoPipelineStats(
+            frames_decoded=self.__frames_decoded,
+            frames_processed=self.__frames_processed,
+            frames_encoded=self.__frames_encoded,
+            elapsed_sec=elapsed,
+            fps=self.__frames_processed / elapsed if elapsed > 0 else 0.0,
+            decode_queue_depth=self.__decode_queue.qsize(),
+            encode_queue_depth=self.__encode_queue.qsize(),
+            max_decode_queue_depth=self.__max_decode_queue_depth,
+            max_encode_queue_depth=self.__max_encode_queue_depth)
+
+    def stream(self, input_path: str) -> Iterator[np.ndarray]:
+        self.__reset()
+        capture = self.__open_capture(input_path)
+        decoder = _Stage('video-decode', lambda: self.__decode(capture), self.__stop_event)
+        decoder.start()
+        try:
+            while True:
+                frame = self.__get(self.__decode_queue)
+                if frame is _END_OF_STREAM:
+                    break
+                yield self.__process(frame, pooled_result=False)
+        finally:
+            self.__stop_event.set()
+            decoder.join()
+            capture.release()
+        if decoder.error is not None:
+            raise decoder.error
+
+    def process_video(self, input_path: str, output_path: str) -> VideoPipelineStats:
+        self.__reset()
+        capture = self.__open_capture(input_path)
+        fps = capture.get(cv.CAP_PROP_FPS)
+        if fps is None or fps <= 0:
+            fps = 25.0
+        stages = [
+            _Stage('video-decode', lambda: self.__decode(capture), self.__stop_event),
+            _Stage('video-process', self.__process_all, self.__stop_event),
+            _Stage('video-encode', lambda: self.__encode(output_path, fps), self.__stop_event)
+        ]
+        try:
+            for stage in stages:
+                stage.start()
+            for stage in stages:
+                stage.join()
+        finally:
+            self.__stop_event.set()
+            capture.release()
+        for stage in stages:
+            if stage.error is not None:
+                raise stage.error
+        return self.get_stats()
+
+    @staticmethod
+    def __open_capture(input_path: str) -> Any:
+        capture = cv.VideoCapture(input_path)
+        if not capture.isOpened():
+            raise ValueError(f'Unable to open video: {input_path}')
+        return capture
+
+    def __decode(self, capture: Any):
+        buffer = None
+        while not self.__stop_event.is_set():
+            is_read, frame = capture.read(buffer)
+            if not is_read:
+                break
+            if frame is not buffer and buffer is not None:
+                self.__buffer_pool.release(buffer)
+            # The next frame is read into a pooled buffer of the same size
+            buffer = self.__buffer_pool.acquire_like(frame)
+            self.__frames_decoded += 1
+            if not self.__put(self.__decode_queue, frame):
+                return
+            self.__max_decode_queue_depth = max(self.__max_decode_queue_depth,
+                                                self.__decode_queue.qsize())
+        if buffer is not None:
+            self.__buffer_pool.release(buffer)
+        self.__put(self.__decode_queue, _END_OF_STREAM)
+
+    def __process(self, frame: np.ndarray, pooled_result: bool = True) -> np.ndarray:
+        frame = run_compiled_chain(self.__compiled_actions, frame, self.__buffer_pool,
+                                   pooled_result)
+        self.__frames_processed += 1
+        return frame
+
+    def __process_all(self):
+        while True:
+            frame = self.__get(self.__decode_queue)
+            if frame is _END_OF_STREAM:
+                break
+            if not self.__put(self.__encode_queue, self.__process(frame)):
+                return
+            self.__max_encode_queue_depth = max(self.__max_encode_queue_depth,
+                                                self.__encode_queue.qsize())
+        self.__put(self.__encode_queue, _END_OF_STREAM)
+
+    def __encode(self, output_path: str, fps: float):
+        writer = None
+        try:
+            while True:
+                frame = self.__get(self.__encode_queue)
+                if frame is _END_OF_STREAM:
+                    break
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv.VideoWriter(output_path, cv.VideoWriter_fourcc(*self.__fourcc),
+                                            fps, (width, height), frame.ndim == 3)
+                    if not writer.isOpened():
+                        raise ValueError(f'Unable to open video writer: {output_path}')
+                writer.write(frame)
+                self.__buffer_pool.release(frame)
+                self.__frames_encoded += 1
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def __put(self, target: queue.Queue, item: Any) -> bool:
+        # Bounded put that gives up when the pipeline is stopped
+        while not self.__stop_event.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __get(self, source: queue.Queue) -> Any:
+        while not self.__stop_event.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
@@ -16,17 +16,21 @@
 from abc import abstractmethod
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple, List, Union
 
 import cv2.cv2 as cv
 import numpy as np
-from PySide2.QtCore import Signal, Qt, Slot
-from PySide2.QtGui import QMouseEvent, QImage, QPixmap, QColor, QHideEvent
+from PySide2.QtCore import Signal, Qt, Slot, QPoint, QRectF, QPointF
+from PySide2.QtGui import QMouseEvent, QImage, QColor, QHideEvent, QPainter, QPaintEvent, \
+    QWheelEvent, QPen
 from PySide2.QtWidgets import QLabel, QWidget, QVBoxLayout, QGroupBox, QSlider, QButtonGroup, \
     QRadioButton, QSizePolicy, QColorDialog, QHBoxLayout, QSpinBox, QFormLayout, QPushButton, \
     QDialog
 
 from cvisiontool.core.actions import Action
+from cvisiontool.core.pyramid import MatPyramid
+from cvisiontool.core.regionstats import RectSelection, BrushSelection
+from cvisiontool.core.tracing import get_tracer
 
 
 @dataclass(frozen=True)
@@ -42,38 +46,268 @@ class SupportedColorSpaces(Enum):
     HSV = 0
 
 
-class MatView(QLabel):
+class _LevelImage:
+    """
+        QImage which refers to the memory of a pyramid level without copying it.
+        The level array must outlive the image, so both are kept together.
+    """
+
+    def __init__(self, level: np.ndarray):
+        self.mat = np.ascontiguousarray(level)
+        if self.mat.dtype != np.uint8:
+            self.mat = cv.convertScaleAbs(self.mat)
+        height, width = self.mat.shape[:2]
+        bytes_per_line = self.mat.strides[0]
+        if self.mat.ndim == 2:
+            image_format = QImage.Format_Grayscale8
+        elif self.mat.shape[2] == 4:
+            # BGRA bytes are ARGB32 on little-endian platforms
+            image_format = QImage.Format_ARGB32
+        elif hasattr(QImage, 'Format_BGR888'):
+            image_format = QImage.Format_BGR888
+        else:
+            # Qt < 5.14 doesn't support BGR images, so the level has to be converted once
+            self.mat = cv.cvtColor(self.mat, cv.COLOR_BGR2RGB)
+            image_format = QImage.Format_RGB888
+        self.image = QImage(self.mat.data, width, height, bytes_per_line, image_format)
+
+
+class MatView(QWidget):
+    """
+        The view renders a mat with zoom (mouse wheel) and pan (drag with left button).
+        Only the visible part of the pyramid level closest to the current zoom is drawn,
+        QImages refer to pyramid levels directly, so rendering doesn't copy frames.
+        'position_info' carries coordinates in the rendered mat.
+
+        Shift + drag selects a rectangle, Ctrl + drag paints a brush selection,
+        'selection_changed' is emitted on every change of the selection while dragging.
+    """
     position_info = Signal(MatViewPosInfo)
+    selection_changed = Signal(object)
+
+    ZOOM_STEP = 1.25
+    MAX_ZOOM = 32.0
+    BRUSH_RADIUS = 12
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.__current_rgb_mat: Optional[np.ndarray] = None
+        self.__current_bgr_mat: Optional[np.ndarray] = None
+        self.__pyramid = MatPyramid(max_level=10)
+        self.__level_images: Dict[int, _LevelImage] = {}
+        self.__zoom = 1.0
+        self.__pan_x = 0.0
+        self.__pan_y = 0.0
+        self.__drag_start: Optional[QPoint] = None
+        self.__selection_start: Optional[Tuple[float, float]] = None
+        self.__selection: Optional[Union[RectSelection, BrushSelection]] = None
+        self.__brush_circles: List[Tuple[int, int, int]] = []
+        self.__is_brushing = False
         self.setMouseTracking(True)
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
 
+    def render_bgr_mat(self, mat: np.ndarray):
+        previous = self.__current_bgr_mat
+        self.__current_bgr_mat = mat
+        self.__level_images.clear()
+        if previous is None or previous.shape[:2] != mat.shape[:2]:
+            self.clear_selection()
+        if previous is None or not self.__has_same_aspect(previous, mat):
+            self.fit_to_view()
+        else:
+            # Keep the viewport, e.g. when a preview is replaced by its full resolution
+            ratio = mat.shape[1] / previous.shape[1]
+            self.__zoom /= ratio
+            self.__pan_x *= ratio
+            self.__pan_y *= ratio
+            self.update()
+
+    def get_current_bgr_mat(self) -> Optional[np.ndarray]:
+        return self.__current_bgr_mat
+
+    def get_zoom(self) -> float:
+        return self.__zoom
+
+    def get_selection(self) -> Optional[Union[RectSelection, BrushSelection]]:
+        return self.__selection
+
+    def clear_selection(self):
+        self.__selection = None
+        self.__selection_start = None
+        self.__brush_circles = []
+        self.__is_brushing = False
+        self.update()
+
+    def fit_to_view(self):
+        if self.__current_bgr_mat is None:
+            return
+        height, width = self.__current_bgr_mat.shape[:2]
+        self.__zoom = min(1.0, self.width() / width, self.height() / height)
+        self.__pan_x, self.__pan_y = 0.0, 0.0
+        self.__clamp_pan()
+        self.update()
+
+    def zoom_at(self, factor: float, point: QPoint):
+        if self.__current_bgr_mat is None:
+            return
+        source_x, source_y = self.map_to_source(point)
+        height, width = self.__current_bgr_mat.shape[:2]
+        min_zoom = min(1.0, self.width() / width, self.height() / height)
+        self.__zoom = max(min_zoom, min(self.MAX_ZOOM, self.__zoom * factor))
+        self.__pan_x = source_x - point.x() / self.__zoom
+        self.__pan_y = source_y - point.y() / self.__zoom
+        self.__clamp_pan()
+        self.update()
+
+    def map_to_source(self, point: QPoint) -> Tuple[float, float]:
+        return self.__pan_x + point.x() / self.__zoom, self.__pan_y + point.y() / self.__zoom
+
+    def paintEvent(self, event: QPaintEvent):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.darkGray)
+        if self.__current_bgr_mat is None:
+            return
+        with get_tracer().span('paint', 'render', mat=self.__current_bgr_mat, zoom=self.__zoom):
+            self.__paint_mat(painter)
+        self.__paint_selection(painter)
+
+    def __paint_mat(self, painter: QPainter):
+        height, width = self.__current_bgr_mat.shape[:2]
+        level = self.__choose_level()
+        level_image = self.__get_level_image(level)
+        scale_x = level_image.image.width() / width
+        scale_y = level_image.image.height() / height
+
+        visible_width = min(width - max(0.0, self.__pan_x), self.width() / self.__zoom)
+        visible_height = min(height - max(0.0, self.__pan_y), self.height() / self.__zoom)
+        left, top = max(0.0, self.__pan_x), max(0.0, self.__pan_y)
+        source = QRectF(left * scale_x, top * scale_y,
+                        visible_width * scale_x, visible_height * scale_y)
+        target = QRectF((left - self.__pan_x) * self.__zoom, (top - self.__pan_y) * self.__zoom,
+                        visible_width * self.__zoom, visible_height * self.__zoom)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, self.__zoom < 1.0)
+        painter.drawImage(target, level_image.image, source)
+
+    def __paint_selection(self, painter: QPainter):
+        painter.setPen(QPen(Qt.yellow, 1, Qt.DashLine))
+        if isinstance(self.__selection, RectSelection):
+            painter.drawRect(QRectF((self.__selection.x - self.__pan_x) * self.__zoom,
+                                    (self.__selection.y - self.__pan_y) * self.__zoom,
+                                    self.__selection.width * self.__zoom,
+                                    self.__selection.height * self.__zoom))
+        elif isinstance(self.__selection, BrushSelection):
+            for center_x, center_y, radius in self.__brush_circles:
+                center = QPointF((center_x + 0.5 - self.__pan_x) * self.__zoom,
+                                 (center_y + 0.5 - self.__pan_y) * self.__zoom)
+                painter.drawEllipse(center, radius * self.__zoom, radius * self.__zoom)
+
+    def wheelEvent(self, event: QWheelEvent):
+        steps = event.angleDelta().y() / 120
+        if steps != 0:
+            self.zoom_at(self.ZOOM_STEP ** steps, event.pos())
+
+    def mousePressEvent(self, event: QMouseEvent):
+        super().mousePressEvent(event)
+        if event.button() != Qt.LeftButton or self.__current_bgr_mat is None:
+            return
+        if event.modifiers() & Qt.ShiftModifier:
+            self.clear_selection()
+            self.__selection_start = self.map_to_source(event.pos())
+            self.__update_rect_selection(event.pos())
+        elif event.modifiers() & Qt.ControlModifier:
+            self.clear_selection()
+            height, width = self.__current_bgr_mat.shape[:2]
+            self.__selection = BrushSelection(width, height)
+            self.__is_brushing = True
+            self.__paint_brush(event.pos())
+        else:
+            self.__drag_start = event.pos()
+
+    def mouseReleaseEvent(self, event: QMouseEvent):
+        super().mouseReleaseEvent(event)
+        if event.button() == Qt.LeftButton:
+            self.__drag_start = None
+            self.__selection_start = None
+            self.__is_brushing = False
+
+    def mouseDoubleClickEvent(self, event: QMouseEvent):
+        super().mouseDoubleClickEvent(event)
+        self.fit_to_view()
+
     def mouseMoveEvent(self, event: QMouseEvent):
         super().mouseMoveEvent(event)
-        if self.__current_rgb_mat is not None:
-            x = event.x()
-            y = event.y()
-            h, w, _ = self.__current_rgb_mat.shape
-            if x < w and y < h:
-                self.position_info.emit(MatViewPosInfo(x, y,
-                                                       red=self.__current_rgb_mat[y][x][0],
-                                                       green=self.__current_rgb_mat[y][x][1],
-                                                       blue=self.__current_rgb_mat[y][x][2]))
-
-    def render_bgr_mat(self, mat: np.ndarray):
-        mat_rgb = cv.cvtColor(mat, cv.COLOR_BGR2RGB)
-        height, width, _ = mat_rgb.shape
-        bytes_per_line, *_ = mat_rgb.strides
-        img = QImage(mat_rgb.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(img)
-        if pixmap.width() > self.width() or pixmap.height() > self.height():
-            pixmap = pixmap.scaled(self.width(), self.height(), Qt.KeepAspectRatio,
-                                   Qt.FastTransformation)
-        self.setPixmap(pixmap)
-        self.__current_rgb_mat = mat_rgb
+        if self.__current_bgr_mat is None:
+            return
+        if self.__drag_start is not None:
+            delta = event.pos() - self.__drag_start
+            self.__drag_start = event.pos()
+            self.__pan_x -= delta.x() / self.__zoom
+            self.__pan_y -= delta.y() / self.__zoom
+            self.__clamp_pan()
+            self.update()
+        elif self.__selection_start is not None:
+            self.__update_rect_selection(event.pos())
+        elif self.__is_brushing:
+            self.__paint_brush(event.pos())
+        source_x, source_y = self.map_to_source(event.pos())
+        x, y = int(source_x), int(source_y)
+        height, width = self.__current_bgr_mat.shape[:2]
+        if 0 <= x < width and 0 <= y < height:
+            pixel = self.__current_bgr_mat[y, x]
+            if self.__current_bgr_mat.ndim == 2:
+                blue = green = red = int(pixel)
+            else:
+                blue, green, red = (int(value) for value in pixel[:3])
+            self.position_info.emit(MatViewPosInfo(x, y, red=red, green=green, blue=blue))
+
+    def __update_rect_selection(self, point: QPoint):
+        start_x, start_y = self.__selection_start
+        end_x, end_y = self.map_to_source(point)
+        left, top = int(min(start_x, end_x)), int(min(start_y, end_y))
+        right, bottom = int(max(start_x, end_x)) + 1, int(max(start_y, end_y)) + 1
+        self.__selection = RectSelection(left, top, right - left, bottom - top)
+        self.selection_changed.emit(self.__selection)
+        self.update()
+
+    def __paint_brush(self, point: QPoint):
+        source_x, source_y = self.map_to_source(point)
+        radius = max(1, int(self.BRUSH_RADIUS / self.__zoom))
+        self.__selection.add_circle(int(source_x), int(source_y), radius)
+        self.__brush_circles.append((int(source_x), int(source_y), radius))
+        self.selection_changed.emit(self.__selection)
+        self.update()
+
+    def __choose_level(self) -> int:
+        level = 0
+        while self.__zoom * 2 ** (level + 1) <= 1.0 and level < 10:
+            level += 1
+        return level
+
+    def __get_level_image(self, level: int) -> _LevelImage:
+        level_image = self.__level_images.get(level)
+        if level_image is None:
+            with get_tracer().span('build_level_image', 'render', mat=self.__current_bgr_mat,
+                                   level=level):
+                level_image = _LevelImage(self.__pyramid.get_level(self.__current_bgr_mat, level))
+            self.__level_images[level] = level_image
+        return level_image
+
+    def __clamp_pan(self):
+        height, width = self.__current_bgr_mat.shape[:2]
+        self.__pan_x = self.__clamp_axis(self.__pan_x, width, self.width() / self.__zoom)
+        self.__pan_y = self.__clamp_axis(self.__pan_y, height, self.height() / self.__zoom)
+
+    @staticmethod
+    def __clamp_axis(pan: float, size: float, visible_size: float) -> float:
+        if size <= visible_size:
+            return -(visible_size - size) / 2
+        return max(0.0, min(pan, size - visible_size))
+
+    @staticmethod
+    def __has_same_aspect(first: np.ndarray, second: np.ndarray) -> bool:
+        first_height, first_width = first.shape[:2]
+        second_height, second_width = second.shape[:2]
+        return abs(first_width / first_height - second_width / second_height) \
+            < 0.01 * first_width / first_height
 
 
 class SliderWidget(QWidget):
@@ -13,7 +13,7 @@
 #  #
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from typing import Tuple
+from typing import Tuple, Optional, Any
 
 from PySide2.QtCore import Slot
 from PySide2.QtWidgets import QWidget, QPushButton, QLineEdit, QVBoxLayout, QFormLayout, QLabel, \
@@ -132,5 +132,88 @@ class FindContoursDialog(AbstractMatActionDialog):
             cv.CHAIN_APPROX_TC89_L1: 'CHAIN_APPROX_TC89_L1',
             cv.CHAIN_APPROX_TC89_KCOS: 'CHAIN_APPROX_TC89_KCOS'
         }, checked_index=cv.CHAIN_APPROX_SIMPLE)
+        self.__layout.addWidget(self.__method_widget)
+
+        self.__find_button = QPushButton('Find')
+        self.__find_button.clicked.connect(self.__on_find_button_clicked)
+        self.__layout.addWidget(self.__find_button)
 
         return self.__main_widget
+
+    @Slot()
+    def __on_find_button_clicked(self):
+        action = ActionFactory.create_find_contours_action(
+            mode=self.__mode_widget.get_checked(),
+            method=self.__method_widget.get_checked())
+        self._current_action = action
+        self.display_action_result.emit(action)
+
+
+class ConnectedComponentsDialog(AbstractMatActionDialog):
+    def _create_main_widget(self) -> QWidget:
+        self.__main_widget = QWidget(self)
+        self.__layout = QVBoxLayout(self.__main_widget)
+        self.__connectivity_widget = ChooseOneOfWidget('Connectivity', {
+            4: '4-connected',
+            8: '8-connected'
+        }, checked_index=8)
+        self.__layout.addWidget(self.__connectivity_widget)
+
+        params_layout = QFormLayout()
+        self.__min_area_line_edit = QLineEdit()
+        params_layout.addRow(QLabel('min area'), self.__min_area_line_edit)
+        self.__max_area_line_edit = QLineEdit()
+        params_layout.addRow(QLabel('max area'), self.__max_area_line_edit)
+        self.__min_aspect_ratio_line_edit = QLineEdit()
+        params_layout.addRow(QLabel('min aspect ratio (w/h)'), self.__min_aspect_ratio_line_edit)
+        self.__max_aspect_ratio_line_edit = QLineEdit()
+        params_layout.addRow(QLabel('max aspect ratio (w/h)'), self.__max_aspect_ratio_line_edit)
+        self.__layout.addLayout(params_layout)
+
+        self.__label_button = QPushButton('Label')
+        self.__label_button.clicked.connect(self.__on_label_button_clicked)
+        self.__layout.addWidget(self.__label_button)
+
+        return self.__main_widget
+
+    @Slot()
+    def __on_label_button_clicked(self):
+        wrong_fields = []
+        min_area, success = self.__to_optional(self.__min_area_line_edit.text(), int)
+        if not success:
+            wrong_fields.append('min area')
+        max_area, success = self.__to_optional(self.__max_area_line_edit.text(), int)
+        if not success:
+            wrong_fields.append('max area')
+        min_aspect_ratio, success = self.__to_optional(self.__min_aspect_ratio_line_edit.text(),
+                                                       float)
+        if not success:
+            wrong_fields.append('min aspect ratio')
+        max_aspect_ratio, success = self.__to_optional(self.__max_aspect_ratio_line_edit.text(),
+                                                       float)
+        if not success:
+            wrong_fields.append('max aspect ratio')
+
+        if len(wrong_fields) > 0:
+            QMessageBox.critical(self, 'Error',
+                                 'Following fields has wrong values: ' + ', '.join(wrong_fields),
+                                 QMessageBox.Ok, QMessageBox.NoButton)
+            return
+        action = ActionFactory.create_connected_components_action(
+            connectivity=self.__connectivity_widget.get_checked(),
+            min_area=min_area if min_area is not None else 0,
+            max_area=max_area,
+            min_aspect_ratio=min_aspect_ratio,
+            max_aspect_ratio=max_aspect_ratio)
+        self._current_action = action
+        self.display_action_result.emit(action)
+
+    @staticmethod
+    def __to_optional(value: str, value_type: type) -> Tuple[Optional[Any], bool]:
+        # Empty fields mean no limit
+        if value.strip() == '':
+            return None, True
+        try:
+            return value_type(value), True
+        except ValueError:
+            return None, False
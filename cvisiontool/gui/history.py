@@ -13,74 +13,162 @@
 #  #
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from typing import Dict
+import json
+from typing import Any, Optional
 
-from PySide2.QtCore import Slot, Qt, QPoint, Signal
-from PySide2.QtWidgets import QDialog, QVBoxLayout, QListWidget, QMenu, QAction
+from PySide2.QtCore import Slot, Qt, QPoint, Signal, QAbstractListModel, QModelIndex, QObject
+from PySide2.QtWidgets import QDialog, QVBoxLayout, QListView, QMenu, QAction, QInputDialog, \
+    QMessageBox
 
 from cvisiontool.core.historymanager import HistoryManager, HistoryEntry
 
 
+class HistoryManagerSignals(QObject):
+    """
+        Qt adapter of HistoryManager events. Events emitted on other threads are
+        delivered to receivers on their own threads.
+    """
+    history_changed = Signal()
+    entries_inserted = Signal(int, int)
+    entries_removed = Signal(int, int)
+    entries_changed = Signal(int, int)
+
+    def __init__(self, history_manager: HistoryManager, parent=None):
+        super().__init__(parent)
+        self.__history_manager = history_manager
+        self.__history_manager.history_changed.connect(self.history_changed.emit)
+        self.__history_manager.entries_inserted.connect(self.entries_inserted.emit)
+        self.__history_manager.entries_removed.connect(self.entries_removed.emit)
+        self.__history_manager.entries_changed.connect(self.entries_changed.emit)
+
+
+class HistoryListModel(QAbstractListModel):
+    """
+        The model shows history entries newest first and follows granular
+        'entries_inserted'/'entries_removed'/'entries_changed' signals, so only changed rows
+        are updated.
+    """
+
+    def __init__(self, history_manager: HistoryManager, signals: HistoryManagerSignals,
+                 parent=None):
+        super().__init__(parent)
+        self.__history_manager = history_manager
+        self.__row_count = history_manager.get_entry_count()
+        signals.entries_inserted.connect(self.__on_entries_inserted)
+        signals.entries_removed.connect(self.__on_entries_removed)
+        signals.entries_changed.connect(self.__on_entries_changed)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.__row_count
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        entry = self.get_entry(index.row()) if index.isValid() else None
+        if entry is None:
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return entry.action.to_string()
+        return None
+
+    def get_entry(self, row: int) -> Optional[HistoryEntry]:
+        if row < 0 or row >= self.__row_count:
+            return None
+        return self.__history_manager.get_entry(self.__row_count - 1 - row)
+
+    @Slot(int, int)
+    def __on_entries_inserted(self, first: int, last: int):
+        # New entries are the newest ones, so they are inserted at the top
+        self.beginInsertRows(QModelIndex(), 0, last - first)
+        self.__row_count += last - first + 1
+        self.endInsertRows()
+
+    @Slot(int, int)
+    def __on_entries_removed(self, first: int, last: int):
+        self.beginRemoveRows(QModelIndex(), 0, last - first)
+        self.__row_count -= last - first + 1
+        self.endRemoveRows()
+
+    @Slot(int, int)
+    def __on_entries_changed(self, first: int, last: int):
+        self.dataChanged.emit(self.index(self.__row_count - 1 - last),
+                              self.index(self.__row_count - 1 - first))
+
+
 class HistoryDialog(QDialog):
     apply_history_entry = Signal(HistoryEntry)
 
     def __init__(self, history_manager: HistoryManager, parent=None):
         super().__init__(parent)
         self.setWindowTitle('History')
-        self.__current_entries: Dict[int, HistoryEntry] = {}
         self.__history_manager = history_manager
-        self.__list_widget = self.__create_history_widget()
+        # The dialog is kept by the main window, so the adapter lives as long as the manager
+        self.__signals = HistoryManagerSignals(history_manager, self)
+        self.__model = HistoryListModel(history_manager, self.__signals, self)
+        self.__list_view = self.__create_history_widget()
         self.__layout = QVBoxLayout()
-        self.__layout.addWidget(self.__list_widget)
+        self.__layout.addWidget(self.__list_view)
         self.setLayout(self.__layout)
 
-        self.__history_manager.history_changed.connect(self.__on_history_changed)
-
-        self.__fill_history()
-
-    def __create_history_widget(self) -> QListWidget:
-        list_widget = QListWidget(self)
-        list_widget.setWordWrap(True)
-        list_widget.setTextElideMode(Qt.ElideNone)
+    def __create_history_widget(self) -> QListView:
+        list_view = QListView(self)
+        list_view.setModel(self.__model)
+        list_view.setWordWrap(True)
+        list_view.setTextElideMode(Qt.ElideNone)
+        list_view.setUniformItemSizes(True)
 
-        list_widget.setContextMenuPolicy(Qt.CustomContextMenu)
-        list_widget.customContextMenuRequested.connect(self.__on_history_widget_context_menu)
-        return list_widget
+        list_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        list_view.customContextMenuRequested.connect(self.__on_history_widget_context_menu)
+        return list_view
 
     @Slot(QPoint)
     def __on_history_widget_context_menu(self, point: QPoint):
-        if len(self.__list_widget.selectedItems()) == 0:
+        if len(self.__list_view.selectedIndexes()) == 0:
             return
 
-        global_pos = self.__list_widget.mapToGlobal(point)
+        global_pos = self.__list_view.mapToGlobal(point)
 
         menu = QMenu()
         show_action: QAction = menu.addAction('Show')
         show_action.triggered.connect(self.__on_show_action_triggered)
+        edit_action: QAction = menu.addAction('Edit parameters')
+        edit_action.triggered.connect(self.__on_edit_action_triggered)
         discard_above_action: QAction = menu.addAction('Discard actions above')
         discard_above_action.triggered.connect(self.__on_discard_above_action_triggered)
 
         menu.exec_(global_pos)
 
-    def __fill_history(self):
-        entries = self.__history_manager.get_entries()
-        self.__current_entries.clear()
-        for i in range(0, len(entries)):
-            self.__list_widget.addItem(entries[i].action.to_string())
-            self.__current_entries[i] = entries[i]
-
-    @Slot()
-    def __on_history_changed(self):
-        self.__list_widget.clear()
-        self.__fill_history()
+    def __get_chosen_entry(self) -> Optional[HistoryEntry]:
+        return self.__model.get_entry(self.__list_view.currentIndex().row())
 
     @Slot()
     def __on_show_action_triggered(self):
-        chosen_id = self.__list_widget.currentRow()
-        chosen_entry = self.__current_entries[chosen_id]
-        self.apply_history_entry.emit(chosen_entry)
+        chosen_entry = self.__get_chosen_entry()
+        if chosen_entry is not None:
+            self.apply_history_entry.emit(chosen_entry)
 
     def __on_discard_above_action_triggered(self):
-        chosen_id = self.__list_widget.currentRow()
-        chosen_entry = self.__current_entries[chosen_id]
-        self.__history_manager.remove_newer_than(chosen_entry)
+        chosen_entry = self.__get_chosen_entry()
+        if chosen_entry is not None:
+            self.__history_manager.remove_newer_than(chosen_entry)
+
+    @Slot()
+    def __on_edit_action_triggered(self):
+        chosen_entry = self.__get_chosen_entry()
+        if chosen_entry is None:
+            return
+        text, is_accepted = QInputDialog.getMultiLineText(
+            self, 'Edit parameters', chosen_entry.action.action_type.name,
+            json.dumps(chosen_entry.action.params, indent=2))
+        if not is_accepted:
+            return
+        try:
+            params = json.loads(text)
+            if not isinstance(params, dict):
+                raise ValueError('Parameters must be a JSON object')
+            self.__history_manager.update_action_params(chosen_entry, params)
+        except Exception as e:  # pylint: disable=broad-except
+            # Edited JSON may have wrong types, which OpenCV reports with its own errors
+            QMessageBox.critical(self, 'Error', f'Unable to apply parameters: {e}',
+                                 QMessageBox.Ok, QMessageBox.NoButton)
+            return
+        newest_index = self.__history_manager.get_entry_count() - 1
+        self.apply_history_entry.emit(self.__history_manager.get_entry(newest_index))
@@ -0,0 +1,101 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+from PySide2.QtCore import QObject, Signal, Slot, QRunnable, QThreadPool
+
+from cvisiontool.core.imageio import choose_preview_reduction, read_image
+
+
+class _ImageLoadSignals(QObject):
+    preview_ready = Signal(int, str, object)
+    loaded = Signal(int, str, object)
+    failed = Signal(int, str, str)
+
+
+class _ImageLoadJob(QRunnable):
+    def __init__(self, generation: int, path: str, preview_max_pixels: int,
+                 signals: _ImageLoadSignals):
+        super().__init__()
+        self.__generation = generation
+        self.__path = path
+        self.__preview_max_pixels = preview_max_pixels
+        self.__signals = signals
+
+    def run(self):
+        try:
+            reduction = choose_preview_reduction(self.__path, self.__preview_max_pixels)
+            if reduction > 1:
+                self.__signals.preview_ready.emit(self.__generation, self.__path,
+                                                  read_image(self.__path, reduction))
+            self.__signals.loaded.emit(self.__generation, self.__path, read_image(self.__path))
+        except Exception as e:  # pylint: disable=broad-except
+            self.__signals.failed.emit(self.__generation, self.__path, str(e))
+
+
+class ImageLoader(QObject):
+    """
+        Reads images off the GUI thread. JPEGs which are larger than 'preview_max_pixels'
+        are first decoded at reduced resolution, 'preview_ready' is emitted for them
+        before 'loaded'. Only the latest 'load' is reported, results of images whose
+        loading was superseded or cancelled are dropped.
+    """
+    preview_ready = Signal(str, np.ndarray)
+    loaded = Signal(str, np.ndarray)
+    failed = Signal(str, str)
+
+    def __init__(self, preview_max_pixels: int = 2_000_000, parent=None):
+        super().__init__(parent)
+        self.__preview_max_pixels = preview_max_pixels
+        self.__pool = QThreadPool(self)
+        self.__signals = _ImageLoadSignals(self)
+        self.__signals.preview_ready.connect(self.__on_preview_ready)
+        self.__signals.loaded.connect(self.__on_loaded)
+        self.__signals.failed.connect(self.__on_failed)
+        self.__generation = 0
+        self.__is_loading = False
+
+    def load(self, path: str):
+        self.__generation += 1
+        self.__is_loading = True
+        self.__pool.start(_ImageLoadJob(self.__generation, path, self.__preview_max_pixels,
+                                        self.__signals))
+
+    def cancel(self):
+        self.__generation += 1
+        self.__is_loading = False
+
+    def is_loading(self) -> bool:
+        return self.__is_loading
+
+    def wait_for_done(self, msecs: int = -1) -> bool:
+        return self.__pool.waitForDone(msecs)
+
+    @Slot(int, str, object)
+    def __on_preview_ready(self, generation: int, path: str, mat_bgr: np.ndarray):
+        if generation == self.__generation:
+            self.preview_ready.emit(path, mat_bgr)
+
+    @Slot(int, str, object)
+    def __on_loaded(self, generation: int, path: str, mat_bgr: np.ndarray):
+        if generation == self.__generation:
+            self.__is_loading = False
+            self.loaded.emit(path, mat_bgr)
+
+    @Slot(int, str, str)
+    def __on_failed(self, generation: int, path: str, error: str):
+        if generation == self.__generation:
+            self.__is_loading = False
+            self.failed.emit(path, error)
@@ -13,30 +13,59 @@
 #  #
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-import cv2.cv2 as cv
+import zlib
 from pathlib import Path
+from typing import Optional, Tuple
 import numpy as np
-from PySide2.QtCore import Slot, Signal
+from PySide2.QtCore import Slot, Signal, QTimer, Qt
 from PySide2.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QAction, QFileDialog, QLabel, \
-    QDialog
+    QDialog, QMessageBox
 
 from cvisiontool.core.actions import Action, ActionFactory
 from cvisiontool.core.actionproc import ActionProcessor
 from cvisiontool.core.historymanager import HistoryManager, HistoryEntry
+from cvisiontool.core.planes import DerivedPlaneCache
+from cvisiontool.core.pyramid import MatPyramid
+from cvisiontool.core.regionstats import RegionStatistics
+from cvisiontool.core.resultcache import ActionResultCache
+from cvisiontool.core.session import save_session, load_session, SESSION_EXTENSION
 from cvisiontool.gui.common import MatView, MatViewPosInfo
-from cvisiontool.gui.detect import HoughCircleDialog
-from cvisiontool.gui.history import HistoryDialog
-from cvisiontool.gui.transform import ErosionAndDilationDialog, InRangeDialog
+from cvisiontool.gui.imageloader import ImageLoader
+from cvisiontool.gui.preview import PreviewExecutor
+
+SESSION_FILE_FILTER = f'cvisiontool session (*{SESSION_EXTENSION})'
 
 
 class MainWindow(QMainWindow):
+    """
+        Dialog modules are imported when a dialog is opened for the first time,
+        so they don't slow down the startup.
+    """
     image_loaded = Signal(np.ndarray)
+    # Previews of larger images are computed on a pyramid level until controls settle
+    PREVIEW_MAX_PIXELS = 2_000_000
+    PREVIEW_SETTLE_MSEC = 300
 
     def __init__(self):
         super().__init__()
-        self.__action_processor = ActionProcessor()
+        self.__planes = DerivedPlaneCache()
+        self.__action_processor = ActionProcessor(cache=ActionResultCache(), planes=self.__planes)
+        self.__pyramid = MatPyramid()
+        self.__preview_executor = PreviewExecutor(self.__action_processor, self.__pyramid, self)
+        self.__preview_executor.result_ready.connect(self.__on_preview_ready)
+        self.__preview_executor.failed.connect(self.__on_preview_failed)
+        self.__settled_action: Optional[Action] = None
+        # Displayed preview computed on a pyramid level and the level itself
+        self.__reduced_preview: Optional[Tuple[np.ndarray, int]] = None
+        self.__settle_timer = QTimer(self)
+        self.__settle_timer.setSingleShot(True)
+        self.__settle_timer.timeout.connect(self.__on_preview_settled)
         self.__lasted_chosen_dir = None
-        self.__history_manager = HistoryManager()
+        self.__image_loader = ImageLoader(self.PREVIEW_MAX_PIXELS, self)
+        self.__image_loader.preview_ready.connect(self.__on_image_preview_ready)
+        self.__image_loader.loaded.connect(self.__on_image_loaded)
+        self.__image_loader.failed.connect(self.__on_image_load_failed)
+        self.__history_manager = HistoryManager(action_processor=self.__action_processor)
         self.__current_mat_bgr: np.ndarray = None
         self.__history_dialog: QDialog = None
         self.__current_dialog: QDialog = None
@@ -44,10 +73,15 @@ class MainWindow(QMainWindow):
         self.__mat_view.setFixedHeight(self.height() - 30)
         self.__mat_view.setFixedWidth(self.width() - 30)
         self.__mat_view.position_info.connect(self.__render_view_position_info)
+        self.__mat_view.selection_changed.connect(self.__render_selection_stats)
+        self.__region_statistics: Optional[RegionStatistics] = None
         self.__central_widget = QWidget()
         self.__status_label = QLabel()
         self.__status_label.setMargin(2)
         self.statusBar().addPermanentWidget(self.__status_label, 1)
+        self.__roi_label = QLabel()
+        self.__roi_label.setMargin(2)
+        self.statusBar().addPermanentWidget(self.__roi_label, 1)
 
         self.__create_main_menu()
 
@@ -65,16 +99,30 @@ class MainWindow(QMainWindow):
         load_file_action = QAction(text='Load file', parent=menu)
         load_file_action.triggered.connect(self.__load_file)
         file_menu.addAction(load_file_action)
+        open_session_action = QAction(text='Open session', parent=menu)
+        open_session_action.triggered.connect(self.__open_session)
+        file_menu.addAction(open_session_action)
+        self.__save_session_action = QAction(text='Save session', parent=menu)
+        self.__save_session_action.triggered.connect(self.__save_session)
+        self.__save_session_action.setEnabled(False)
+        file_menu.addAction(self.__save_session_action)
 
         view_menu = menu.addMenu('View')
         history_action = QAction(text='History', parent=menu)
         history_action.triggered.connect(self.__show_history_dialog)
         view_menu.addAction(history_action)
 
-        detect_menu = menu.addMenu('Detect')
+        self.__detect_menu = menu.addMenu('Detect')
         hough_circle_action = QAction(text='Hough Circle', parent=menu)
         hough_circle_action.triggered.connect(self.__show_hough_circle_dialog)
-        detect_menu.addAction(hough_circle_action)
+        self.__detect_menu.addAction(hough_circle_action)
+        find_contours_action = QAction(text='Find Contours', parent=menu)
+        find_contours_action.triggered.connect(self.__show_find_contours_dialog)
+        self.__detect_menu.addAction(find_contours_action)
+        connected_components_action = QAction(text='Connected Components', parent=menu)
+        connected_components_action.triggered.connect(self.__show_connected_components_dialog)
+        self.__detect_menu.addAction(connected_components_action)
+        self.__detect_menu.setEnabled(False)
 
         self.__transform_menu = menu.addMenu('Transform')
         erosion_and_dilation_action = QAction(text='Erosion and Dilation', parent=menu)
@@ -89,29 +137,104 @@ class MainWindow(QMainWindow):
 
     def __activate_menu_on_image_load(self):
         self.__transform_menu.setEnabled(True)
+        self.__detect_menu.setEnabled(True)
+        self.__save_session_action.setEnabled(True)
 
     @Slot()
     def __load_file(self):
         selected_file, _ = QFileDialog.getOpenFileName(self, 'Choose image',
                                                        self.__lasted_chosen_dir)
-        if selected_file is not None:
-            path = Path(selected_file)
-            self.__lasted_chosen_dir = str(path.parent)
-            self.__current_mat_bgr = cv.imread(selected_file)
+        if not selected_file:
+            return
+        path = Path(selected_file)
+        self.__lasted_chosen_dir = str(path.parent)
+        self.__cancel_previews()
+        # Actions must not be applied to a preview, menus are enabled once full data is read
+        self.__transform_menu.setEnabled(False)
+        self.__detect_menu.setEnabled(False)
+        self.__status_label.setText(f'Loading {path.name}...')
+        self.__mat_view.setCursor(Qt.BusyCursor)
+        self.__image_loader.load(selected_file)
+
+    @Slot(str, np.ndarray)
+    def __on_image_preview_ready(self, path: str, mat_bgr: np.ndarray):
+        self.__mat_view.render_bgr_mat(mat_bgr)
+        self.__status_label.setText(f'Loading {Path(path).name}, showing reduced preview...')
+
+    @Slot(str, np.ndarray)
+    def __on_image_loaded(self, path: str, mat_bgr: np.ndarray):
+        self.__mat_view.unsetCursor()
+        self.__status_label.clear()
+        self.__current_mat_bgr = mat_bgr
+        self.__mat_view.render_bgr_mat(self.__current_mat_bgr)
+        self.image_loaded.emit(self.__current_mat_bgr)
+        self.__history_manager.add_entry(HistoryEntry(
+            ActionFactory.create_image_loaded_action(path),
+            self.__current_mat_bgr
+        ))
+        self.__activate_menu_on_image_load()
+
+    @Slot(str, str)
+    def __on_image_load_failed(self, path: str, error: str):
+        self.__mat_view.unsetCursor()
+        self.__status_label.setText(f'Unable to load {Path(path).name}: {error}')
+        if self.__current_mat_bgr is not None:
             self.__mat_view.render_bgr_mat(self.__current_mat_bgr)
-            self.image_loaded.emit(self.__current_mat_bgr)
-            self.__history_manager.add_entry(HistoryEntry(
-                ActionFactory.create_image_loaded_action(selected_file),
-                self.__current_mat_bgr
-            ))
             self.__activate_menu_on_image_load()
 
+    @Slot()
+    def __save_session(self):
+        selected_file, _ = QFileDialog.getSaveFileName(self, 'Save session',
+                                                       self.__lasted_chosen_dir,
+                                                       SESSION_FILE_FILTER)
+        if not selected_file:
+            return
+        if not selected_file.endswith(SESSION_EXTENSION):
+            selected_file += SESSION_EXTENSION
+        self.__lasted_chosen_dir = str(Path(selected_file).parent)
+        try:
+            save_session(selected_file, self.__history_manager)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, 'Error', f'Unable to save session: {e}',
+                                 QMessageBox.Ok, QMessageBox.NoButton)
+
+    @Slot()
+    def __open_session(self):
+        selected_file, _ = QFileDialog.getOpenFileName(self, 'Open session',
+                                                       self.__lasted_chosen_dir,
+                                                       SESSION_FILE_FILTER)
+        if not selected_file:
+            return
+        self.__lasted_chosen_dir = str(Path(selected_file).parent)
+        self.__cancel_previews()
+        if self.__image_loader.is_loading():
+            self.__image_loader.cancel()
+            self.__mat_view.unsetCursor()
+            self.__status_label.clear()
+        try:
+            load_session(selected_file, self.__history_manager)
+            count = self.__history_manager.get_entry_count()
+            if count == 0:
+                return
+            # Only the newest result is loaded, others are loaded when they are shown
+            mat_bgr = self.__history_manager.get_mat_bgr(
+                self.__history_manager.get_entry(count - 1))
+        except (OSError, ValueError, KeyError, zlib.error) as e:
+            QMessageBox.critical(self, 'Error', f'Unable to open session: {e}',
+                                 QMessageBox.Ok, QMessageBox.NoButton)
+            return
+        self.__current_mat_bgr = mat_bgr
+        self.__mat_view.render_bgr_mat(self.__current_mat_bgr)
+        self.image_loaded.emit(self.__current_mat_bgr)
+        self.__activate_menu_on_image_load()
+
     @Slot()
     def __show_history_dialog(self):
         if self.__history_dialog is not None:
             if not self.__history_dialog.isVisible():
                 self.__history_dialog.show()
         else:
+            from cvisiontool.gui.history import HistoryDialog
             self.__history_dialog = HistoryDialog(self.__history_manager, self)
             self.__history_dialog.apply_history_entry.connect(self.__on_apply_history_entry)
             self.__history_dialog.show()
@@ -122,6 +245,7 @@ class MainWindow(QMainWindow):
         if self.__current_dialog is not None:
             self.__current_dialog.close()
 
+        from cvisiontool.gui.transform import ErosionAndDilationDialog
         self.__current_dialog = ErosionAndDilationDialog(self)
         self.__connect_current_dialog()
         self.__current_dialog.show()
@@ -132,6 +256,7 @@ class MainWindow(QMainWindow):
         if self.__current_dialog is not None:
             self.__current_dialog.close()
 
+        from cvisiontool.gui.transform import InRangeDialog
         self.__current_dialog = InRangeDialog()
         self.__connect_current_dialog()
         self.__current_dialog.show()
@@ -141,34 +266,100 @@ class MainWindow(QMainWindow):
         if self.__current_dialog is not None:
             self.__current_dialog.close()
 
+        from cvisiontool.gui.detect import HoughCircleDialog
         self.__current_dialog = HoughCircleDialog()
         self.__connect_current_dialog()
         self.__current_dialog.show()
 
+    @Slot()
+    def __show_find_contours_dialog(self):
+        if self.__current_dialog is not None:
+            self.__current_dialog.close()
+
+        from cvisiontool.gui.detect import FindContoursDialog
+        self.__current_dialog = FindContoursDialog()
+        self.__connect_current_dialog()
+        self.__current_dialog.show()
+
+    @Slot()
+    def __show_connected_components_dialog(self):
+        if self.__current_dialog is not None:
+            self.__current_dialog.close()
+
+        from cvisiontool.gui.detect import ConnectedComponentsDialog
+        self.__current_dialog = ConnectedComponentsDialog()
+        self.__connect_current_dialog()
+        self.__current_dialog.show()
+
     @Slot(MatViewPosInfo)
     def __render_view_position_info(self, info: MatViewPosInfo):
-        original = np.uint8([[[info.red, info.green, info.blue]]])
-        # OpenCV HSV ranges are [0,179] for Hue, [0,255] for Saturation and Value
-        # Multiply by 2, 1/2.55, 1/2.55 to convert to conventional HSV
-        hsv = cv.cvtColor(original, cv.COLOR_RGB2HSV)
-        h, s, v = hsv[0][0]
-        self.__status_label.setText(
-            f'x = {info.x}, y = {info.y}, RGB: [r = {info.red}, g = {info.green}, b = {info.blue}], '
-            f'HSV (Open CV format): [h = {h}, s = {s}, v={v}]')
+        mat_bgr = self.__mat_view.get_current_bgr_mat()
+        factor = 1
+        if self.__reduced_preview is not None and self.__reduced_preview[0] is mat_bgr:
+            # Coordinates of a reduced preview are mapped back to the source mat
+            factor = 2 ** self.__reduced_preview[1]
+        text = f'x = {info.x * factor}, y = {info.y * factor}, RGB: [r = {info.red}, ' \
+               f'g = {info.green}, b = {info.blue}]'
+        if mat_bgr.ndim == 3 and mat_bgr.shape[2] == 3:
+            # HSV plane is converted once per displayed mat and then taken from the cache
+            h, s, v = self.__planes.get(mat_bgr, DerivedPlaneCache.HSV)[info.y][info.x]
+            text += f', HSV (Open CV format): [h = {h}, s = {s}, v={v}]'
+        self.__status_label.setText(text)
+
+    @Slot(object)
+    def __render_selection_stats(self, selection):
+        mat_bgr = self.__mat_view.get_current_bgr_mat()
+        if self.__region_statistics is None or self.__region_statistics.get_mat() is not mat_bgr:
+            # Integral images are computed once per displayed mat
+            self.__region_statistics = RegionStatistics(mat_bgr, self.__planes)
+        stats = self.__region_statistics.selection(selection)
+        if stats is None:
+            self.__roi_label.clear()
+            return
+        channels = ', '.join(
+            f'{name}: mean = {c.mean:.1f}, std = {c.stddev:.1f}, min = {c.min:.0f}, '
+            f'max = {c.max:.0f}' for name, c in stats.channels.items())
+        self.__roi_label.setText(f'ROI: {stats.pixel_count} px; {channels}')
 
     @Slot(Action)
     def display_action_result(self, action: Action):
-        image_bgr = self.__action_processor.process(action, self.__current_mat_bgr)
+        level = self.__pyramid.choose_level(self.__current_mat_bgr, self.PREVIEW_MAX_PIXELS)
+        self.__preview_executor.submit(action, self.__current_mat_bgr, level)
+        if level > 0:
+            self.__settled_action = action
+            self.__settle_timer.start(self.PREVIEW_SETTLE_MSEC)
+
+    @Slot()
+    def __on_preview_settled(self):
+        if self.__settled_action is not None:
+            self.__preview_executor.submit(self.__settled_action, self.__current_mat_bgr)
+            self.__settled_action = None
+
+    def __cancel_previews(self):
+        self.__settle_timer.stop()
+        self.__settled_action = None
+        self.__reduced_preview = None
+        self.__preview_executor.cancel()
+
+    @Slot(Action, np.ndarray, int)
+    def __on_preview_ready(self, action: Action, image_bgr: np.ndarray, level: int):
+        self.__reduced_preview = (image_bgr, level) if level > 0 else None
         self.__mat_view.render_bgr_mat(image_bgr)
 
+    @Slot(Action, str)
+    def __on_preview_failed(self, action: Action, error: str):
+        self.__status_label.setText(f'Unable to preview {action.to_string()}: {error}')
+
     @Slot(Action)
     def apply_action_result(self, action: Action):
+        self.__cancel_previews()
         self.__current_mat_bgr = self.__action_processor.process(action, self.__current_mat_bgr)
         self.__history_manager.add_entry(HistoryEntry(action, self.__current_mat_bgr))
         self.__mat_view.render_bgr_mat(self.__current_mat_bgr)
 
     @Slot()
     def discard_non_applied_changes(self):
+        self.__cancel_previews()
         self.__mat_view.render_bgr_mat(self.__current_mat_bgr)
 
     def __connect_current_dialog(self):
@@ -178,6 +369,7 @@ class MainWindow(QMainWindow):
 
     @Slot(HistoryEntry)
     def __on_apply_history_entry(self, entry: HistoryEntry):
-        if entry is not None and entry.mat_bgr is not None:
-            self.__current_mat_bgr = entry.mat_bgr
+        if entry is not None:
+            self.__cancel_previews()
+            self.__current_mat_bgr = self.__history_manager.get_mat_bgr(entry)
             self.__mat_view.render_bgr_mat(self.__current_mat_bgr)
\ No newline at end of file
@@ -0,0 +1,115 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from typing import Optional, Tuple
+
+import numpy as np
+from PySide2.QtCore import QObject, Signal, Slot, QRunnable, QThreadPool
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import Action
+from cvisiontool.core.pyramid import MatPyramid, scale_action
+
+
+class _PreviewSignals(QObject):
+    finished = Signal(int, Action, int, object, str)
+
+
+class _PreviewJob(QRunnable):
+    def __init__(self, generation: int, action: Action, mat_bgr: np.ndarray, level: int,
+                 pyramid: MatPyramid, action_processor: ActionProcessor,
+                 signals: _PreviewSignals):
+        super().__init__()
+        self.__generation = generation
+        self.__action = action
+        self.__mat_bgr = mat_bgr
+        self.__level = level
+        self.__pyramid = pyramid
+        self.__action_processor = action_processor
+        self.__signals = signals
+
+    def run(self):
+        try:
+            mat_bgr = self.__pyramid.get_level(self.__mat_bgr, self.__level)
+            result = self.__action_processor.process(scale_action(self.__action, self.__level),
+                                                     mat_bgr)
+            self.__signals.finished.emit(self.__generation, self.__action, self.__level, result, '')
+        except Exception as e:  # pylint: disable=broad-except
+            self.__signals.finished.emit(self.__generation, self.__action, self.__level,
+                                         None, str(e))
+
+
+class PreviewExecutor(QObject):
+    """
+        Computes previews of actions off the GUI thread with latest-wins coalescing.
+        Every submitted job gets a generation number. At most one job runs at a time and
+        at most one waits, a newly submitted job replaces the waiting one. Results of jobs
+        superseded by a newer 'submit' or by 'cancel' are dropped, so only the newest
+        preview is emitted.
+        A job can run on a downscaled pyramid level of the mat with spatial params of the
+        action scaled accordingly (see 'scale_action'), the emitted action is the source one.
+        'result_ready' also carries the level, coordinates of the result have to be multiplied
+        by 2 ** level to get coordinates of the source mat.
+    """
+    result_ready = Signal(Action, np.ndarray, int)
+    failed = Signal(Action, str)
+
+    def __init__(self, action_processor: ActionProcessor, pyramid: Optional[MatPyramid] = None,
+                 parent=None):
+        super().__init__(parent)
+        self.__action_processor = action_processor
+        self.__pyramid = pyramid if pyramid is not None else MatPyramid()
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(1)
+        self.__signals = _PreviewSignals(self)
+        self.__signals.finished.connect(self.__on_job_finished)
+        self.__generation = 0
+        self.__is_running = False
+        self.__pending: Optional[Tuple[int, Action, np.ndarray, int]] = None
+
+    def submit(self, action: Action, mat_bgr: np.ndarray, level: int = 0):
+        self.__generation += 1
+        self.__pending = (self.__generation, action, mat_bgr, level)
+        self.__start_pending()
+
+    def cancel(self):
+        self.__generation += 1
+        self.__pending = None
+
+    def get_generation(self) -> int:
+        return self.__generation
+
+    def wait_for_done(self, msecs: int = -1) -> bool:
+        return self.__pool.waitForDone(msecs)
+
+    def __start_pending(self):
+        if self.__is_running or self.__pending is None:
+            return
+        generation, action, mat_bgr, level = self.__pending
+        self.__pending = None
+        self.__is_running = True
+        self.__pool.start(_PreviewJob(generation, action, mat_bgr, level, self.__pyramid,
+                                      self.__action_processor, self.__signals))
+
+    @Slot(int, Action, int, object, str)
+    def __on_job_finished(self, generation: int, action: Action, level: int,
+                          result: Optional[np.ndarray], error: str):
+        self.__is_running = False
+        if generation == self.__generation:
+            if result is not None:
+                self.result_ready.emit(action, result, level)
+            else:
+                self.failed.emit(action, error)
+        self.__start_pending()
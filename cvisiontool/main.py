@@ -15,14 +15,35 @@
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import sys
-from PySide2.QtWidgets import QApplication
 
-from cvisiontool.gui.mainwindow import MainWindow
+from cvisiontool.core.tracing import enable_tracing_from_environment
 
-app = QApplication(sys.argv)
 
-main_window = MainWindow()
-main_window.resize(800, 600)
-main_window.show()
+def run_gui() -> int:
+    from PySide2.QtWidgets import QApplication
 
-sys.exit(app.exec_())
\ No newline at end of file
+    from cvisiontool.gui.mainwindow import MainWindow
+
+    app = QApplication(sys.argv)
+
+    main_window = MainWindow()
+    main_window.resize(800, 600)
+    main_window.show()
+
+    return app.exec_()
+
+
+def main() -> int:
+    enable_tracing_from_environment()
+    # Headless commands must not import Qt
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from cvisiontool.batch import main as batch_main
+        return batch_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        from cvisiontool.benchmark import main as benchmark_main
+        return benchmark_main(sys.argv[2:])
+    return run_gui()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
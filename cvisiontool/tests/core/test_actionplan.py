@@ -0,0 +1,76 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import cv2.cv2 as cv
+import pytest
+
+from cvisiontool.core.actionplan import ActionChainOptimizer
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory, ActionType
+
+
+def _run_naive(actions, mat):
+    processor = ActionProcessor()
+    for action in actions:
+        mat = processor.process(action, mat)
+    return mat
+
+
+@pytest.mark.parametrize('actions, expected_types', [
+    ([ActionFactory.create_erosion_action(cv.MORPH_RECT, 2),
+      ActionFactory.create_erosion_action(cv.MORPH_RECT, 3),
+      ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)],
+     [ActionType.EROSION]),
+    ([ActionFactory.create_erosion_action(cv.MORPH_ELLIPSE, 2),
+      ActionFactory.create_dilation_action(cv.MORPH_ELLIPSE, 2)],
+     [ActionType.MORPH_OPENING]),
+    ([ActionFactory.create_dilation_action(cv.MORPH_CROSS, 3),
+      ActionFactory.create_erosion_action(cv.MORPH_CROSS, 0),
+      ActionFactory.create_erosion_action(cv.MORPH_CROSS, 3),
+      ActionFactory.create_morph_closing_action(cv.MORPH_CROSS, 3)],
+     [ActionType.MORPH_CLOSING]),
+    ([ActionFactory.create_erosion_action(cv.MORPH_RECT, 1),
+      ActionFactory.create_erosion_action(cv.MORPH_RECT, 1),
+      ActionFactory.create_dilation_action(cv.MORPH_RECT, 2),
+      ActionFactory.create_morph_gradient_action(cv.MORPH_RECT, 2)],
+     [ActionType.MORPH_OPENING, ActionType.MORPH_GRADIENT]),
+    ([ActionFactory.create_erosion_action(cv.MORPH_CROSS, 1),
+      ActionFactory.create_erosion_action(cv.MORPH_CROSS, 1)],
+     [ActionType.EROSION, ActionType.EROSION]),
+])
+def test_optimized_plan_is_equivalent_to_original_chain(actions, expected_types):
+    mat = np.random.default_rng(1).integers(0, 256, (41, 57, 3), dtype=np.uint8)
+    optimizer = ActionChainOptimizer()
+
+    plan = optimizer.optimize(actions)
+
+    assert [a.action_type for a in plan.get_actions()] == expected_types
+    assert np.array_equal(optimizer.execute(plan, mat), _run_naive(actions, mat))
+
+
+def test_explain_lists_fused_and_dropped_actions():
+    plan = ActionChainOptimizer().optimize([
+        ActionFactory.create_dilation_action(cv.MORPH_RECT, 0),
+        ActionFactory.create_erosion_action(cv.MORPH_RECT, 2),
+        ActionFactory.create_erosion_action(cv.MORPH_RECT, 3)
+    ])
+
+    explanation = plan.explain()
+
+    assert 'Plan: 3 action(s) -> 1 step(s)' in explanation
+    assert 'merge_rect_erosions' in explanation
+    assert 'dropped by "noop"' in explanation
+    assert plan.get_actions()[0].params['anchor'] == 5
@@ -0,0 +1,152 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import tracemalloc
+
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor, MorphologyParams, InRangeParams, \
+    run_compiled_chain
+from cvisiontool.core.actions import ActionFactory, Action, ActionType
+from cvisiontool.core.bufferpool import BufferPool
+from cvisiontool.core.planes import DerivedPlaneCache
+
+
+def _create_image():
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 256, (60, 80, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('create_action, op', [
+    (ActionFactory.create_erosion_action, cv.MORPH_ERODE),
+    (ActionFactory.create_dilation_action, cv.MORPH_DILATE),
+    (ActionFactory.create_morph_gradient_action, cv.MORPH_GRADIENT),
+    (ActionFactory.create_morph_opening_action, cv.MORPH_OPEN),
+    (ActionFactory.create_morph_closing_action, cv.MORPH_CLOSE)
+])
+def test_compiled_morphology_matches_opencv(create_action, op):
+    mat = _create_image()
+    compiled = ActionProcessor().compile(create_action(cv.MORPH_ELLIPSE, 2))
+
+    expected = cv.morphologyEx(mat, op, cv.getStructuringElement(cv.MORPH_ELLIPSE, (5, 5)))
+
+    assert compiled.params == MorphologyParams(op, cv.MORPH_ELLIPSE, 2)
+    assert np.array_equal(compiled(mat), expected)
+
+
+def test_compiled_in_range_resolves_plane_and_boundaries():
+    mat = _create_image()
+    action = ActionFactory.create_in_range_action('hsv', [10, 50, 50], [100, 255, 255])
+    compiled = ActionProcessor().compile(action)
+
+    expected = cv.inRange(cv.cvtColor(mat, cv.COLOR_BGR2HSV), np.array([10, 50, 50]),
+                          np.array([100, 255, 255]))
+
+    assert isinstance(compiled.params, InRangeParams)
+    assert compiled.params.plane == DerivedPlaneCache.HSV
+    assert not compiled.params.lower_boundary.flags.writeable
+    assert compiled.action is action
+    assert np.array_equal(compiled(mat), expected)
+
+
+def test_compiled_action_is_reused_for_different_mats():
+    processor = ActionProcessor()
+    action = ActionFactory.create_find_contours_action(cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    compiled = processor.compile(action)
+
+    for seed in range(3):
+        mask = np.random.default_rng(seed).integers(0, 2, (40, 50), dtype=np.uint8) * 255
+        assert np.array_equal(compiled(mask), processor.process(action, mask))
+
+
+@pytest.mark.parametrize('action', [
+    ActionFactory.create_erosion_action(100, 1),
+    ActionFactory.create_in_range_action('xyz', [0, 0, 0], [1, 1, 1]),
+    ActionFactory.create_in_range_action('hsv', [0, 0], [1, 1, 1]),
+    ActionFactory.create_find_contours_action(cv.RETR_TREE, 100),
+    ActionFactory.create_connected_components_action(connectivity=6),
+    Action(ActionType.HOUGH_CIRCLE, {'method': cv.HOUGH_GRADIENT}),
+    ActionFactory.create_image_loaded_action('image.png')
+])
+def test_compile_validates_params_before_any_mat(action):
+    with pytest.raises(ValueError):
+        ActionProcessor().compile(action)
+
+
+@pytest.mark.parametrize('action', [
+    ActionFactory.create_dilation_action(cv.MORPH_CROSS, 15),
+    ActionFactory.create_morph_gradient_action(cv.MORPH_RECT, 1),
+    ActionFactory.create_in_range_action('lab', [0, 100, 100], [200, 160, 160]),
+    ActionFactory.create_hough_circle_action(cv.HOUGH_GRADIENT, 1, 10, 100, 30, 0, 0),
+    ActionFactory.create_find_contours_action(cv.RETR_LIST, cv.CHAIN_APPROX_NONE),
+    ActionFactory.create_connected_components_action(min_area=3)
+])
+def test_compiled_action_writes_into_dst(action):
+    mat = _create_image()
+    compiled = ActionProcessor().compile(action)
+    shape, dtype = compiled.get_output_spec(mat)
+    dst = np.empty(shape, dtype)
+
+    result = compiled(mat, dst)
+
+    assert result is dst
+    assert np.array_equal(dst, compiled(mat))
+
+
+def test_morphology_chain_does_not_allocate_after_first_mat():
+    processor = ActionProcessor()
+    chain = [processor.compile(ActionFactory.create_erosion_action(cv.MORPH_CROSS, 30)),
+             processor.compile(ActionFactory.create_morph_gradient_action(cv.MORPH_CROSS, 30)),
+             processor.compile(ActionFactory.create_dilation_action(cv.MORPH_RECT, 1))]
+    pool = BufferPool()
+    expected = None
+    first_run_allocations = 0
+    peak = 0
+
+    for i in range(5):
+        source = pool.acquire((200, 300, 3))
+        source[...] = np.random.default_rng(7).integers(0, 256, (200, 300, 3), dtype=np.uint8)
+        if i == 4:
+            tracemalloc.start()
+        try:
+            result = run_compiled_chain(chain, source, pool)
+            if i == 4:
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if i == 4:
+                tracemalloc.stop()
+        if expected is None:
+            expected = result.copy()
+            first_run_allocations = pool.get_allocation_count()
+        assert np.array_equal(result, expected)
+        pool.release(result)
+
+    # All mats have the same shape, released intermediates are reused by the next action
+    assert pool.get_allocation_count() == first_run_allocations == 2
+    assert peak < source.nbytes // 10
+    assert pool.get_leased_count() == 0
+
+
+def test_hough_circles_result_is_always_bgr():
+    gray = np.zeros((60, 80), np.uint8)
+    action = ActionFactory.create_hough_circle_action(cv.HOUGH_GRADIENT, 1, 10, 100, 30, 0, 0)
+    compiled_action = ActionProcessor().compile(action)
+
+    result = compiled_action(gray)
+
+    assert result.shape == (60, 80, 3)
+    assert compiled_action.get_output_spec(gray) == ((60, 80, 3), np.dtype(np.uint8))
@@ -0,0 +1,67 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actions import ActionFactory, Action
+from cvisiontool.core.batch import BatchRunner, load_action_chain
+
+
+def _write_images(input_dir, names):
+    for i, name in enumerate(names):
+        path = os.path.join(input_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv.imwrite(path, np.full((8, 8, 3), i * 10, dtype=np.uint8))
+
+
+def test_action_from_json_restores_to_json_value():
+    action = ActionFactory.create_in_range_action('hsv', [1, 2, 3], [4, 5, 6])
+    assert Action.from_json(json.loads(json.dumps(action.to_json()))) == action
+
+
+def test_load_action_chain_skips_image_loaded(tmp_path):
+    chain_path = tmp_path / 'chain.json'
+    chain_path.write_text(json.dumps([
+        ActionFactory.create_image_loaded_action('a.png').to_json(),
+        ActionFactory.create_erosion_action(cv.MORPH_RECT, 1).to_json()
+    ]))
+    assert load_action_chain(str(chain_path)) == [
+        ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)]
+
+
+def test_batch_runner_resumes_from_manifest(tmp_path):
+    input_dir, output_dir = str(tmp_path / 'in'), str(tmp_path / 'out')
+    _write_images(input_dir, ['a.png', 'sub/b.png', 'sub/c.png'])
+    actions = [ActionFactory.create_dilation_action(cv.MORPH_RECT, 1)]
+
+    first = BatchRunner(actions, workers=2).run(input_dir, output_dir)
+    os.remove(os.path.join(output_dir, 'sub', 'c.png'))
+    with open(os.path.join(output_dir, BatchRunner.MANIFEST_NAME), 'r+') as manifest:
+        lines = manifest.readlines()
+        manifest.seek(0)
+        manifest.truncate()
+        manifest.writelines(line for line in lines if 'sub/c.png' not in line)
+        manifest.write('{"input": "torn')
+    second = BatchRunner(actions).run(input_dir, output_dir)
+
+    assert (first.processed, first.skipped, first.failed) == (3, 0, 0)
+    assert (second.processed, second.skipped, second.failed) == (1, 2, 0)
+    assert os.path.exists(os.path.join(output_dir, 'sub', 'c.png'))
+    third = BatchRunner(actions).run(input_dir, output_dir)
+    assert (third.processed, third.skipped, third.failed) == (0, 3, 0)
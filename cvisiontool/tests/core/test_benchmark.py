@@ -0,0 +1,72 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from cvisiontool.core.actions import ActionType
+from cvisiontool.core.benchmark import BenchmarkRunner, BenchmarkResult, create_cases, \
+    create_synthetic_image, save_results, load_results, compare_results, measure_headless_startup
+
+
+def _create_result(name, median_sec):
+    return BenchmarkResult(name=name, action={}, megapixels=0.3, shape=[10, 10, 3], repeats=1,
+                           min_sec=median_sec, median_sec=median_sec, mean_sec=median_sec)
+
+
+def test_cases_cover_every_strategy():
+    cases = create_cases(megapixels=(0.3, 2.0), anchors=(1, 5))
+
+    assert {case.action.action_type for case in cases} == set(ActionType) - {
+        ActionType.IMAGE_LOADED}
+    assert len(cases) == len({case.name for case in cases}) == 2 * (5 * 3 * 2 + 2 + 2 + 1 + 1)
+
+
+def test_synthetic_image_is_reproducible():
+    mat = create_synthetic_image(0.01, seed=3)
+
+    assert mat.shape == (86, 115, 3)
+    assert np.array_equal(mat, create_synthetic_image(0.01, seed=3))
+
+
+def test_results_round_trip_and_comparison(tmp_path):
+    cases = [case for case in create_cases(megapixels=(0.01,), anchors=(1,))
+             if 'gradient_alt' not in case.name]
+    results = BenchmarkRunner(repeats=1, warmup=0).run(cases)
+    path = str(tmp_path / 'results.json')
+    save_results(path, results)
+
+    assert load_results(path) == results
+    assert not compare_results(results, results).has_regressions()
+
+
+def test_comparison_applies_thresholds():
+    baseline = [_create_result('a', 0.1), _create_result('b', 0.1), _create_result('c', 0.001),
+                _create_result('gone', 0.1)]
+    current = [_create_result('a', 0.15), _create_result('b', 0.05), _create_result('c', 0.002),
+               _create_result('new', 0.1)]
+
+    comparison = compare_results(current, baseline, threshold=0.2)
+
+    assert [change.name for change in comparison.regressions] == ['a']
+    assert comparison.regressions[0].get_ratio() == pytest.approx(1.5)
+    assert [change.name for change in comparison.improvements] == ['b']
+    assert comparison.missing == ['gone']
+    assert comparison.added == ['new']
+    assert not compare_results(current, baseline, thresholds={'a': 0.6}).has_regressions()
+
+
+def test_headless_modules_do_not_import_qt():
+    assert measure_headless_startup(repeats=1).gui_modules == []
@@ -0,0 +1,77 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from cvisiontool.core.bufferpool import BufferPool
+
+
+def test_released_buffer_is_reused_under_a_new_view():
+    pool = BufferPool()
+    first = pool.acquire((4, 5, 3))
+    first_base = first.base
+    pool.release(first)
+
+    second = pool.acquire((4, 5, 3), np.uint8)
+
+    assert second is not first
+    assert second.base is first_base
+    assert pool.get_allocation_count() == 1
+    assert pool.get_leased_count() == 1
+
+
+def test_buffers_are_keyed_by_shape_and_dtype():
+    pool = BufferPool()
+    pool.release(pool.acquire((4, 5)))
+
+    pool.acquire((4, 5), np.float32)
+    pool.acquire((5, 4))
+
+    assert pool.get_allocation_count() == 3
+    assert pool.get_free_count() == 1
+
+
+def test_foreign_and_repeated_releases_are_ignored():
+    pool = BufferPool()
+    buffer = pool.acquire((8, 8))
+    pool.release(np.zeros((8, 8), np.uint8))
+    pool.release(buffer[:4])
+    pool.release(buffer)
+    pool.release(buffer)
+
+    assert pool.get_free_count() == 1
+    assert pool.get_leased_count() == 0
+
+
+def test_free_buffers_are_limited_per_key():
+    pool = BufferPool(max_free_buffers_per_key=2)
+    buffers = [pool.acquire((3, 3)) for _ in range(5)]
+    for buffer in buffers:
+        pool.release(buffer)
+
+    assert pool.get_free_count() == 2
+
+
+def test_forgotten_buffers_are_not_kept_leased():
+    pool = BufferPool()
+    pool.acquire((3, 3))
+
+    assert pool.get_leased_count() == 0
+
+
+def test_negative_limit_is_rejected():
+    with pytest.raises(ValueError):
+        BufferPool(max_free_buffers_per_key=-1)
@@ -0,0 +1,81 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor, ConnectedComponentsStrategy
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.components import label_components
+from cvisiontool.core.pyramid import scale_action
+
+
+def _create_mask():
+    mask = np.zeros((100, 200), np.uint8)
+    mask[10:20, 10:20] = 255  # 10x10 square
+    mask[40:45, 10:70] = 255  # 60x5 bar
+    mask[70:72, 150:152] = 255  # 2x2 speck
+    mask[80, 180] = 255
+    mask[81, 181] = 255  # diagonal pair, joined only with 8-connectivity
+    return mask
+
+
+def test_labels_and_stats_of_components():
+    components = label_components(_create_mask(), connectivity=8)
+
+    assert components.get_count() == 4
+    assert components.labels.dtype == np.int32
+    assert components.stats.label.tolist() == [1, 2, 3, 4]
+    assert sorted(components.stats.area.tolist()) == [2, 4, 100, 300]
+    square = components.stats[components.stats.area == 100][0]
+    assert (square.x, square.y, square.width, square.height) == (10, 10, 10, 10)
+    assert (square.centroid_x, square.centroid_y) == (14.5, 14.5)
+    assert label_components(_create_mask(), connectivity=4).get_count() == 5
+
+
+def test_filter_relabels_kept_components():
+    components = label_components(_create_mask())
+
+    by_area = components.filter(min_area=50)
+    bars = components.filter(min_aspect_ratio=5)
+    inside = components.filter(bbox=[0, 0, 100, 50])
+
+    assert by_area.stats.label.tolist() == [1, 2]
+    assert sorted(by_area.stats.area.tolist()) == [100, 300]
+    assert np.array_equal(np.unique(by_area.labels), [0, 1, 2])
+    assert np.count_nonzero(by_area.to_mask()) == 400
+    assert bars.get_count() == 1 and bars.stats[0].width == 60
+    assert np.count_nonzero(bars.labels == 1) == 300
+    assert inside.get_count() == 2
+    assert components.filter() is components
+
+
+def test_connected_components_action():
+    mat = cv.cvtColor(_create_mask(), cv.COLOR_GRAY2BGR)
+    action = ActionFactory.create_connected_components_action(min_area=50, max_area=200)
+
+    result = ActionProcessor().process(action, mat)
+
+    assert result.shape == mat.shape and result.dtype == np.uint8
+    assert np.count_nonzero(result.any(axis=2)) == 100
+    assert ConnectedComponentsStrategy().analyze(action, mat).get_count() == 1
+    with pytest.raises(ValueError):
+        ActionProcessor().process(
+            ActionFactory.create_connected_components_action(connectivity=6), mat)
+    scaled = scale_action(ActionFactory.create_connected_components_action(
+        min_area=50, max_area=201, bbox=[3, 3, 10, 10]), 1)
+    assert (scaled.params['min_area'], scaled.params['max_area']) == (12, 51)
+    assert scaled.params['bbox'] == [1, 1, 6, 6]
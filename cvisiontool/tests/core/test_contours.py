@@ -0,0 +1,73 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor, FindContoursStrategy
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.contours import find_contours, compute_contour_features
+
+
+def _create_mask():
+    mask = np.zeros((120, 160), np.uint8)
+    cv.rectangle(mask, (10, 10), (70, 60), 255, -1)
+    cv.rectangle(mask, (25, 25), (45, 40), 0, -1)
+    cv.circle(mask, (120, 80), 20, 255, -1)
+    cv.line(mask, (100, 5), (150, 5), 255, 1)
+    return mask
+
+
+@pytest.mark.parametrize('method', [cv.CHAIN_APPROX_NONE, cv.CHAIN_APPROX_SIMPLE])
+def test_features_match_per_contour_opencv_functions(method):
+    contours, hierarchy = find_contours(_create_mask(), cv.RETR_TREE, method)
+
+    features = compute_contour_features(contours, hierarchy)
+
+    assert len(features) == len(contours) == 4
+    assert np.allclose(features.area, [cv.contourArea(c) for c in contours])
+    assert np.allclose(features.perimeter, [cv.arcLength(c, True) for c in contours])
+    assert np.array_equal(np.stack([features.x, features.y, features.width, features.height], 1),
+                          np.array([cv.boundingRect(c) for c in contours]))
+    assert np.array_equal(features.parent, hierarchy[:, 3])
+    for feature, contour in zip(features, contours):
+        moments = cv.moments(contour)
+        if moments['m00'] != 0:
+            assert feature.centroid_x == pytest.approx(moments['m10'] / moments['m00'])
+            assert feature.centroid_y == pytest.approx(moments['m01'] / moments['m00'])
+    line = features[features.area == 0][0]
+    assert (line.centroid_x, line.centroid_y) == (125, 5)
+
+
+def test_no_contours_give_empty_features():
+    contours, hierarchy = find_contours(np.zeros((10, 10), np.uint8), cv.RETR_LIST,
+                                        cv.CHAIN_APPROX_SIMPLE)
+
+    assert len(compute_contour_features(contours, hierarchy)) == 0
+
+
+def test_find_contours_action_draws_contours_on_bgr_copy():
+    mat = cv.cvtColor(_create_mask(), cv.COLOR_GRAY2BGR)
+    action = ActionFactory.create_find_contours_action(cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+
+    result = ActionProcessor().process(action, mat)
+
+    assert result.shape == mat.shape and result is not mat
+    assert tuple(result[10, 10]) == (0, 255, 0)
+    assert len(FindContoursStrategy().analyze(action, mat)) == 3
+    with pytest.raises(ValueError):
+        ActionProcessor().process(ActionFactory.create_find_contours_action(cv.RETR_TREE, 42),
+                                  mat)
@@ -0,0 +1,34 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+from cvisiontool.core.events import Event
+
+
+def test_event_calls_callbacks_in_connection_order():
+    event = Event()
+    calls = []
+    first = lambda value: calls.append(('first', value))
+    event.connect(first)
+    event.connect(lambda value: calls.append(('second', value)))
+
+    event.emit(1)
+    event.disconnect(first)
+    event.emit(2)
+
+    assert calls == [('first', 1), ('second', 1), ('second', 2)]
+    with pytest.raises(ValueError):
+        event.disconnect(first)
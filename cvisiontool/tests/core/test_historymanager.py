@@ -13,7 +13,13 @@
 #  #
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from cvisiontool.core.historymanager import HistoryList
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.historymanager import HistoryList, HistoryManager, HistoryEntry
 
 
 def test_history_list_remove_newer_than_for_empty_list():
@@ -42,4 +48,154 @@ def test_history_list_remove_newer_than_for_multiple_elements():
     lst.remove_newer_than(3)
     actual = lst.get_all_newest_first()
     assert len(actual) == 3
-    assert all([e == a for a, e in zip(actual, [3, 4, 5])])
\ No newline at end of file
+    assert all([e == a for a, e in zip(actual, [3, 4, 5])])
+
+
+def _create_history(manager, count, shape=(40, 50, 3)):
+    processor = ActionProcessor()
+    mat = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    manager.add_entry(HistoryEntry(ActionFactory.create_image_loaded_action('a.png'), mat))
+    expected = [mat]
+    for i in range(count - 1):
+        action = ActionFactory.create_dilation_action(cv.MORPH_RECT, i % 3) if i % 2 == 0 \
+            else ActionFactory.create_erosion_action(cv.MORPH_CROSS, 1)
+        mat = processor.process(action, mat)
+        manager.add_entry(HistoryEntry(action, mat))
+        expected.append(mat)
+    return expected
+
+
+def test_history_manager_rebuilds_results_within_memory_budget():
+    manager = HistoryManager(memory_budget=3 * 40 * 50 * 3, checkpoint_interval=3)
+
+    expected = _create_history(manager, 10)
+
+    assert manager.get_memory_bytes() <= 3 * 40 * 50 * 3
+    entries = list(reversed(manager.get_entries()))
+    assert all(e.mat_bgr is None for e in entries)
+    assert all(np.array_equal(manager.get_mat_bgr(e), m) for e, m in zip(entries, expected))
+
+
+def test_history_manager_spills_compressed_results(tmp_path):
+    manager = HistoryManager(memory_budget=2 * 40 * 50 * 3, checkpoint_interval=100,
+                             spill_dir=str(tmp_path))
+
+    expected = _create_history(manager, 6)
+    entries = list(reversed(manager.get_entries()))
+    spilled = len(list(tmp_path.iterdir()))
+    manager.remove_newer_than(entries[1])
+
+    assert spilled > 0
+    assert len(list(tmp_path.iterdir())) < spilled
+    assert np.array_equal(manager.get_mat_bgr(entries[1]), expected[1])
+
+
+def test_history_list_index_of_after_truncate():
+    lst = HistoryList()
+    elements = [object() for _ in range(4)]
+    for element in elements:
+        lst.add(element)
+    lst.add(elements[0])
+
+    lst.truncate(3)
+
+    assert len(lst) == 3
+    assert lst.index_of(elements[0]) == 0
+    assert lst.index_of(elements[3]) is None
+    assert lst.get(2) is elements[2]
+
+
+def test_history_manager_emits_granular_changes():
+    manager = HistoryManager()
+    inserted, removed = [], []
+    manager.entries_inserted.connect(lambda first, last: inserted.append((first, last)))
+    manager.entries_removed.connect(lambda first, last: removed.append((first, last)))
+
+    _create_history(manager, 4)
+    manager.remove_newer_than(manager.get_entry(1))
+
+    assert inserted == [(0, 0), (1, 1), (2, 2), (3, 3)]
+    assert removed == [(2, 3)]
+    assert manager.get_entry_count() == 2
+
+
+def test_history_manager_recomputes_only_changed_downstream_entries():
+    manager = HistoryManager(checkpoint_interval=2)
+    expected = _create_history(manager, 6)
+    changed = []
+    manager.entries_changed.connect(lambda first, last: changed.append((first, last)))
+    edited = manager.get_entry(3)
+
+    recomputed = manager.update_action_params(edited, {'shape': cv.MORPH_CROSS, 'anchor': 2})
+
+    processor = ActionProcessor()
+    mat = expected[2]
+    for index in range(3, 6):
+        mat = processor.process(manager.get_entry(index).action, mat)
+        assert np.array_equal(manager.get_mat_bgr(manager.get_entry(index)), mat)
+    assert manager.get_entry(3).action.params['anchor'] == 2
+    assert recomputed == 3
+    assert changed == [(3, 5)]
+
+
+def test_history_manager_short_circuits_identical_results():
+    manager = HistoryManager()
+    expected = _create_history(manager, 5)
+    params = dict(manager.get_entry(2).action.params)
+
+    recomputed = manager.update_action_params(manager.get_entry(2), params)
+
+    assert recomputed == 1
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(4)), expected[4])
+
+
+def test_history_manager_keeps_history_when_recomputation_fails():
+    manager = HistoryManager(checkpoint_interval=1)
+    expected = _create_history(manager, 4)
+    edited = manager.get_entry(1)
+    bad_action = ActionFactory.create_erosion_action(42, 1)
+    manager.add_entry(HistoryEntry(bad_action, expected[-1]))
+
+    with pytest.raises(ValueError):
+        manager.update_action_params(edited, {'shape': cv.MORPH_RECT, 'anchor': 2})
+
+    assert manager.get_entry(1) is edited
+    for index, mat in enumerate(expected):
+        assert np.array_equal(manager.get_mat_bgr(manager.get_entry(index)), mat)
+
+
+def test_history_manager_stops_recomputation_at_loaded_image():
+    manager = HistoryManager(checkpoint_interval=1)
+    expected = _create_history(manager, 3)
+    loaded = np.zeros((10, 10, 3), np.uint8)
+    manager.add_entry(HistoryEntry(ActionFactory.create_image_loaded_action('b.png'), loaded))
+    manager.add_entry(HistoryEntry(ActionFactory.create_erosion_action(cv.MORPH_RECT, 1),
+                                   loaded))
+    changed = []
+    manager.entries_changed.connect(lambda first, last: changed.append((first, last)))
+
+    recomputed = manager.update_action_params(manager.get_entry(1),
+                                              {'shape': cv.MORPH_RECT, 'anchor': 2})
+
+    assert recomputed == 2
+    assert changed == [(1, 2)]
+    assert not np.array_equal(manager.get_mat_bgr(manager.get_entry(2)), expected[2])
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(4)), loaded)
+    with pytest.raises(ValueError):
+        manager.update_action_params(manager.get_entry(3), {'filepath': 'c.png'})
+
+
+def test_history_manager_never_drops_loaded_images():
+    manager = HistoryManager(memory_budget=10)
+    first = _create_history(manager, 3)
+    second = np.full((30, 20, 3), 7, np.uint8)
+    manager.add_entry(HistoryEntry(ActionFactory.create_image_loaded_action('b.png'), second))
+    manager.add_entry(HistoryEntry(ActionFactory.create_erosion_action(cv.MORPH_RECT, 1),
+                                   second))
+    manager.add_entry(HistoryEntry(ActionFactory.create_dilation_action(cv.MORPH_RECT, 1),
+                                   second))
+
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(0)), first[0])
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(3)), second)
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(4)), second)
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(2)), first[2])
@@ -0,0 +1,48 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.houghsweep import HoughCircleSweep, HoughSweepGrid
+
+
+def _create_circles_image():
+    mat = np.zeros((200, 300, 3), np.uint8)
+    for center in [(60, 60), (150, 100), (240, 140)]:
+        cv.circle(mat, center, 25, (255, 255, 255), -1)
+    return mat
+
+
+def test_sweep_ranks_param_sets_by_distance_to_target_count():
+    grid = HoughSweepGrid(param2=(0.5, 0.9, 0.99), min_radius=(10,), max_radius=(40, 5))
+
+    results = HoughCircleSweep(workers=2).run(_create_circles_image(), grid, target_count=3)
+
+    assert len(results) == 6
+    assert results[0].circle_count == 3
+    assert results[-1].circle_count != 3
+    assert results[0].to_action().params['max_radius'] == 40
+
+
+def test_sweep_stops_early_on_target():
+    grid = HoughSweepGrid(param2=tuple(np.linspace(0.5, 0.95, 40)), min_radius=(10,),
+                          max_radius=(40,))
+
+    results = HoughCircleSweep(workers=1).run(_create_circles_image(), grid, target_count=3,
+                                              stop_on_target=True)
+
+    assert 0 < len(results) < 40
+    assert results[0].circle_count == 3
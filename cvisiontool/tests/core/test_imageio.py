@@ -0,0 +1,47 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.imageio import choose_preview_reduction, read_image
+
+
+def _write_image(path, shape):
+    mat = cv.resize(np.random.default_rng(0).integers(0, 256, (6, 8, 3), dtype=np.uint8),
+                    (shape[1], shape[0]), interpolation=cv.INTER_CUBIC)
+    cv.imwrite(str(path), mat)
+    return str(path)
+
+
+def test_preview_reduction_is_used_only_for_large_jpegs(tmp_path):
+    jpeg_path = _write_image(tmp_path / 'a.jpg', (600, 800))
+    png_path = _write_image(tmp_path / 'a.png', (600, 800))
+
+    assert choose_preview_reduction(jpeg_path, max_pixels=10_000_000) == 1
+    assert choose_preview_reduction(jpeg_path, max_pixels=1) == 8
+    assert choose_preview_reduction(png_path, max_pixels=1) == 1
+
+
+def test_read_image_decodes_at_reduced_resolution(tmp_path):
+    path = _write_image(tmp_path / 'a.jpg', (600, 800))
+
+    assert read_image(path).shape == (600, 800, 3)
+    assert read_image(path, 4).shape == (150, 200, 3)
+    with pytest.raises(ValueError):
+        read_image(path, 3)
+    with pytest.raises(ValueError):
+        read_image(str(tmp_path / 'missing.jpg'))
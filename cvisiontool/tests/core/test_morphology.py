@@ -0,0 +1,92 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import tracemalloc
+
+import numpy as np
+import cv2.cv2 as cv
+import pytest
+
+from cvisiontool.core.morphology import MorphologyEngine
+
+MORPH_TYPES = [cv.MORPH_ERODE, cv.MORPH_DILATE, cv.MORPH_OPEN, cv.MORPH_CLOSE, cv.MORPH_GRADIENT]
+
+
+def _opencv_reference(mat: np.ndarray, morph_type: int, shape: int, anchor: int) -> np.ndarray:
+    ksize = 2 * anchor + 1
+    element = cv.getStructuringElement(shape, (ksize, ksize), (anchor, anchor))
+    return cv.morphologyEx(mat, morph_type, element)
+
+
+@pytest.mark.parametrize('morph_type', MORPH_TYPES)
+@pytest.mark.parametrize('shape', [cv.MORPH_RECT, cv.MORPH_CROSS, cv.MORPH_ELLIPSE])
+@pytest.mark.parametrize('anchor', [0, 1, 4, 13])
+def test_engine_matches_opencv_when_forced_to_fast_paths(morph_type, shape, anchor):
+    mat = np.random.default_rng(anchor).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    engine = MorphologyEngine(cross_lines_min_ksize=1, vhgw_min_ksize=1)
+
+    actual = engine.morphology_ex(mat, morph_type, shape, anchor)
+
+    assert np.array_equal(actual, _opencv_reference(mat, morph_type, shape, anchor))
+
+
+@pytest.mark.parametrize('morph_type', MORPH_TYPES)
+@pytest.mark.parametrize('shape', [cv.MORPH_RECT, cv.MORPH_CROSS])
+def test_engine_matches_opencv_with_default_thresholds(morph_type, shape):
+    mat = np.random.default_rng(0).integers(0, 256, (64, 48), dtype=np.uint8)
+    engine = MorphologyEngine()
+
+    actual = engine.morphology_ex(mat, morph_type, shape, 20)
+
+    assert np.array_equal(actual, _opencv_reference(mat, morph_type, shape, 20))
+
+
+def test_engine_reuses_structuring_elements():
+    engine = MorphologyEngine()
+    first = engine.get_structuring_element(cv.MORPH_ELLIPSE, 5)
+    second = engine.get_structuring_element(cv.MORPH_ELLIPSE, 5)
+    assert first is second
+    assert not first.flags.writeable
+
+
+@pytest.mark.parametrize('morph_type', MORPH_TYPES)
+@pytest.mark.parametrize('engine', [MorphologyEngine(cross_lines_min_ksize=1),
+                                    MorphologyEngine(cross_lines_min_ksize=1, vhgw_min_ksize=1)])
+def test_engine_fast_paths_write_into_dst(morph_type, engine):
+    mat = np.random.default_rng(1).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    apply = engine.prepare(morph_type, cv.MORPH_CROSS, 6)
+    dst = np.empty_like(mat)
+
+    result = apply(mat, dst=dst)
+
+    assert result is dst
+    assert np.array_equal(dst, _opencv_reference(mat, morph_type, cv.MORPH_CROSS, 6))
+
+
+@pytest.mark.parametrize('morph_type', MORPH_TYPES)
+def test_engine_cross_lines_path_does_not_allocate_frames_with_dst(morph_type):
+    mat = np.random.default_rng(2).integers(0, 256, (200, 300, 3), dtype=np.uint8)
+    apply = MorphologyEngine().prepare(morph_type, cv.MORPH_CROSS, 30)
+    dst = np.empty_like(mat)
+    apply(mat, dst=dst)
+
+    tracemalloc.start()
+    try:
+        apply(mat, dst=dst)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < mat.nbytes // 10
@@ -0,0 +1,100 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gc
+import time
+
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.parallelproc import ParallelActionProcessor
+
+
+@pytest.fixture
+def processor():
+    with ParallelActionProcessor(workers=2) as parallel_processor:
+        yield parallel_processor
+
+
+def _create_mats(count, shape=(40, 60, 3)):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+
+
+def test_process_many_matches_action_processor(processor):
+    mats = _create_mats(3)
+    actions = [ActionFactory.create_dilation_action(cv.MORPH_RECT, 1),
+               ActionFactory.create_in_range_action('hsv', [0, 0, 0], [90, 255, 255]),
+               ActionFactory.create_morph_gradient_action(cv.MORPH_ELLIPSE, 2)]
+
+    results = processor.process_many(actions, mats)
+
+    for action, mat, result in zip(actions, mats, results):
+        expected = ActionProcessor().process(action, mat)
+        assert result.shape == expected.shape and result.dtype == expected.dtype
+        assert np.array_equal(result, expected)
+
+
+def test_results_are_chained_without_copies_and_blocks_are_reused(processor):
+    action = ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)
+    mats = [processor.create_mat((40, 60, 3)) for _ in range(2)]
+    for mat, source in zip(mats, _create_mats(2)):
+        mat[:] = source
+    expected = [ActionProcessor().process(action, ActionProcessor().process(action, mat))
+                for mat in mats]
+
+    results = processor.process_many([action] * 2, processor.process_many([action] * 2, mats))
+    block_count = processor.get_block_count()
+    del results
+    gc.collect()
+    processor.process_many([action] * 2, mats)
+
+    assert block_count == 6
+    assert processor.get_block_count() == block_count
+    assert all(np.array_equal(r, e) for r, e in zip(
+        processor.process_many([action] * 2, processor.process_many([action] * 2, mats)),
+        expected))
+
+
+def test_bigger_results_and_errors(processor):
+    gray = (_create_mats(1, shape=(30, 40))[0] > 128).astype(np.uint8) * 255
+    action = ActionFactory.create_find_contours_action(cv.RETR_LIST, cv.CHAIN_APPROX_SIMPLE)
+
+    result = processor.process(action, gray)
+
+    assert result.shape == (30, 40, 3)
+    assert np.array_equal(result, ActionProcessor().process(action, gray))
+    with pytest.raises(ValueError):
+        processor.process(ActionFactory.create_erosion_action(42, 1), gray)
+    with pytest.raises(ValueError):
+        processor.process_many([action], [])
+
+
+def test_failed_task_does_not_release_blocks_of_running_siblings(processor):
+    white = np.full((1500, 1500, 3), 255, np.uint8)
+    slow_action = ActionFactory.create_dilation_action(cv.MORPH_ELLIPSE, 40)
+    with pytest.raises(ValueError):
+        processor.process_many([ActionFactory.create_erosion_action(42, 1), slow_action],
+                               [white, white])
+
+    result = processor.process(ActionFactory.create_erosion_action(cv.MORPH_RECT, 0),
+                               np.zeros_like(white))
+    # A sibling still running after the failure would overwrite reused blocks later
+    time.sleep(1)
+
+    assert not result.any()
@@ -0,0 +1,49 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.planes import DerivedPlaneCache
+
+
+def test_in_range_session_converts_source_once():
+    planes = DerivedPlaneCache()
+    processor = ActionProcessor(planes=planes)
+    mat = np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    hsv = cv.cvtColor(mat, cv.COLOR_BGR2HSV)
+
+    for upper in range(100, 180, 10):
+        actual = processor.process(
+            ActionFactory.create_in_range_action('hsv', [0, 0, 0], [upper, 255, 255]), mat)
+        assert np.array_equal(actual, cv.inRange(hsv, np.array([0, 0, 0]),
+                                                 np.array([upper, 255, 255])))
+
+    assert planes.get_conversion_count() == 1
+
+
+def test_planes_are_bound_to_recent_sources():
+    planes = DerivedPlaneCache(max_sources=1)
+    first = np.zeros((4, 4, 3), np.uint8)
+    second = np.ones((4, 4, 3), np.uint8)
+    planes.get(first, DerivedPlaneCache.GRAY)
+    planes.get(second, DerivedPlaneCache.GRAY)
+    planes.get(first, DerivedPlaneCache.GRAY)
+    planes.get(first, DerivedPlaneCache.GRAY)
+
+    assert planes.get_conversion_count() == 3
+    assert planes.get_gray(first[:, :, 0]).ndim == 2
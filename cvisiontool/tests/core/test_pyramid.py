@@ -0,0 +1,66 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gc
+import weakref
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.pyramid import MatPyramid, scale_action
+
+
+def test_pyramid_chooses_level_within_pixel_budget_and_reuses_levels():
+    pyramid = MatPyramid()
+    mat = np.zeros((1000, 800, 3), np.uint8)
+
+    level = pyramid.choose_level(mat, 60_000)
+    first = pyramid.get_level(mat, level)
+
+    assert level == 2
+    assert first.shape == (250, 200, 3)
+    assert pyramid.get_level(mat, level) is first
+    assert pyramid.get_level(np.zeros((8, 8), np.uint8), 1).shape == (4, 4)
+
+
+def test_scale_action_scales_spatial_params():
+    erosion = scale_action(ActionFactory.create_erosion_action(cv.MORPH_RECT, 9), 2)
+    noop = scale_action(ActionFactory.create_erosion_action(cv.MORPH_RECT, 0), 2)
+    hough = scale_action(ActionFactory.create_hough_circle_action(
+        cv.HOUGH_GRADIENT, 1.5, 40, 100, 30, 8, 0), 2)
+    hough_alt = scale_action(ActionFactory.create_hough_circle_action(
+        cv.HOUGH_GRADIENT_ALT, 1.5, 40, 100, 0.9, 8, 0), 2)
+
+    assert erosion.params['anchor'] == 2
+    assert noop.params['anchor'] == 0
+    assert (hough.params['dp'], hough.params['min_dist'], hough.params['min_radius'],
+            hough.params['max_radius'], hough.params['param2']) == (1.5, 10, 2, 0, 7.5)
+    assert hough_alt.params['param2'] == 0.9
+
+
+def test_pyramid_keeps_only_derived_levels_of_a_live_source():
+    pyramid = MatPyramid()
+    mat = np.zeros((64, 64), np.uint8)
+    source_ref = weakref.ref(mat)
+
+    pyramid.get_level(mat, 3)
+    level_count = pyramid.get_level_count()
+    del mat
+    gc.collect()
+
+    assert level_count == 3
+    assert source_ref() is None
+    assert pyramid.get_level_count() == 0
@@ -0,0 +1,83 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.regionstats import RegionStatistics, BrushSelection
+
+
+def _assert_stats(stats, names, pixels):
+    assert stats.pixel_count == len(pixels)
+    for i, name in enumerate(names):
+        channel = stats.channels[name]
+        assert np.isclose(channel.mean, pixels[:, i].mean())
+        assert np.isclose(channel.stddev, pixels[:, i].std())
+        assert (channel.min, channel.max) == (pixels[:, i].min(), pixels[:, i].max())
+
+
+def test_rect_stats_match_direct_computation():
+    mat = np.random.default_rng(0).integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    stats = RegionStatistics(mat).rect(10, 5, 30, 20)
+
+    hsv = cv.cvtColor(mat, cv.COLOR_BGR2HSV)
+    _assert_stats(stats, 'bgr', mat[5:25, 10:40].reshape(-1, 3).astype(np.float64))
+    _assert_stats(stats, 'hsv', hsv[5:25, 10:40].reshape(-1, 3).astype(np.float64))
+
+
+def test_rect_extremes_use_block_tables_and_border_strips():
+    mat = np.random.default_rng(2).integers(0, 256, (150, 170, 3), dtype=np.uint8)
+    statistics = RegionStatistics(mat)
+
+    for x, y, width, height in [(3, 5, 140, 120), (33, 64, 64, 40), (0, 0, 170, 150),
+                                (40, 10, 20, 130)]:
+        stats = statistics.rect(x, y, width, height, include_hsv=False)
+        _assert_stats(stats, 'bgr',
+                      mat[y:y + height, x:x + width].reshape(-1, 3).astype(np.float64))
+
+
+def test_brush_stats_match_masked_computation():
+    mat = np.random.default_rng(1).integers(0, 256, (50, 50), dtype=np.uint8)
+    selection = BrushSelection(50, 50)
+    selection.add_circle(10, 10, 6)
+    selection.add_circle(14, 12, 6)
+    selection.add_circle(48, 30, 4)
+    mask = np.zeros((50, 50), np.uint8)
+    for y, x0, x1 in selection.get_spans():
+        mask[y, x0:x1] = 1
+
+    stats = RegionStatistics(mat).brush(selection)
+
+    _assert_stats(stats, ['gray'], mat[mask == 1].reshape(-1, 1).astype(np.float64))
+    assert mask[10, 4] == 1 and mask[12, 20] == 1 and mask[30, 49] == 1 and mask[0, 0] == 0
+
+
+def test_brush_stats_are_updated_from_newly_painted_pixels():
+    mat = np.random.default_rng(2).integers(0, 256, (60, 70, 3), dtype=np.uint8)
+    statistics = RegionStatistics(mat)
+    selection = BrushSelection(70, 60)
+
+    for center_x in range(10, 60, 7):
+        added_before = selection.get_added_span_count()
+        selection.add_circle(center_x, 30, 8)
+        added = selection.get_added_spans(added_before)
+        mask = selection.get_mask()
+
+        stats = statistics.brush(selection, include_hsv=False)
+
+        assert all(mask[y, x0:x1].all() for y, x0, x1 in added)
+        assert sum(x1 - x0 for _, x0, x1 in selection.get_added_spans()) == mask.sum()
+        _assert_stats(stats, ['b', 'g', 'r'], mat[mask].astype(np.float64))
+    assert not selection.get_mask().flags.writeable
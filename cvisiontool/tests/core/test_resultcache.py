@@ -0,0 +1,69 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gc
+
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.resultcache import ActionResultCache
+
+
+def test_processor_returns_cached_result_for_same_mat_and_params():
+    processor = ActionProcessor(cache=ActionResultCache())
+    mat = np.random.default_rng(0).integers(0, 256, (20, 30, 3), dtype=np.uint8)
+
+    first = processor.process(ActionFactory.create_erosion_action(cv.MORPH_RECT, 2), mat)
+    processor.process(ActionFactory.create_erosion_action(cv.MORPH_RECT, 3), mat)
+    second = processor.process(ActionFactory.create_erosion_action(cv.MORPH_RECT, 2), mat)
+
+    stats = processor.get_cache().get_stats()
+    assert second is first
+    assert not second.flags.writeable
+    assert (stats.hits, stats.misses, stats.entries) == (1, 2, 2)
+
+
+def test_cache_evicts_least_recently_used_by_bytes():
+    cache = ActionResultCache(max_bytes=250)
+    mat = np.zeros((10, 10), np.uint8)
+    actions = [ActionFactory.create_dilation_action(cv.MORPH_RECT, i) for i in range(3)]
+    for action in actions[:2]:
+        cache.put(action, mat, np.zeros(100, np.uint8))
+    cache.get(actions[0], mat)
+    cache.put(actions[2], mat, np.zeros(100, np.uint8))
+
+    assert cache.get(actions[0], mat) is not None
+    assert cache.get(actions[1], mat) is None
+    assert cache.get_stats().evictions == 1
+    assert cache.get_stats().total_bytes == 200
+
+
+def test_identity_cache_drops_entries_of_collected_mats():
+    cache = ActionResultCache()
+    mat = np.zeros((10, 10), np.uint8)
+    cache.put(ActionFactory.create_erosion_action(cv.MORPH_RECT, 1), mat, np.zeros(5, np.uint8))
+    del mat
+    gc.collect()
+    assert cache.get_stats().entries == 0
+
+
+def test_content_cache_hits_for_copy_of_mat():
+    cache = ActionResultCache(fingerprint=ActionResultCache.CONTENT)
+    mat = np.arange(100, dtype=np.uint8).reshape(10, 10)
+    action = ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)
+    cache.put(action, mat, np.zeros(5, np.uint8))
+    assert cache.get(action, mat.copy()) is not None
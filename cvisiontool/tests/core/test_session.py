@@ -0,0 +1,128 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.historymanager import HistoryManager, HistoryEntry
+from cvisiontool.core.matstore import MatStore
+from cvisiontool.core.session import save_session, load_session, DEFAULT_STORE_DIR_NAME
+
+
+class _CountingProcessor(ActionProcessor):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def process(self, action, mat_bgr):
+        self.calls += 1
+        return super().process(action, mat_bgr)
+
+
+def _create_history(count):
+    processor = ActionProcessor()
+    manager = HistoryManager(checkpoint_interval=3, action_processor=processor)
+    mat = np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    manager.add_entry(HistoryEntry(ActionFactory.create_image_loaded_action('a.png'), mat))
+    expected = [mat]
+    for i in range(count - 1):
+        action = ActionFactory.create_dilation_action(cv.MORPH_RECT, i % 2)
+        mat = processor.process(action, mat)
+        manager.add_entry(HistoryEntry(action, mat))
+        expected.append(mat)
+    return manager, expected
+
+
+def _count_objects(store_dir):
+    return sum(len(files) for _, _, files in os.walk(store_dir))
+
+
+def test_mat_store_deduplicates_by_content(tmp_path):
+    store = MatStore(str(tmp_path))
+    mat = np.arange(24, dtype=np.uint16).reshape((2, 3, 4))
+
+    key = store.put(mat)
+
+    assert store.put(mat.copy()) == key
+    assert store.put(mat + 1) != key
+    assert _count_objects(str(tmp_path)) == 2
+    restored = store.load(key)
+    assert restored.dtype == np.uint16 and np.array_equal(restored, mat)
+    with pytest.raises(ValueError):
+        store.load('../x')
+
+
+def test_session_restores_history_lazily(tmp_path):
+    manager, expected = _create_history(7)
+    session_path = str(tmp_path / 'work' / 'a.cvt')
+    os.makedirs(os.path.dirname(session_path))
+    save_session(session_path, manager)
+    save_session(str(tmp_path / 'work' / 'b.cvt'), manager)
+    store_dir = str(tmp_path / 'work' / DEFAULT_STORE_DIR_NAME)
+    object_count = _count_objects(store_dir)
+
+    shutil.move(str(tmp_path / 'work'), str(tmp_path / 'moved'))
+    processor = _CountingProcessor()
+    restored = HistoryManager(checkpoint_interval=3, action_processor=processor)
+    load_session(str(tmp_path / 'moved' / 'a.cvt'), restored)
+
+    # 1x1 dilation doesn't change the mat, equal results are stored once
+    assert object_count == len({mat.tobytes() for mat in expected}) < 7
+    assert restored.get_memory_bytes() == 0
+    assert [e.action for e in restored.get_entries()] == [e.action for e in manager.get_entries()]
+    for index, mat in enumerate(expected):
+        assert np.array_equal(restored.get_mat_bgr(restored.get_entry(index)), mat)
+    assert processor.calls == 0
+
+
+def test_restored_history_can_be_extended_and_saved_again(tmp_path):
+    manager, expected = _create_history(3)
+    save_session(str(tmp_path / 'a.cvt'), manager)
+    restored = HistoryManager(action_processor=ActionProcessor())
+    load_session(str(tmp_path / 'a.cvt'), restored)
+    action = ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)
+    mat = ActionProcessor().process(action, expected[-1])
+    restored.add_entry(HistoryEntry(action, mat))
+    other_store = MatStore(str(tmp_path / 'other'))
+
+    save_session(str(tmp_path / 'b.cvt'), restored, other_store)
+    load_session(str(tmp_path / 'b.cvt'), manager)
+
+    assert manager.get_entry_count() == 4
+    assert _count_objects(str(tmp_path / 'other')) == 3
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(3)), mat)
+    assert np.array_equal(manager.get_mat_bgr(manager.get_entry(1)), expected[1])
+
+
+def test_session_with_missing_results_keeps_current_history(tmp_path):
+    manager, _ = _create_history(4)
+    save_session(str(tmp_path / 'a.cvt'), manager)
+    current, expected = _create_history(2)
+    store_dir = str(tmp_path / DEFAULT_STORE_DIR_NAME)
+    removed = next(os.path.join(root, files[0])
+                   for root, _, files in os.walk(store_dir) if len(files) > 0)
+    os.remove(removed)
+
+    with pytest.raises(ValueError):
+        load_session(str(tmp_path / 'a.cvt'), current)
+
+    assert current.get_entry_count() == 2
+    assert np.array_equal(current.get_mat_bgr(current.get_entry(1)), expected[1])
@@ -0,0 +1,61 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import cv2.cv2 as cv
+import pytest
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.tiling import TiledActionExecutor, open_raw_image
+
+
+@pytest.mark.parametrize('actions', [
+    [ActionFactory.create_erosion_action(cv.MORPH_ELLIPSE, 3),
+     ActionFactory.create_morph_opening_action(cv.MORPH_RECT, 2),
+     ActionFactory.create_morph_gradient_action(cv.MORPH_CROSS, 1)],
+    [ActionFactory.create_morph_closing_action(cv.MORPH_RECT, 4),
+     ActionFactory.create_in_range_action('hsv', [0, 50, 50], [90, 255, 255]),
+     ActionFactory.create_dilation_action(cv.MORPH_RECT, 2)],
+])
+def test_tiled_result_is_equal_to_whole_image_result(tmp_path, actions):
+    mat = np.random.default_rng(3).integers(0, 256, (70, 95, 3), dtype=np.uint8)
+    raw_path = str(tmp_path / 'source.raw')
+    mat.tofile(raw_path)
+    expected = mat
+    processor = ActionProcessor()
+    for action in actions:
+        expected = processor.process(action, expected)
+
+    actual = TiledActionExecutor(tile_size=16).process(
+        actions, open_raw_image(raw_path, mat.shape), str(tmp_path / 'result.npy'))
+
+    assert np.array_equal(np.load(str(tmp_path / 'result.npy')), expected)
+    assert np.array_equal(actual, expected)
+
+
+def test_tiled_executor_rejects_non_local_actions(tmp_path):
+    action = ActionFactory.create_hough_circle_action(cv.HOUGH_GRADIENT, 1, 10, 100, 30, 0, 0)
+    with pytest.raises(ValueError):
+        TiledActionExecutor().process([action], np.zeros((4, 4), np.uint8),
+                                      str(tmp_path / 'result.npy'))
+
+
+@pytest.mark.parametrize('shape', [(0, 8, 3), (8, 0, 3)])
+def test_tiled_executor_rejects_empty_sources(tmp_path, shape):
+    action = ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)
+    with pytest.raises(ValueError):
+        TiledActionExecutor().process([action], np.zeros(shape, np.uint8),
+                                      str(tmp_path / 'result.npy'))
@@ -0,0 +1,77 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+
+import numpy as np
+import pytest
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.historymanager import HistoryManager, HistoryEntry
+from cvisiontool.core.tracing import Tracer, LatencyHistogram, get_tracer, set_tracer
+
+
+@pytest.fixture
+def tracer():
+    previous = get_tracer()
+    tracer = Tracer(enabled=True)
+    set_tracer(tracer)
+    yield tracer
+    set_tracer(previous)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+
+    with tracer.span('process', 'action', mat=np.zeros((2, 2))):
+        pass
+
+    assert tracer.get_spans() == []
+
+
+def test_action_spans_feed_histogram_and_chrome_trace(tracer, tmp_path):
+    histogram = LatencyHistogram(window=2)
+    tracer.add_listener(histogram)
+    mat = np.zeros((20, 30, 3), np.uint8)
+    processor = ActionProcessor()
+    history_manager = HistoryManager(action_processor=processor)
+    action = ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)
+
+    for _ in range(3):
+        history_manager.add_entry(HistoryEntry(action, processor.process(action, mat)))
+    path = str(tmp_path / 'trace.json')
+    tracer.export_chrome_trace(path)
+
+    spans = tracer.get_spans()
+    assert [span.name for span in spans] == ['process', 'add_entry'] * 3
+    assert spans[0].args['shape'] == [20, 30, 3]
+    assert spans[0].args['dtype'] == 'uint8'
+    assert spans[0].args['params'] == action.params
+    assert histogram.get_summary()['erosion']['count'] == 2
+    assert sum(histogram.get_buckets('erosion')) == 2
+    with open(path) as trace_file:
+        events = json.load(trace_file)['traceEvents']
+    assert len(events) == 6
+    assert events[0]['ph'] == 'X' and events[0]['cat'] == 'action'
+
+
+def test_span_records_error(tracer):
+    with pytest.raises(ValueError):
+        with tracer.span('process', 'action'):
+            raise ValueError('broken')
+
+    assert 'broken' in tracer.get_spans()[0].args['error']
@@ -0,0 +1,83 @@
+#   cvisiontool - the software for exploring Computer Vision
+#   Copyright (C) 2020 pendyurinandrey
+#  #
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#  #
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#  #
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import cv2.cv2 as cv
+
+from cvisiontool.core.actionproc import ActionProcessor
+from cvisiontool.core.actions import ActionFactory
+from cvisiontool.core.bufferpool import BufferPool
+from cvisiontool.core.video import VideoPipeline
+
+
+def _write_video(path, frame_count):
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*'MJPG'), 10, (32, 24))
+    for i in range(frame_count):
+        writer.write(np.full((24, 32, 3), i * 20, dtype=np.uint8))
+    writer.release()
+
+
+def _read_frames(path):
+    capture = cv.VideoCapture(path)
+    frames = []
+    while True:
+        is_read, frame = capture.read()
+        if not is_read:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def test_stream_yields_processed_frames_in_order(tmp_path):
+    input_path = str(tmp_path / 'input.avi')
+    _write_video(input_path, 12)
+    action = ActionFactory.create_erosion_action(cv.MORPH_RECT, 1)
+    expected = [ActionProcessor().process(action, frame) for frame in _read_frames(input_path)]
+
+    actual = list(VideoPipeline([action], queue_size=2).stream(input_path))
+
+    assert len(actual) == 12
+    assert all(np.array_equal(a, e) for a, e in zip(actual, expected))
+
+
+def test_process_video_encodes_every_frame(tmp_path):
+    input_path, output_path = str(tmp_path / 'input.avi'), str(tmp_path / 'output.avi')
+    _write_video(input_path, 7)
+    pipeline = VideoPipeline([ActionFactory.create_in_range_action('hsv', [0, 0, 0],
+                                                                   [179, 255, 100])],
+                             queue_size=2, fourcc='MJPG')
+
+    stats = pipeline.process_video(input_path, output_path)
+
+    assert (stats.frames_decoded, stats.frames_processed, stats.frames_encoded) == (7, 7, 7)
+    assert stats.max_decode_queue_depth <= 2
+    assert len(_read_frames(output_path)) == 7
+
+
+def test_process_video_recycles_frame_buffers(tmp_path):
+    input_path, output_path = str(tmp_path / 'input.avi'), str(tmp_path / 'output.avi')
+    _write_video(input_path, 40)
+    pool = BufferPool(max_free_buffers_per_key=16)
+    pipeline = VideoPipeline([ActionFactory.create_erosion_action(cv.MORPH_RECT, 1),
+                              ActionFactory.create_dilation_action(cv.MORPH_RECT, 1)],
+                             queue_size=2, fourcc='MJPG', buffer_pool=pool)
+
+    stats = pipeline.process_video(input_path, output_path)
+
+    assert stats.frames_encoded == 40
+    # Bounded by frames held by queues and stages, not by the frame count
+    assert pool.get_allocation_count() <= 12
+    assert pool.get_leased_count() == 0